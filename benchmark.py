@@ -0,0 +1,387 @@
+"""
+Benchmarks reproduzíveis do extrator
+
+Subcomandos:
+    engines  Compara os motores 'cursor' e 'copy' na query.sql, no banco do .env
+    suite    Gera dados sintéticos no formato da query.sql (10k/100k/1M linhas)
+             e mede busca, montagem do DataFrame, exportação XLSX e formatação
+             separadamente, gravando o resultado em JSON
+
+Exemplos:
+    python benchmark.py engines --repeat 5
+    python benchmark.py suite --output bench_atual.json
+    python benchmark.py suite --postgres --compare bench_base.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import metrics
+from database import DatabaseConnection
+from export_excel import ExcelExporter
+from query_params import query_params
+from config import SQL_FILE
+
+ENGINES = ('cursor', 'copy')
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+
+# Acima disso o caminho antigo (to_excel + _format_excel) leva minutos e GBs
+DEFAULT_LEGACY_MAX_ROWS = 100_000
+
+SEED = 20240101
+
+LOCATIONS = (
+    'CD Principal', 'Depósito Norte', 'Expedição', 'Loja Centro', 'Loja Sul', 'Showroom',
+)
+
+BENCH_TABLE = 'bench_oferta_relampago'
+
+
+def time_engine(db: DatabaseConnection, query: str, engine: str, repeat: int,
+                params: dict = None, prepared: bool = False) -> list:
+    """
+    Mede o tempo de execução de um motor de busca
+    
+    Args:
+        db: Conexão aberta com o banco
+        query: Query SQL a ser executada
+        engine: Nome do motor ('cursor' ou 'copy')
+        repeat: Quantidade de execuções
+        params: Parâmetros nomeados da query
+        prepared: Se True, usa statement preparado (motor 'cursor')
+    
+    Returns:
+        Lista com o tempo (segundos) de cada execução
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = db.execute_query(query, engine=engine, params=params, prepared=prepared)
+        timings.append(time.perf_counter() - start)
+        if df is None:
+            raise RuntimeError(f"Motor '{engine}' falhou ao executar a query")
+    return timings
+
+
+def run_engines(args):
+    """Compara os motores de busca na query.sql do banco configurado"""
+    with open(args.sql, 'r', encoding='utf-8') as f:
+        query = f.read()
+    params = query_params()
+    
+    with DatabaseConnection() as db:
+        if not db.connection:
+            sys.exit(1)
+        
+        # Aquece cache do servidor antes de medir
+        db.execute_query(query, params=params)
+        
+        results = {engine: time_engine(db, query, engine, args.repeat, params) for engine in ENGINES}
+        # Mesma conexão: a partir da segunda execução o plano já está pronto
+        results['prepared'] = time_engine(db, query, 'cursor', args.repeat, params, prepared=True)
+    
+    print()
+    print("=" * 60)
+    print(f"{'Motor':<10}{'Melhor (s)':>15}{'Média (s)':>15}")
+    for engine, timings in results.items():
+        print(f"{engine:<10}{min(timings):>15.3f}{sum(timings) / len(timings):>15.3f}")
+    speedup = min(results['cursor']) / min(results['copy'])
+    print(f"Aceleração do COPY: {speedup:.2f}x")
+    print("=" * 60)
+
+
+def synthetic_data(rows: int, seed: int = SEED) -> pd.DataFrame:
+    """
+    Gera dados sintéticos com o mesmo esquema e ordem da query.sql
+    
+    Args:
+        rows: Quantidade de linhas
+        seed: Semente do gerador (mesma semente, mesmos dados)
+    
+    Returns:
+        DataFrame ordenado por local_estoque e material
+    """
+    rng = np.random.default_rng(seed)
+    sku_ids = rng.integers(1, 10_000_000, size=rows)
+    words = np.array(['Camiseta', 'Tênis', 'Mochila', 'Boné', 'Jaqueta', 'Meia', 'Relógio', 'Óculos'])
+    
+    df = pd.DataFrame({
+        'local_estoque': rng.choice(np.array(LOCATIONS), size=rows),
+        'sku': pd.Series(sku_ids).map('SKU{:07d}'.format),
+        'material': (
+            pd.Series(rng.choice(words, size=rows))
+            + ' Modelo ' + pd.Series(rng.integers(1, 5000, size=rows)).astype(str)
+            + ' Tam. ' + pd.Series(rng.choice(np.array(['P', 'M', 'G', 'GG']), size=rows))
+        ),
+        'qtde': np.round(rng.gamma(2.0, 15.0, size=rows), 3),
+        'custo': np.round(rng.uniform(5, 500, size=rows), 2),
+        'preco_de': np.round(rng.uniform(20, 1500, size=rows), 4),
+        'preco_por': np.round(rng.uniform(10, 1200, size=rows), 2),
+    })
+    return df.sort_values(['local_estoque', 'material'], kind='mergesort', ignore_index=True)
+
+
+class _StandInCursor:
+    """Cursor nomeado simulado: entrega as linhas do DataFrame como tuplas"""
+    
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._position = 0
+        self.itersize = 2000
+        self.description = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+    
+    def execute(self, query, params=None):
+        self.description = [(name,) for name in self._df.columns]
+    
+    def fetchmany(self, size):
+        chunk = self._df.iloc[self._position:self._position + size]
+        self._position += len(chunk)
+        # Converte como o psycopg2 faria: uma tupla de objetos Python por linha
+        return list(chunk.astype(object).itertuples(index=False, name=None))
+
+
+class StandInConnection:
+    """Conexão em memória que imita o necessário de uma conexão psycopg2"""
+    
+    closed = 0
+    encoding = 'UTF8'
+    
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+    
+    def cursor(self, name=None):
+        return _StandInCursor(self._df)
+    
+    def rollback(self):
+        pass
+
+
+def _measure(case: str, rows: int, func) -> dict:
+    """
+    Executa uma etapa medindo o tempo total e as etapas internas
+    
+    Args:
+        case: Nome do caso medido
+        rows: Quantidade de linhas do cenário
+        func: Função sem argumentos a ser medida
+    
+    Returns:
+        Dicionário com o resultado do caso
+    """
+    with metrics.RunMetrics(case) as run:
+        func()
+    record = run.record()
+    print(f"   {case:<22}{record['total_seconds']:>10.3f} s")
+    return {
+        'case': case,
+        'rows': rows,
+        'seconds': record['total_seconds'],
+        'stages': record['stages'],
+        'bytes_written': record['bytes_written'],
+    }
+
+
+def _load_into_postgres(db: DatabaseConnection, df: pd.DataFrame) -> str:
+    """
+    Carrega os dados sintéticos em uma tabela temporária do PostgreSQL
+    
+    A tabela é TEMP: existe só nesta sessão e some quando a conexão é
+    fechada, mesmo se uma medição falhar; nada fica gravado no banco.
+    
+    Args:
+        db: Conexão aberta com o banco
+        df: Dados sintéticos
+    
+    Returns:
+        Query que lê a tabela com a mesma ordem da query.sql
+    """
+    with db.connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE {BENCH_TABLE} (
+                local_estoque text, sku text, material text,
+                qtde numeric, custo numeric, preco_de numeric, preco_por numeric
+            )
+        """)
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {BENCH_TABLE} FROM STDIN WITH (FORMAT csv)", buffer)
+    # Cada leitura termina em rollback: o commit mantém a tabela na sessão
+    # (ON COMMIT PRESERVE ROWS), sem criar nada fora dela
+    db.connection.commit()
+    return f"SELECT * FROM {BENCH_TABLE} ORDER BY local_estoque ASC, material ASC"
+
+
+def run_scale(rows: int, postgres: bool, legacy_max_rows: int) -> list:
+    """
+    Mede todas as etapas para uma escala de linhas
+    
+    Roda em um processo separado por escala, para que o pico de memória
+    de uma escala não contamine a seguinte.
+    
+    Args:
+        rows: Quantidade de linhas
+        postgres: Se True, mede a busca contra o PostgreSQL do .env
+        legacy_max_rows: Maior escala em que o caminho antigo é medido
+    
+    Returns:
+        Lista de resultados (um por caso)
+    """
+    print(f"\n📏 {rows:,} linhas".replace(',', '.'))
+    df = synthetic_data(rows)
+    results = []
+    
+    # Busca + montagem do DataFrame (execute_query)
+    if postgres:
+        with DatabaseConnection() as db:
+            if not db.connection:
+                raise RuntimeError("Não foi possível conectar ao PostgreSQL do .env")
+            query = _load_into_postgres(db, df)
+            for engine in ENGINES:
+                results.append(_measure(
+                    f"fetch_{engine}", rows, lambda: db.execute_query(query, engine=engine)
+                ))
+    else:
+        db = DatabaseConnection()
+        db.connection = StandInConnection(df)
+        results.append(_measure(
+            "fetch_cursor_standin", rows, lambda: db.execute_query("SELECT * FROM oferta")
+        ))
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'bench.xlsx')
+        
+        # Exportação em passada única (padrão)
+        results.append(_measure(
+            "export_streaming", rows, lambda: ExcelExporter.export_data(df, filename, streaming=True)
+        ))
+        
+        # Caminho antigo: to_excel seguido de _format_excel
+        if rows <= legacy_max_rows:
+            results.append(_measure(
+                "export_legacy", rows, lambda: ExcelExporter.export_data(df, filename, streaming=False)
+            ))
+    
+    peak = round(metrics.peak_rss_bytes() / (1024 * 1024), 1)
+    for result in results:
+        result['peak_rss_mb_scale'] = peak
+    return results
+
+
+def _git_revision() -> str:
+    """Commit atual do repositório, se disponível"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return 'desconhecido'
+
+
+def compare(current: dict, baseline_file: str):
+    """
+    Mostra a razão entre os tempos atuais e os de um resultado anterior
+    
+    Args:
+        current: Resultado desta execução
+        baseline_file: Arquivo JSON de um resultado anterior
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    previous = {(r['case'], r['rows']): r['seconds'] for r in baseline['results']}
+    print()
+    print("=" * 60)
+    print(f"Comparação com {baseline_file} ({baseline['meta'].get('revision')})")
+    print(f"{'Caso':<22}{'Linhas':>10}{'Base (s)':>10}{'Atual (s)':>10}{'Razão':>8}")
+    for result in current['results']:
+        key = (result['case'], result['rows'])
+        if key in previous:
+            ratio = previous[key] / result['seconds'] if result['seconds'] else float('inf')
+            print(f"{key[0]:<22}{key[1]:>10}{previous[key]:>10.3f}{result['seconds']:>10.3f}{ratio:>7.2f}x")
+    print("=" * 60)
+
+
+def run_suite(args):
+    """Executa o benchmark sintético em todas as escalas"""
+    import openpyxl
+    
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for rows in args.rows:
+        with context.Pool(1) as pool:
+            results.extend(pool.apply(run_scale, (rows, args.postgres, args.legacy_max_rows)))
+    
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'openpyxl': openpyxl.__version__,
+            'platform': platform.platform(),
+            'fetch_source': 'postgres' if args.postgres else 'standin',
+            'seed': SEED,
+        },
+        'results': results,
+    }
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados gravados em {args.output}")
+    
+    if args.compare:
+        compare(output, args.compare)
+
+
+def main():
+    """Função principal do benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmarks do extrator Oferta Relâmpago")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    engines = subparsers.add_parser('engines', help="Compara os motores de busca na query.sql")
+    engines.add_argument('--repeat', type=int, default=5, help="Execuções por motor (padrão: 5)")
+    engines.add_argument('--sql', default=SQL_FILE, help="Arquivo SQL (padrão: query.sql)")
+    engines.set_defaults(func=run_engines)
+    
+    suite = subparsers.add_parser('suite', help="Benchmark com dados sintéticos")
+    suite.add_argument(
+        '--rows', type=int, nargs='+', default=list(DEFAULT_SCALES),
+        help="Escalas em linhas (padrão: 10000 100000 1000000)"
+    )
+    suite.add_argument(
+        '--postgres', action='store_true',
+        help="Mede a busca contra o PostgreSQL do .env (tabela temporária) em vez do simulador"
+    )
+    suite.add_argument(
+        '--legacy-max-rows', type=int, default=DEFAULT_LEGACY_MAX_ROWS,
+        help="Maior escala em que o caminho antigo de exportação é medido"
+    )
+    suite.add_argument('--output', default='bench_results.json', help="Arquivo JSON de saída")
+    suite.add_argument('--compare', help="Arquivo JSON de um resultado anterior para comparação")
+    suite.set_defaults(func=run_suite)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 # Build Script - Gera executável do Oferta Relâmpago
 # Execute este script para criar o executável standalone
+#   .\build_exe.ps1           -> arquivo único (dist\OfertaRelampago.exe)
+#   .\build_exe.ps1 -OneDir   -> pasta (dist\OfertaRelampago\), abre mais rápido:
+#                               não extrai as bibliotecas a cada execução
+
+param(
+    [switch]$OneDir
+)
 
 Write-Host "🚀 Iniciando build do executável..." -ForegroundColor Cyan
 Write-Host ""
@@ -29,22 +36,42 @@ Write-Host "🔨 Criando executável..." -ForegroundColor Cyan
 Write-Host "   Este processo pode levar alguns minutos..." -ForegroundColor Gray
 Write-Host ""
 
+# Módulos que o pandas/openpyxl só carregam sob demanda e que o extrator não usa:
+# ficam fora do executável (menos arquivos para extrair e carregar na abertura)
+$excludes = @(
+    "matplotlib", "scipy", "IPython", "jinja2", "sqlalchemy", "pytest",
+    "numexpr", "bottleneck", "tables", "xlrd", "xlsxwriter", "odf", "pyxlsb",
+    "lxml", "bs4", "html5lib", "fsspec", "s3fs", "gcsfs", "pandas_gbq",
+    "pandas.tests", "numpy.tests", "openpyxl.tests", "tkinter.test"
+)
+$excludeArgs = $excludes | ForEach-Object { "--exclude-module", $_ }
+$bundleMode = if ($OneDir) { "--onedir" } else { "--onefile" }
+
+# --noupx: bibliotecas comprimidas com UPX são descomprimidas a cada abertura
 pyinstaller --clean `
-    --onefile `
+    $bundleMode `
     --windowed `
+    --noupx `
     --name "OfertaRelampago" `
     --icon NONE `
     --add-data ".env.example;." `
     --add-data "query.sql;." `
+    --add-data "query_matview.sql;." `
     --hidden-import "openpyxl" `
     --hidden-import "psycopg2" `
+    @excludeArgs `
     gui.py
 
 if ($LASTEXITCODE -eq 0) {
     Write-Host ""
     Write-Host "✅ EXECUTÁVEL CRIADO COM SUCESSO!" -ForegroundColor Green
     Write-Host ""
-    Write-Host "📁 Localização: dist\OfertaRelampago.exe" -ForegroundColor Cyan
+    if ($OneDir) {
+        Write-Host "📁 Localização: dist\OfertaRelampago\OfertaRelampago.exe" -ForegroundColor Cyan
+    } else {
+        Write-Host "📁 Localização: dist\OfertaRelampago.exe" -ForegroundColor Cyan
+    }
+    Write-Host "⏱️ Tempo de abertura: OfertaRelampago.exe --startup-time (grava no histórico de métricas)" -ForegroundColor Gray
     Write-Host ""
     Write-Host "📝 Próximos passos:" -ForegroundColor Yellow
     Write-Host "   1. Crie uma pasta 'OfertaRelampago' para distribuir" -ForegroundColor White
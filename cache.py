@@ -0,0 +1,203 @@
+"""
+Cache local dos resultados da query em formato colunar (Parquet)
+A chave é o hash do texto SQL, dos parâmetros e do banco de destino
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Optional, Tuple
+import pandas as pd
+import metrics
+from config import DB_CONFIG, CACHE_ENABLED, CACHE_DIR, CACHE_TTL_SECONDS, CACHE_MAX_MB
+
+try:
+    import pyarrow  # noqa: F401  (motor Parquet do pandas)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+class ResultCache:
+    """Guarda resultados da query em disco com validade (TTL) e limite de tamanho"""
+    
+    EXTENSION = '.parquet'
+    
+    def __init__(self, directory: str = None, ttl: int = None, max_mb: int = None):
+        """
+        Args:
+            directory: Pasta do cache (padrão: CACHE_DIR)
+            ttl: Validade em segundos (padrão: CACHE_TTL_SECONDS)
+            max_mb: Tamanho máximo do cache em MB (padrão: CACHE_MAX_MB)
+        """
+        self.directory = directory or CACHE_DIR
+        self.ttl = CACHE_TTL_SECONDS if ttl is None else ttl
+        self.max_bytes = (CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+        self.enabled = CACHE_ENABLED and PARQUET_AVAILABLE
+    
+    @staticmethod
+    def fingerprint(query: str, params: dict = None) -> str:
+        """
+        Calcula a chave do cache para uma query
+        
+        Args:
+            query: Texto SQL
+            params: Parâmetros da query, se houver
+            
+        Returns:
+            Hash SHA-256 em hexadecimal
+        """
+        target = {key: DB_CONFIG.get(key) for key in ('host', 'port', 'database', 'user')}
+        payload = json.dumps(
+            {'sql': query, 'params': params or {}, 'target': target},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.EXTENSION)
+    
+    def is_fresh(self, key: str) -> bool:
+        """
+        Verifica se há uma entrada válida no cache, sem lê-la
+        
+        Args:
+            key: Chave calculada por fingerprint()
+            
+        Returns:
+            bool: True se a entrada existe e está dentro do TTL
+        """
+        if not self.enabled:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self._path(key)) <= self.ttl
+        except OSError:
+            return False
+    
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, float]]:
+        """
+        Busca um resultado válido no cache
+        
+        Args:
+            key: Chave calculada por fingerprint()
+            
+        Returns:
+            Tupla (DataFrame, idade em segundos) ou None se ausente/expirado
+        """
+        if not self.enabled:
+            return None
+        
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return None
+        
+        if age > self.ttl:
+            self.invalidate(key)
+            return None
+        
+        try:
+            with metrics.stage('cache_read'):
+                return pd.read_parquet(path), age
+        except Exception as e:
+            print(f"⚠️ Cache corrompido, descartando: {e}")
+            self.invalidate(key)
+            return None
+    
+    def put(self, key: str, df: pd.DataFrame):
+        """
+        Grava um resultado no cache (escrita atômica) e aplica o limite de tamanho
+        
+        Args:
+            key: Chave calculada por fingerprint()
+            df: DataFrame a ser guardado
+        """
+        if not self.enabled:
+            return
+        
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with metrics.stage('cache_write'):
+                df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+            self._evict()
+        except Exception as e:
+            print(f"⚠️ Não foi possível gravar o cache: {e}")
+    
+    def invalidate(self, key: str = None):
+        """
+        Remove uma entrada do cache, ou todas se nenhuma chave for informada
+        
+        Args:
+            key: Chave a remover (None limpa o cache inteiro)
+        """
+        paths = [self._path(key)] if key else [entry[0] for entry in self._entries()]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _entries(self) -> list:
+        """Lista (caminho, tamanho, data de modificação) das entradas do cache"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith(self.EXTENSION):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+    
+    def _evict(self):
+        """Remove as entradas mais antigas até o cache caber em max_bytes"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(entry[1] for entry in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    
+    def get_or_fetch(self, query: str, fetch: Callable[[], Optional[pd.DataFrame]],
+                     force_refresh: bool = False,
+                     params: dict = None) -> Tuple[Optional[pd.DataFrame], Optional[float]]:
+        """
+        Devolve o resultado do cache ou executa a busca e guarda o resultado
+        
+        Args:
+            query: Texto SQL
+            fetch: Função que executa a query e retorna o DataFrame (ou None)
+            force_refresh: Se True, ignora o cache e busca no banco
+            params: Parâmetros da query, se houver
+            
+        Returns:
+            Tupla (DataFrame, idade do cache em segundos). A idade é None
+            quando os dados vieram do banco.
+        """
+        key = self.fingerprint(query, params)
+        
+        if force_refresh:
+            self.invalidate(key)
+        else:
+            hit = self.get(key)
+            if hit is not None:
+                return hit
+        
+        df = fetch()
+        if df is not None and not df.empty:
+            self.put(key, df)
+        return df, None
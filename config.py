@@ -16,8 +16,130 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD')
 }
 
+# Perfis de conexão nomeados (um banco por empresa/filial), consultados juntos com --profiles
+# DB_PROFILES=matriz,filial_sul; cada perfil lê DB_<PERFIL>_HOST, _PORT, _NAME, _USER e
+# _PASSWORD, usando os valores de DB_* acima para o que não for definido
+_DB_ENV_KEYS = {'host': 'HOST', 'port': 'PORT', 'database': 'NAME', 'user': 'USER', 'password': 'PASSWORD'}
+DB_PROFILES = {
+    name: {key: os.getenv(f'DB_{name.upper()}_{env}', DB_CONFIG[key]) for key, env in _DB_ENV_KEYS.items()}
+    for name in (value.strip() for value in os.getenv('DB_PROFILES', '').split(','))
+    if name
+}
+# Tempo limite de cada perfil (conexão, query e leitura), em segundos; DB_<PERFIL>_TIMEOUT sobrepõe
+PROFILE_TIMEOUT_SECONDS = float(os.getenv('PROFILE_TIMEOUT_SECONDS', '300'))
+DB_PROFILE_TIMEOUTS = {
+    name: float(os.getenv(f'DB_{name.upper()}_TIMEOUT', PROFILE_TIMEOUT_SECONDS)) for name in DB_PROFILES
+}
+# Bancos consultados ao mesmo tempo (0 = todos os perfis)
+PROFILE_WORKERS = int(os.getenv('PROFILE_WORKERS', '0'))
+
+# Linhas buscadas por lote no cursor server-side
+FETCH_SIZE = int(os.getenv('FETCH_SIZE', '5000'))
+
+# Motor de busca dos resultados: 'cursor' (cursor server-side) ou 'copy' (COPY TO STDOUT)
+FETCH_ENGINE = os.getenv('FETCH_ENGINE', 'cursor')
+
+# Tempo limite de cada query no servidor, em segundos (0 = sem limite)
+STATEMENT_TIMEOUT_SECONDS = float(os.getenv('STATEMENT_TIMEOUT_SECONDS', '0'))
+
+# Extração paralela por local de armazenagem
+PARALLEL_EXTRACTION = os.getenv('PARALLEL_EXTRACTION', 'false').lower() in ('1', 'true', 'sim')
+PARALLEL_WORKERS = int(os.getenv('PARALLEL_WORKERS', '3'))
+# 'per_location' (uma partição por local) ou 'round_robin' (PARALLEL_WORKERS partições)
+PARTITION_STRATEGY = os.getenv('PARTITION_STRATEGY', 'per_location')
+
+# Pipeline com busca e exportação sobrepostas
+PIPELINE_ENABLED = os.getenv('PIPELINE_ENABLED', 'false').lower() in ('1', 'true', 'sim')
+# Máximo de lotes aguardando exportação na fila
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
+
+# Orçamento de memória para os dados buscados, em MB (0 = sem limite); acima dele os
+# lotes vão para um arquivo temporário e a exportação lê desse arquivo
+MEMORY_BUDGET_MB = float(os.getenv('MEMORY_BUDGET_MB', '0'))
+# Pasta dos arquivos temporários ('' = pasta temporária do sistema)
+SPILL_DIR = os.getenv('SPILL_DIR', '')
+
+# Pré-carregamento dos dados ao abrir a interface gráfica
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'false').lower() in ('1', 'true', 'sim')
+# Segundos entre atualizações em segundo plano (0 = só ao abrir)
+PREFETCH_INTERVAL_SECONDS = float(os.getenv('PREFETCH_INTERVAL_SECONDS', '300'))
+# Idade máxima dos dados pré-carregados no clique; acima dela, busca de novo
+# (padrão: CACHE_TTL_SECONDS; 0 = sem limite)
+PREFETCH_MAX_AGE_SECONDS = float(os.getenv('PREFETCH_MAX_AGE_SECONDS', os.getenv('CACHE_TTL_SECONDS', '300')))
+
+# Pool de conexões persistente da interface gráfica
+POOL_MAX_CONNECTIONS = int(os.getenv('POOL_MAX_CONNECTIONS', '2'))
+# Conexões ociosas há mais de N segundos são testadas (SELECT 1) antes do uso
+POOL_PING_AFTER = float(os.getenv('POOL_PING_AFTER', '10'))
+# Keepalive TCP: segundos ociosos até o primeiro pacote de keepalive
+KEEPALIVE_IDLE = int(os.getenv('KEEPALIVE_IDLE', '30'))
+
+# Cache local dos resultados (Parquet)
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'sim')
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_MB = int(os.getenv('CACHE_MAX_MB', '200'))
+
+# Exportação separada por local de armazenagem: '' (desligada), 'sheets' ou 'files'
+SPLIT_MODE = os.getenv('SPLIT_MODE', '').lower()
+# Processos que geram os arquivos por local (0 = número de núcleos)
+SPLIT_WORKERS = int(os.getenv('SPLIT_WORKERS', '0'))
+
+# Extração agendada (daemon): intervalo entre execuções e estado da última publicação
+DAEMON_INTERVAL_SECONDS = float(os.getenv('DAEMON_INTERVAL_SECONDS', '900'))
+DAEMON_STATE_FILE = os.getenv('DAEMON_STATE_FILE', 'daemon_state.json')
+
+# Servidor HTTP local (--serve): endereço e validade da planilha gerada em memória
+SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8080'))
+# Segundos em que a planilha é servida sem consultar o banco de novo
+SERVER_MAX_AGE_SECONDS = float(os.getenv('SERVER_MAX_AGE_SECONDS', '300'))
+# Idade mínima da planilha para que ?refresh=1 consulte o banco de novo
+SERVER_MIN_REFRESH_SECONDS = float(os.getenv('SERVER_MIN_REFRESH_SECONDS', '30'))
+
+# Relatório de alterações entre extrações consecutivas (snapshots em Parquet)
+DIFF_ENABLED = os.getenv('DIFF_ENABLED', 'false').lower() in ('1', 'true', 'sim')
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '.snapshots')
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '5'))
+
+# Histórico de métricas por execução (JSON Lines, ao lado do last_extraction.json)
+METRICS_HISTORY_FILE = os.getenv('METRICS_HISTORY_FILE', 'extraction_history.jsonl')
+METRICS_HISTORY_MAX = int(os.getenv('METRICS_HISTORY_MAX', '500'))
+
+# Parâmetros da query.sql (podem ser trocados na linha de comando ou na interface)
+QUERY_LOCATIONS = os.getenv('QUERY_LOCATIONS', '34, 67, 397, 265, 506, 507')
+QUERY_PRODUTO = os.getenv('QUERY_PRODUTO', 'true')
+QUERY_ATIVO = os.getenv('QUERY_ATIVO', 'true')
+# Statement preparado no servidor em conexões reaproveitadas (interface e daemon)
+PREPARED_STATEMENTS = os.getenv('PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'sim')
+
+# Visão materializada do agregado (python matview.py): o extrator lê dela em vez de agregar a cada execução
+MATVIEW_ENABLED = os.getenv('MATVIEW_ENABLED', 'false').lower() in ('1', 'true', 'sim')
+# Idade a partir da qual o extrator avisa que a visão está desatualizada
+MATVIEW_MAX_AGE_SECONDS = float(os.getenv('MATVIEW_MAX_AGE_SECONDS', '3600'))
+MATVIEW_NAME = 'mv_oferta_relampago'
+# Definição da visão e query de leitura (mesmos parâmetros da query.sql)
+MATVIEW_SQL_FILE = 'matview.sql'
+MATVIEW_QUERY_FILE = 'query_matview.sql'
+
 # Nome do arquivo de saída
 OUTPUT_FILENAME = 'Oferta_Relampago.xlsx'
 
 # Caminho para o arquivo SQL
-SQL_FILE = 'query.sql'
+BASE_SQL_FILE = 'query.sql'
+SQL_FILE = MATVIEW_QUERY_FILE if MATVIEW_ENABLED else BASE_SQL_FILE
+
+# Exportação Excel em passada única (write-only, memória constante)
+EXCEL_STREAMING = os.getenv('EXCEL_STREAMING', 'true').lower() in ('1', 'true', 'sim')
+# Limite de linhas por aba do Excel (incluindo o cabeçalho)
+EXCEL_MAX_ROWS = int(os.getenv('EXCEL_MAX_ROWS', '1048576'))
+# Acima do limite: 'sheets' (abas numeradas) ou 'files' (arquivos numerados)
+EXCEL_SHARD_MODE = os.getenv('EXCEL_SHARD_MODE', 'sheets').lower()
+
+# Formato de exportação padrão: 'xlsx' (formatado), 'csv', 'parquet' ou 'feather'
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'xlsx').lower()
+# Separador e codificação do CSV (padrão compatível com o Excel em português)
+CSV_SEPARATOR = os.getenv('CSV_SEPARATOR', ';')
+CSV_ENCODING = os.getenv('CSV_ENCODING', 'utf-8-sig')
+# Separador decimal do CSV (padrão: vírgula com ';', como o Excel em português espera)
+CSV_DECIMAL = os.getenv('CSV_DECIMAL', ',' if CSV_SEPARATOR == ';' else '.')
@@ -0,0 +1,202 @@
+"""
+Extração agendada sem interface (daemon)
+Executa a query em intervalos regulares sobre uma conexão mantida aberta,
+regenera o arquivo só quando o conteúdo muda e o publica de forma atômica
+"""
+import json
+import os
+import signal
+import threading
+from datetime import datetime
+import pandas as pd
+import psycopg2
+import metrics
+from config import SQL_FILE, DAEMON_INTERVAL_SECONDS, DAEMON_STATE_FILE, PREPARED_STATEMENTS
+from database import DatabaseConnection
+from exporters import (
+    get_exporter, format_from_path, output_filename, temp_filename, replace_output, remove_output
+)
+from matview import report_staleness
+from pool import ConnectionPool
+from query_params import query_params
+from schema import content_hash
+
+
+def publish(df: pd.DataFrame, output: str) -> bool:
+    """
+    Gera o arquivo em um nome temporário e o move para o destino
+    
+    Quem lê o arquivo publicado vê a versão anterior ou a nova, nunca um
+    arquivo pela metade (ver replace_output).
+    
+    Args:
+        df: DataFrame com os dados
+        output: Caminho do arquivo publicado
+    
+    Returns:
+        bool: True se o arquivo foi publicado
+    """
+    temp = temp_filename(output)
+    exporter = get_exporter(format_from_path(output))
+    
+    try:
+        exported = exporter.export_data(df, temp)
+    except BaseException:
+        remove_output(temp)
+        raise
+    if not exported:
+        remove_output(temp)
+        return False
+    
+    try:
+        with metrics.stage('publish'):
+            replace_output(temp, output)
+        return True
+    except OSError as e:
+        # No Windows, o destino aberto no Excel não pode ser substituído
+        remove_output(temp)
+        print(f"❌ Erro ao publicar {output}: {e}")
+        return False
+
+
+class ExtractionDaemon:
+    """Executa a extração periodicamente, publicando só quando os dados mudam"""
+    
+    def __init__(self, output: str = None, interval: float = None, state_file: str = None,
+                 params: dict = None):
+        """
+        Args:
+            output: Arquivo publicado (padrão: OUTPUT_FILENAME no EXPORT_FORMAT)
+            interval: Segundos entre execuções (padrão: DAEMON_INTERVAL_SECONDS)
+            state_file: Estado da última publicação (padrão: DAEMON_STATE_FILE)
+            params: Parâmetros da query (padrão: valores do config)
+        """
+        self.output = output or output_filename()
+        self.interval = DAEMON_INTERVAL_SECONDS if interval is None else interval
+        self.state_file = state_file or DAEMON_STATE_FILE
+        self.params = params or query_params()
+        # Uma conexão, mantida aberta (keepalive) e testada entre as execuções
+        self.pool = ConnectionPool(max_connections=1)
+        self.stop_event = threading.Event()
+    
+    def load_state(self) -> dict:
+        """Lê o estado da última publicação"""
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Erro ao carregar estado do daemon: {e}")
+        return {}
+    
+    def save_state(self, state: dict):
+        """Grava o estado da última publicação"""
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+        except Exception as e:
+            print(f"Erro ao salvar estado do daemon: {e}")
+    
+    def fetch(self, query: str):
+        """
+        Executa a query na conexão mantida pelo daemon
+        
+        A query é preparada no servidor na primeira execução e reaproveitada
+        nas seguintes, enquanto a conexão durar; se a conexão cair durante a
+        consulta, ela é repetida uma vez em uma conexão nova.
+        
+        Args:
+            query: String com a query SQL
+        
+        Returns:
+            DataFrame com os resultados ou None em caso de erro
+        """
+        def acquire():
+            with metrics.stage('connect'):
+                return self.pool.acquire()
+        
+        def query_once(connection):
+            report_staleness(connection)
+            return DatabaseConnection(connection).execute_query(
+                query, params=self.params, prepared=PREPARED_STATEMENTS
+            )
+        
+        # Conexão que cai no meio da query: repete uma vez em outra conexão
+        return self.pool.run(query_once, acquire=acquire)
+    
+    def run_once(self, query: str) -> bool:
+        """
+        Executa uma extração e publica o arquivo se o conteúdo mudou
+        
+        Args:
+            query: String com a query SQL
+        
+        Returns:
+            bool: True se a execução terminou sem erro (publicando ou não)
+        """
+        with metrics.RunMetrics(mode='daemon') as run:
+            try:
+                df = self.fetch(query)
+            except psycopg2.Error as e:
+                print(f"❌ Erro ao conectar ao banco de dados: {e}")
+                return False
+            except TimeoutError as e:
+                print(f"⏱️ {e}")
+                return False
+            if df is None:
+                return False
+            
+            with metrics.stage('hash'):
+                digest = content_hash(df)
+            
+            state = self.load_state()
+            unchanged = (
+                state.get('content_hash') == digest
+                and state.get('output') == os.path.abspath(self.output)
+                and os.path.exists(self.output)
+            )
+            if unchanged:
+                run.mode = 'daemon_sem_mudancas'
+                print(f"💤 Sem mudanças ({len(df)} registros); {self.output} mantido.")
+            elif df.empty:
+                print("⚠️ Nenhum dado foi retornado pela query; arquivo anterior mantido.")
+            elif publish(df, self.output):
+                self.save_state({
+                    'content_hash': digest,
+                    'output': os.path.abspath(self.output),
+                    'published_at': datetime.now().isoformat(),
+                    'rows': len(df),
+                })
+                print(f"📢 {self.output} publicado ({len(df)} registros).")
+            else:
+                return False
+        
+        for line in run.summary_lines():
+            print(line)
+        run.save()
+        return True
+    
+    def run_forever(self):
+        """Executa a extração a cada `interval` segundos até receber um sinal de parada"""
+        def stop(signum, frame):
+            print("\n🛑 Encerrando daemon...")
+            self.stop_event.set()
+        
+        signal.signal(signal.SIGINT, stop)
+        if hasattr(signal, 'SIGTERM'):
+            signal.signal(signal.SIGTERM, stop)
+        
+        print(f"🕒 Daemon iniciado: {self.output} a cada {self.interval:.0f} s")
+        try:
+            while not self.stop_event.is_set():
+                print(f"\n🔄 Extração de {datetime.now():%d/%m/%Y %H:%M:%S}")
+                try:
+                    with open(SQL_FILE, 'r', encoding='utf-8') as f:
+                        query = f.read()
+                    self.run_once(query)
+                except Exception as e:
+                    # Uma falha não derruba o daemon; tenta de novo no próximo ciclo
+                    print(f"❌ Erro na extração: {e}")
+                self.stop_event.wait(self.interval)
+        finally:
+            self.pool.close()
@@ -1,18 +1,78 @@
 """
 Módulo de conexão e consulta ao banco de dados PostgreSQL
 """
+import io
+import re
+import uuid
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import pandas as pd
-from typing import Optional
-from config import DB_CONFIG
+from typing import Iterator, Optional
+import metrics
+from config import DB_CONFIG, FETCH_SIZE, FETCH_ENGINE, STATEMENT_TIMEOUT_SECONDS
+from query_params import bind, to_prepared
+from schema import apply_schema
+
+
+# NUMERIC chega como float em vez de Decimal (evita colunas object no pandas)
+DEC2FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    'DEC2FLOAT',
+    lambda value, cursor: float(value) if value is not None else None
+)
+
+# Tipos do PostgreSQL (OID) convertidos para dtypes do pandas no modo COPY
+COPY_DTYPES = {
+    16: 'boolean',                       # bool
+    20: 'Int64', 21: 'Int64', 23: 'Int64',  # int8, int2, int4
+    700: 'float64', 701: 'float64',      # float4, float8
+    1700: 'float64',                     # numeric
+}
+
+# Marcador de NULL usado no CSV do COPY (distingue NULL de texto vazio)
+COPY_NULL = r'\N'
+
+# Um texto igual ao marcador sai entre aspas no CSV; o read_csv não distingue
+# valores com e sem aspas e o leria como NULL
+QUOTED_COPY_NULL = re.compile(re.escape(f'"{COPY_NULL}"'.encode()))
+
+
+def prepare_connection(connection):
+    """
+    Aplica as configurações de sessão usadas pelo extrator a uma conexão
+    
+    Args:
+        connection: Conexão psycopg2 (própria ou emprestada de um pool)
+    """
+    psycopg2.extensions.register_type(DEC2FLOAT, connection)
+
+
+class ExtractionCancelled(Exception):
+    """A extração foi cancelada pelo usuário"""
 
 
 class DatabaseConnection:
     """Gerencia a conexão com o banco de dados PostgreSQL"""
     
-    def __init__(self):
-        self.connection = None
+    def __init__(self, connection=None, db_config: dict = None):
+        """
+        Args:
+            connection: Conexão já aberta (ex.: de um pool). Nesse caso ela
+                não é fechada por close(), pois pertence a quem a forneceu.
+            db_config: Parâmetros de conexão usados por connect()
+                (padrão: DB_CONFIG; ex.: um perfil de DB_PROFILES)
+        """
+        self.connection = connection
+        self.db_config = db_config or DB_CONFIG
         self.cursor = None
+        self._owns_connection = connection is None
+        # Tempo limite de cada query em segundos (0 = sem limite)
+        self.statement_timeout = STATEMENT_TIMEOUT_SECONDS
+        self.cancelled = False
+        if connection is not None:
+            prepare_connection(connection)
     
     def connect(self) -> bool:
         """
@@ -21,8 +81,13 @@ class DatabaseConnection:
         Returns:
             bool: True se conectou com sucesso, False caso contrário
         """
+        if not self._owns_connection:
+            return True
+        
         try:
-            self.connection = psycopg2.connect(**DB_CONFIG)
+            with metrics.stage('connect'):
+                self.connection = psycopg2.connect(**self.db_config)
+                prepare_connection(self.connection)
             self.cursor = self.connection.cursor()
             print("✅ Conexão com banco de dados estabelecida com sucesso!")
             return True
@@ -30,22 +95,255 @@ class DatabaseConnection:
             print(f"❌ Erro ao conectar ao banco de dados: {e}")
             return False
     
-    def execute_query(self, query: str) -> Optional[pd.DataFrame]:
+    def cancel(self):
+        """
+        Cancela a query em andamento (pode ser chamado de outra thread)
+        
+        Envia ao servidor um pedido de cancelamento real: a query para de
+        rodar no banco e a leitura em curso levanta ExtractionCancelled.
+        """
+        self.cancelled = True
+        if self.connection is None or self.connection.closed:
+            return
+        try:
+            self.connection.cancel()
+        except psycopg2.Error as e:
+            print(f"⚠️ Não foi possível cancelar a query no servidor: {e}")
+    
+    def check_cancelled(self):
+        """
+        Interrompe a leitura se o cancelamento já foi pedido
+        
+        Raises:
+            ExtractionCancelled: Se cancel() foi chamado
+        """
+        if self.cancelled:
+            raise ExtractionCancelled("Extração cancelada pelo usuário")
+    
+    @contextmanager
+    def _reading(self):
+        """
+        Transação de leitura: aplica o tempo limite e traduz o cancelamento
+        
+        O SET LOCAL vale só até o rollback que encerra a leitura, então
+        conexões emprestadas de um pool não ficam com o limite alterado.
+        """
+        self.check_cancelled()
+        try:
+            if self.statement_timeout:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        "SET LOCAL statement_timeout = %s", (int(self.statement_timeout * 1000),)
+                    )
+            yield
+        except psycopg2.errors.QueryCanceled as e:
+            if self.cancelled:
+                raise ExtractionCancelled("Extração cancelada pelo usuário") from e
+            if self.statement_timeout:
+                raise TimeoutError(
+                    f"Query excedeu o tempo limite de {self.statement_timeout:g} s "
+                    f"(STATEMENT_TIMEOUT_SECONDS)"
+                ) from e
+            raise
+    
+    def prepare(self, query: str, params: dict = None) -> tuple:
+        """
+        Prepara a query no servidor (PREPARE) uma única vez por sessão
+        
+        O nome do statement é derivado do texto da query; se a conexão já o
+        tiver preparado (conexão reaproveitada do pool ou do daemon), o
+        planejamento não é refeito.
+        
+        Args:
+            query: String com a query SQL (marcadores %(nome)s)
+            params: Valores dos parâmetros
+            
+        Returns:
+            Tupla (comando EXECUTE, lista de valores)
+        """
+        name, body, names = to_prepared(query)
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+            if cursor.fetchone() is None:
+                with metrics.stage('prepare'):
+                    cursor.execute(f"PREPARE {name} AS {body}")
+            else:
+                metrics.count('prepared_reused', 1)
+        
+        arguments = f"({', '.join(['%s'] * len(names))})" if names else ""
+        return f"EXECUTE {name}{arguments}", [params[key] for key in names]
+    
+    def stream_query(self, query: str, fetch_size: int = None,
+                     as_dataframe: bool = True, params: dict = None,
+                     prepared: bool = False) -> Iterator:
+        """
+        Executa uma query com cursor nomeado (server-side) e devolve os
+        resultados em lotes, sem carregar tudo na memória do cliente
+        
+        Sempre produz ao menos um lote (vazio, se não houver linhas), para
+        que o consumidor conheça as colunas do resultado.
+        
+        Args:
+            query: String com a query SQL
+            fetch_size: Linhas buscadas por lote (padrão: FETCH_SIZE do config)
+            as_dataframe: Se True, cada lote é um DataFrame; senão, lista de tuplas
+            params: Parâmetros nomeados da query (%(nome)s)
+            prepared: Se True, executa um statement preparado no servidor.
+                O PostgreSQL não abre cursor nomeado sobre EXECUTE, então o
+                resultado chega inteiro ao cliente e é entregue em lotes.
+            
+        Yields:
+            DataFrame (ou lista de tuplas) com até fetch_size linhas
+        """
+        fetch_size = fetch_size or FETCH_SIZE
+        params = bind(query, params)
+        
+        try:
+            with self._reading():
+                yield from self._stream(query, fetch_size, as_dataframe, params, prepared)
+        finally:
+            # Cursores nomeados vivem dentro de uma transação: encerra a leitura
+            if not self.connection.closed:
+                self.connection.rollback()
+    
+    def _stream(self, query: str, fetch_size: int, as_dataframe: bool,
+                params: Optional[dict], prepared: bool) -> Iterator:
+        """Lotes de stream_query, dentro da transação de leitura"""
+        if prepared:
+            statement, params = self.prepare(query, params)
+            cursor = self.connection.cursor()
+        else:
+            statement = query
+            cursor = self.connection.cursor(name=f"oferta_{uuid.uuid4().hex[:12]}")
+            cursor.itersize = fetch_size
+        
+        with cursor:
+            with metrics.stage('execute'):
+                cursor.execute(statement, params)
+            
+            first_batch = True
+            while True:
+                with metrics.stage('fetch'):
+                    rows = cursor.fetchmany(fetch_size)
+                self.check_cancelled()
+                if not rows and not first_batch:
+                    break
+                first_batch = False
+                
+                if as_dataframe:
+                    with metrics.stage('dataframe'):
+                        columns = [desc[0] for desc in cursor.description]
+                        chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                    yield chunk
+                else:
+                    yield rows
+                
+                if len(rows) < fetch_size:
+                    break
+    
+    def copy_query(self, query: str, params: dict = None) -> pd.DataFrame:
+        """
+        Busca o resultado via COPY ... TO STDOUT e converte o CSV em colunas
+        de uma só vez, sem montar tuplas Python linha a linha
+        
+        NULL chega como \\N sem aspas. Se algum texto for igual ao marcador
+        (o PostgreSQL o envia entre aspas), o CSV é descartado e o resultado
+        é buscado pelo cursor, para não confundir o texto com NULL.
+        
+        Args:
+            query: String com a query SQL (SELECT)
+            params: Parâmetros nomeados da query (%(nome)s)
+            
+        Returns:
+            DataFrame com as mesmas colunas e ordem da query
+        """
+        source_query, source_params = query, params
+        with self._reading(), self.connection.cursor() as cursor:
+            # COPY não aceita parâmetros: os valores são escapados no texto
+            params = bind(query, params)
+            if params is not None:
+                query = cursor.mogrify(query, params).decode(
+                    psycopg2.extensions.encodings[self.connection.encoding])
+            query = query.strip().rstrip(';')
+            
+            # Descobre nomes e tipos das colunas sem trazer linhas
+            with metrics.stage('execute'):
+                cursor.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+            columns = [desc.name for desc in cursor.description]
+            dtypes = {desc.name: COPY_DTYPES.get(desc.type_code, str) for desc in cursor.description}
+            
+            buffer = io.BytesIO()
+            with metrics.stage('fetch'):
+                cursor.copy_expert(
+                    f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{COPY_NULL}')",
+                    buffer
+                )
+        self.connection.rollback()
+        self.check_cancelled()
+        
+        with buffer.getbuffer() as view:
+            ambiguous = QUOTED_COPY_NULL.search(view) is not None
+        if ambiguous:
+            print(f"ℹ️ Texto igual ao marcador de NULL ({COPY_NULL}) no resultado: buscando pelo cursor...")
+            chunks = list(self.stream_query(source_query, params=source_params))
+            with metrics.stage('dataframe'):
+                return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+        
+        buffer.seek(0)
+        with metrics.stage('dataframe'):
+            return pd.read_csv(
+                buffer,
+                dtype=dtypes,
+                na_values=[COPY_NULL],
+                true_values=['t'],
+                false_values=['f'],
+                keep_default_na=False,
+                encoding=psycopg2.extensions.encodings[self.connection.encoding],
+            )[columns]
+    
+    def execute_query(self, query: str, engine: str = None, params: dict = None,
+                      prepared: bool = False) -> Optional[pd.DataFrame]:
         """
         Executa uma query SQL e retorna os resultados como DataFrame
         
         Args:
             query: String com a query SQL
+            engine: 'cursor' (cursor server-side) ou 'copy' (COPY TO STDOUT);
+                padrão definido por FETCH_ENGINE no config
+            params: Parâmetros nomeados da query (%(nome)s)
+            prepared: Se True, usa statement preparado no servidor (conexões
+                reaproveitadas); ignorado no modo 'copy'
             
         Returns:
             DataFrame com os resultados ou None em caso de erro
+            
+        Raises:
+            ExtractionCancelled: Se cancel() foi chamado durante a query
+            TimeoutError: Se a query excedeu STATEMENT_TIMEOUT_SECONDS
         """
+        engine = engine or FETCH_ENGINE
+        
         try:
             print("🔍 Executando query...")
-            df = pd.read_sql_query(query, self.connection)
+            if engine == 'copy':
+                df = self.copy_query(query, params)
+            else:
+                chunks = list(self.stream_query(query, params=params, prepared=prepared))
+                with metrics.stage('dataframe'):
+                    df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+            with metrics.stage('dataframe'):
+                df = apply_schema(df)
             print(f"✅ Query executada! {len(df)} registros encontrados.")
             return df
+        except (ExtractionCancelled, TimeoutError) as e:
+            # Cancelamento e tempo limite chegam a quem chamou, que avisa o usuário
+            if not self.connection.closed:
+                self.connection.rollback()
+            print(f"🛑 Query interrompida: {e}")
+            raise
         except Exception as e:
+            if not self.connection.closed:
+                self.connection.rollback()
             print(f"❌ Erro ao executar query: {e}")
             return None
     
@@ -53,7 +351,7 @@ class DatabaseConnection:
         """Fecha a conexão com o banco de dados"""
         if self.cursor:
             self.cursor.close()
-        if self.connection:
+        if self.connection and self._owns_connection:
             self.connection.close()
             print("🔌 Conexão com banco de dados fechada.")
     
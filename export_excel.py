@@ -1,36 +1,89 @@
 """
 Módulo para exportar dados para Excel com formatação profissional
 """
+import io
+import itertools
+import os
+from typing import Iterable, Iterator, Optional
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle, DEFAULT_FONT
 from openpyxl.utils import get_column_letter
+import metrics
+from config import EXCEL_STREAMING, EXCEL_MAX_ROWS, EXCEL_SHARD_MODE
+from schema import CURRENCY_FORMAT, number_format
+
+SHEET_NAME = 'Oferta Relâmpago'
+
+# Estilos nomeados compartilhados pelo modo streaming
+HEADER_STYLE = 'oferta_cabecalho'
+DATA_STYLE = 'oferta_dados'
+CURRENCY_STYLE = 'oferta_moeda'
+
+# Quantidade de linhas convertidas por vez no modo streaming
+STREAM_CHUNK_ROWS = 10000
+
+# Linhas medidas para definir as larguras no modo streaming, antes da
+# primeira linha gravada (lotes posteriores não alteram as larguras)
+WIDTH_SAMPLE_ROWS = 10000
+
+# Largura máxima de coluna
+MAX_COLUMN_WIDTH = 50
+
+
+def _thin_border() -> Border:
+    """Borda fina usada em todas as células da planilha"""
+    return Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
 
 
 class ExcelExporter:
     """Exporta e formata planilhas Excel"""
     
     @staticmethod
-    def export_data(df: pd.DataFrame, filename: str) -> bool:
+    def export_data(df: pd.DataFrame, filename: str, streaming: bool = None) -> bool:
         """
         Exporta DataFrame para Excel com formatação profissional
         
         Args:
             df: DataFrame com os dados
             filename: Nome do arquivo de saída
+            streaming: Se True, grava e formata em uma única passada
+                (padrão definido por EXCEL_STREAMING no config)
             
         Returns:
             bool: True se exportou com sucesso
         """
+        if streaming is None:
+            streaming = EXCEL_STREAMING
+        if not streaming and len(df) >= EXCEL_MAX_ROWS:
+            # to_excel não divide o resultado; só o modo streaming gera partes
+            print(f"ℹ️ {len(df)} linhas excedem o limite do Excel, usando o modo streaming.")
+            streaming = True
+        
         try:
             print(f"📊 Gerando planilha {filename}...")
+            files = [filename]
             
-            # Exporta para Excel
-            df.to_excel(filename, index=False, sheet_name='Oferta Relâmpago')
-            
-            # Aplica formatação
-            ExcelExporter._format_excel(filename)
+            if streaming:
+                # Grava dados, estilos e larguras em uma única passada
+                _, files = ExcelExporter._write_streaming([df], filename)
+            else:
+                # Exporta para Excel
+                with metrics.stage('to_excel'):
+                    df.to_excel(filename, index=False, sheet_name=SHEET_NAME)
+                
+                # Aplica formatação
+                ExcelExporter._format_excel(filename, df)
             
+            metrics.count('rows', len(df))
+            metrics.count('bytes_written', sum(os.path.getsize(path) for path in files))
+            ExcelExporter._report_shards(files)
             print(f"✅ Planilha {filename} criada com sucesso!")
             return True
             
@@ -39,61 +92,453 @@ class ExcelExporter:
             return False
     
     @staticmethod
-    def _format_excel(filename: str):
+    def export_chunks(chunks: Iterable[pd.DataFrame], filename: str) -> int:
+        """
+        Exporta lotes de DataFrame para Excel à medida que chegam
+        
+        As larguras das colunas são calculadas com os primeiros lotes (até
+        WIDTH_SAMPLE_ROWS linhas), que ficam na memória até a aba começar.
+        
+        Args:
+            chunks: Iterável de DataFrames com as mesmas colunas
+            filename: Nome do arquivo de saída
+            
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        try:
+            print(f"📊 Gerando planilha {filename}...")
+            total_rows, files = ExcelExporter._write_streaming(chunks, filename)
+            metrics.count('rows', total_rows)
+            metrics.count('bytes_written', sum(os.path.getsize(path) for path in files))
+            ExcelExporter._report_shards(files)
+            print(f"✅ Planilha {filename} criada com sucesso! {total_rows} linhas gravadas.")
+            return total_rows
+        
+        except Exception as e:
+            print(f"❌ Erro ao exportar para Excel: {e}")
+            return -1
+    
+    @staticmethod
+    def export_bytes(df: pd.DataFrame) -> Optional[bytes]:
+        """
+        Gera a planilha formatada em memória, sem arquivo em disco
+        
+        Acima do limite de linhas do Excel, o resultado continua em abas
+        numeradas (um único arquivo, qualquer que seja EXCEL_SHARD_MODE).
+        
+        Args:
+            df: DataFrame com os dados
+            
+        Returns:
+            Conteúdo do arquivo .xlsx, ou None em caso de erro
+        """
+        try:
+            buffer = io.BytesIO()
+            wb = ExcelExporter._new_workbook()
+            total_rows = ExcelExporter._write_sheets(wb, SHEET_NAME, [df])
+            with metrics.stage('save'):
+                wb.save(buffer)
+            metrics.count('rows', total_rows)
+            metrics.count('bytes_written', buffer.tell())
+            return buffer.getvalue()
+        
+        except Exception as e:
+            print(f"❌ Erro ao gerar planilha em memória: {e}")
+            return None
+    
+    @staticmethod
+    def _named_styles() -> tuple:
+        """
+        Cria os estilos nomeados de cabeçalho e de dados
+        
+        Returns:
+            Tupla (estilo do cabeçalho, estilo dos dados, estilo de moeda)
+        """
+        header = NamedStyle(name=HEADER_STYLE)
+        header.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header.font = Font(bold=True, color="FFFFFF", size=12)
+        header.alignment = Alignment(horizontal="center", vertical="center")
+        header.border = _thin_border()
+        
+        data = NamedStyle(name=DATA_STYLE)
+        data.font = DEFAULT_FONT
+        data.alignment = Alignment(horizontal="left", vertical="center")
+        data.border = _thin_border()
+        
+        currency = NamedStyle(name=CURRENCY_STYLE)
+        currency.font = DEFAULT_FONT
+        currency.alignment = Alignment(horizontal="left", vertical="center")
+        currency.border = _thin_border()
+        currency.number_format = CURRENCY_FORMAT
+        
+        return header, data, currency
+    
+    @staticmethod
+    def _data_style_names(columns) -> list:
+        """
+        Escolhe o estilo nomeado das células de dados de cada coluna
+        
+        Args:
+            columns: Nomes das colunas
+            
+        Returns:
+            Lista com o nome do estilo de cada coluna
+        """
+        return [
+            CURRENCY_STYLE if number_format(name) == CURRENCY_FORMAT else DATA_STYLE
+            for name in columns
+        ]
+    
+    @staticmethod
+    def _styled_cell(ws, style: str, value=None) -> WriteOnlyCell:
+        """
+        Cria uma célula write-only com um estilo nomeado
+        
+        Args:
+            ws: Planilha cujo workbook já tem os estilos nomeados
+            style: Nome do estilo
+            value: Valor da célula
+            
+        Returns:
+            Célula pronta para o append
+        """
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+    
+    @staticmethod
+    def _column_widths(df: pd.DataFrame) -> list:
+        """
+        Calcula a largura de cada coluna a partir do DataFrame, com operações
+        vetorizadas por coluna (sem percorrer células)
+        
+        Args:
+            df: DataFrame com os dados
+            
+        Returns:
+            Lista com a largura de cada coluna, na ordem do DataFrame
+        """
+        widths = []
+        for name in df.columns:
+            values = df[name].dropna()
+            max_length = len(str(name))
+            if values.empty:
+                pass
+            elif number_format(name) == CURRENCY_FORMAT:
+                # Largura do valor exibido, ex.: "R$ 1,234.56"
+                extremes = (values.max(), values.min())
+                max_length = max(max_length, *(len(f"R$ {value:,.2f}") for value in extremes))
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                # Basta medir as categorias presentes
+                categories = values.cat.remove_unused_categories().cat.categories
+                max_length = max(max_length, int(categories.astype(str).str.len().max()))
+            elif pd.api.types.is_string_dtype(values):
+                max_length = max(max_length, int(values.str.len().max()))
+            else:
+                max_length = max(max_length, int(values.astype(str).str.len().max()))
+            widths.append(min(max_length + 2, MAX_COLUMN_WIDTH))  # Máximo de 50
+        return widths
+    
+    @staticmethod
+    def _iter_rows(df: pd.DataFrame):
+        """
+        Percorre as linhas do DataFrame em blocos, trocando nulos por None
+        
+        Args:
+            df: DataFrame com os dados
+            
+        Yields:
+            Lista com os valores de cada linha
+        """
+        for start in range(0, len(df), STREAM_CHUNK_ROWS):
+            chunk = df.iloc[start:start + STREAM_CHUNK_ROWS].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            yield from chunk.values.tolist()
+    
+    @staticmethod
+    def export_sheets(sheets: Iterable[tuple], filename: str) -> int:
+        """
+        Exporta vários DataFrames para abas de uma mesma planilha
+        
+        Abas acima do limite de linhas do Excel continuam em abas numeradas.
+        
+        Args:
+            sheets: Iterável de tuplas (nome da aba, DataFrame ou iterável de DataFrames)
+            filename: Nome do arquivo de saída
+            
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        try:
+            print(f"📊 Gerando planilha {filename}...")
+            wb = ExcelExporter._new_workbook()
+            total_rows = 0
+            for title, data in sheets:
+                chunks = [data] if isinstance(data, pd.DataFrame) else data
+                total_rows += ExcelExporter._write_sheets(wb, title, chunks)
+            
+            with metrics.stage('save'):
+                wb.save(filename)
+            metrics.count('rows', total_rows)
+            metrics.count('bytes_written', os.path.getsize(filename))
+            print(f"✅ Planilha {filename} criada com sucesso! {total_rows} linhas gravadas.")
+            return total_rows
+        
+        except Exception as e:
+            print(f"❌ Erro ao exportar para Excel: {e}")
+            return -1
+    
+    @staticmethod
+    def _new_workbook() -> Workbook:
+        """
+        Cria um workbook write-only com os estilos nomeados registrados
+        
+        Returns:
+            Workbook sem abas
+        """
+        wb = Workbook(write_only=True)
+        for style in ExcelExporter._named_styles():
+            wb.add_named_style(style)
+        return wb
+    
+    @staticmethod
+    def _report_shards(files: list):
+        """Informa as partes geradas quando o resultado excede uma planilha"""
+        if len(files) > 1:
+            print(f"✂️ Resultado acima de {EXCEL_MAX_ROWS - 1} linhas dividido em {len(files)} arquivos:")
+            for path in files:
+                print(f"   • {path}")
+    
+    @staticmethod
+    def shard_title(title: str, shard: int) -> str:
+        """
+        Nome da aba de uma parte, respeitando o limite de 31 caracteres
+        
+        Args:
+            title: Nome da primeira aba
+            shard: Número da parte (1 = primeira)
+            
+        Returns:
+            Nome da aba
+        """
+        if shard == 1:
+            return title
+        suffix = f" ({shard})"
+        return title[:31 - len(suffix)] + suffix
+    
+    @staticmethod
+    def shard_filename(filename: str, shard: int) -> str:
+        """
+        Nome do arquivo de uma parte: Oferta_Relampago.xlsx, Oferta_Relampago_2.xlsx, ...
+        
+        Args:
+            filename: Nome do arquivo da primeira parte
+            shard: Número da parte (1 = primeira)
+            
+        Returns:
+            Nome do arquivo
+        """
+        if shard == 1:
+            return filename
+        base, extension = os.path.splitext(filename)
+        return f"{base}_{shard}{extension}"
+    
+    @staticmethod
+    def _write_sheet(wb: Workbook, title: str, chunks: Iterator[pd.DataFrame],
+                     max_rows: int = None, widths: list = None) -> tuple:
+        """
+        Cria uma aba formatada no workbook write-only e grava os lotes nela
+        
+        As larguras vêm dos primeiros lotes (até WIDTH_SAMPLE_ROWS linhas) e
+        são definidas antes da primeira linha. Para no limite de linhas da
+        aba; o que não coube é devolvido para continuar na próxima parte.
+        
+        Args:
+            wb: Workbook criado por _new_workbook
+            title: Nome da aba
+            chunks: Iterador de DataFrames com as mesmas colunas
+            max_rows: Máximo de linhas de dados na aba (padrão: limite do Excel)
+            widths: Larguras mínimas das colunas (ex.: as da parte anterior)
+            
+        Returns:
+            Tupla (linhas gravadas, larguras usadas, iterador com os lotes
+            restantes ou None)
+        """
+        max_rows = max_rows or EXCEL_MAX_ROWS - 1
+        sample = ExcelExporter._sample(chunks)
+        columns = sample[0].columns
+        ws = wb.create_sheet(title)
+        
+        # Larguras e painel congelado precisam ser definidos antes das linhas
+        with metrics.stage('format'):
+            for chunk in sample:
+                widths = ExcelExporter._wider(widths, ExcelExporter._column_widths(chunk))
+            for idx, width in enumerate(widths, start=1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+            ws.freeze_panes = 'A2'
+        
+        ws.append([ExcelExporter._styled_cell(ws, HEADER_STYLE, name) for name in columns])
+        
+        # O append grava a linha na hora: uma célula estilizada por coluna
+        # serve para todas as linhas, com o estilo resolvido uma única vez
+        cells = [
+            ExcelExporter._styled_cell(ws, style)
+            for style in ExcelExporter._data_style_names(columns)
+        ]
+        
+        total_rows = 0
+        remainder = None
+        source = itertools.chain(sample, chunks)
+        for chunk in source:
+            space = max_rows - total_rows
+            if len(chunk) > space:
+                chunk, remainder = chunk.iloc[:space], chunk.iloc[space:]
+            
+            with metrics.stage('write'):
+                for row in ExcelExporter._iter_rows(chunk):
+                    for cell, value in zip(cells, row):
+                        cell.value = value
+                    ws.append(cells)
+            total_rows += len(chunk)
+            
+            if remainder is not None:
+                break
+        
+        if remainder is None:
+            return total_rows, widths, None
+        # O que não coube (inclusive lotes da amostra) segue para a próxima parte
+        return total_rows, widths, itertools.chain([remainder], source)
+    
+    @staticmethod
+    def _sample(chunks: Iterator[pd.DataFrame]) -> list:
+        """
+        Lê lotes até somar WIDTH_SAMPLE_ROWS linhas (ou acabarem os lotes)
+        
+        Args:
+            chunks: Iterador de DataFrames
+            
+        Returns:
+            Lista com os lotes lidos (ao menos um)
+            
+        Raises:
+            StopIteration: Se não houver nenhum lote
+        """
+        sample = [next(chunks)]
+        rows = len(sample[0])
+        while rows < WIDTH_SAMPLE_ROWS:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            sample.append(chunk)
+            rows += len(chunk)
+        return sample
+    
+    @staticmethod
+    def _wider(widths: Optional[list], other: list) -> list:
+        """Maior largura de cada coluna entre duas listas"""
+        if not widths:
+            return other
+        return [max(a, b) for a, b in zip(widths, other)]
+    
+    @staticmethod
+    def _write_sheets(wb: Workbook, title: str, chunks: Iterable[pd.DataFrame]) -> int:
+        """
+        Grava os lotes em uma aba, continuando em abas numeradas no limite do Excel
+        
+        Args:
+            wb: Workbook criado por _new_workbook
+            title: Nome da primeira aba
+            chunks: Iterável de DataFrames com as mesmas colunas
+            
+        Returns:
+            int: Quantidade de linhas de dados gravadas
+        """
+        chunks = iter(chunks)
+        total_rows, shard, widths = 0, 1, None
+        while True:
+            rows, widths, chunks = ExcelExporter._write_sheet(
+                wb, ExcelExporter.shard_title(title, shard), chunks, widths=widths
+            )
+            total_rows += rows
+            if chunks is None:
+                if shard > 1:
+                    print(f"✂️ Aba '{title}' acima de {EXCEL_MAX_ROWS - 1} linhas dividida em {shard} abas.")
+                return total_rows
+            shard += 1
+    
+    @staticmethod
+    def _write_streaming(chunks: Iterable[pd.DataFrame], filename: str) -> tuple:
+        """
+        Grava a planilha formatada em modo write-only (memória constante)
+        
+        Acima do limite de linhas do Excel, o resultado continua em abas
+        numeradas ou em arquivos numerados (EXCEL_SHARD_MODE). Cada arquivo
+        é salvo assim que enche, então só uma parte fica aberta por vez.
+        
+        Args:
+            chunks: Iterável de DataFrames com as mesmas colunas
+            filename: Nome do arquivo de saída
+            
+        Returns:
+            Tupla (linhas de dados gravadas, lista de arquivos gerados)
+        """
+        if EXCEL_SHARD_MODE != 'files':
+            wb = ExcelExporter._new_workbook()
+            total_rows = ExcelExporter._write_sheets(wb, SHEET_NAME, chunks)
+            with metrics.stage('save'):
+                wb.save(filename)
+            return total_rows, [filename]
+        
+        chunks = iter(chunks)
+        files, total_rows, widths = [], 0, None
+        while True:
+            path = ExcelExporter.shard_filename(filename, len(files) + 1)
+            wb = ExcelExporter._new_workbook()
+            rows, widths, chunks = ExcelExporter._write_sheet(wb, SHEET_NAME, chunks, widths=widths)
+            with metrics.stage('save'):
+                wb.save(path)
+            files.append(path)
+            total_rows += rows
+            if chunks is None:
+                return total_rows, files
+    
+    @staticmethod
+    def _format_excel(filename: str, df: pd.DataFrame):
         """
         Aplica formatação profissional ao arquivo Excel
         
+        Larguras e estilos são calculados a partir do DataFrame e aplicados
+        coluna a coluna, sem medir o conteúdo de cada célula.
+        
         Args:
             filename: Nome do arquivo Excel
+            df: DataFrame exportado para o arquivo
         """
-        wb = load_workbook(filename)
-        ws = wb.active
-        
-        # Estilo do cabeçalho
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Estilo das bordas
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Aplica formatação no cabeçalho
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = header_alignment
-            cell.border = thin_border
-        
-        # Formatação das células de dados
-        data_alignment = Alignment(horizontal="left", vertical="center")
-        
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-            for cell in row:
-                cell.alignment = data_alignment
-                cell.border = thin_border
-        
-        # Ajusta largura das colunas automaticamente
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(max_length + 2, 50)  # Máximo de 50
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Congela a primeira linha (cabeçalho)
-        ws.freeze_panes = 'A2'
+        with metrics.stage('format'):
+            wb = load_workbook(filename)
+            ws = wb.active
+            
+            for style in ExcelExporter._named_styles():
+                wb.add_named_style(style)
+            
+            # Aplica formatação no cabeçalho
+            for cell in ws[1]:
+                cell.style = HEADER_STYLE
+            
+            # Formatação das células de dados, um estilo por coluna
+            column_styles = ExcelExporter._data_style_names(df.columns)
+            for col_idx, style in enumerate(column_styles, start=1):
+                for (cell,) in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=col_idx, max_col=col_idx):
+                    cell.style = style
+            
+            # Ajusta largura das colunas
+            for idx, width in enumerate(ExcelExporter._column_widths(df), start=1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+            
+            # Congela a primeira linha (cabeçalho)
+            ws.freeze_panes = 'A2'
         
         # Salva as alterações
-        wb.save(filename)
+        with metrics.stage('save'):
+            wb.save(filename)
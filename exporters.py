@@ -0,0 +1,325 @@
+"""
+Registro de formatos de exportação
+Cada formato tem um exportador com a mesma interface do ExcelExporter:
+export_data(df, filename) -> bool e export_chunks(chunks, filename) -> int
+"""
+import itertools
+import os
+from abc import ABC, abstractmethod
+from typing import Iterable
+import pandas as pd
+import metrics
+from config import OUTPUT_FILENAME, EXPORT_FORMAT, CSV_SEPARATOR, CSV_ENCODING, CSV_DECIMAL
+from export_excel import ExcelExporter
+from schema import apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# formato -> (exportador, extensão, descrição para o diálogo de salvamento)
+EXPORTERS = {}
+
+
+def register(name: str, extension: str, description: str):
+    """
+    Registra um exportador para um formato
+    
+    Args:
+        name: Nome do formato (ex.: 'csv')
+        extension: Extensão do arquivo, com ponto (ex.: '.csv')
+        description: Descrição exibida no diálogo de salvamento
+    """
+    def decorator(exporter):
+        EXPORTERS[name] = (exporter, extension, description)
+        return exporter
+    return decorator
+
+
+register('xlsx', '.xlsx', 'Excel files')(ExcelExporter)
+
+
+def get_exporter(name: str = None):
+    """
+    Retorna o exportador de um formato
+    
+    Args:
+        name: Nome do formato (padrão: EXPORT_FORMAT do config)
+    
+    Returns:
+        Classe exportadora
+    
+    Raises:
+        ValueError: Se o formato não estiver registrado
+    """
+    name = (name or EXPORT_FORMAT).lower()
+    if name not in EXPORTERS:
+        raise ValueError(f"Formato de exportação inválido: {name} (use {', '.join(EXPORTERS)})")
+    return EXPORTERS[name][0]
+
+
+def format_from_path(path: str, default: str = None) -> str:
+    """
+    Descobre o formato pela extensão do arquivo
+    
+    Args:
+        path: Caminho do arquivo
+        default: Formato usado se a extensão for desconhecida (padrão: EXPORT_FORMAT)
+    
+    Returns:
+        Nome do formato
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for name, (_, ext, _) in EXPORTERS.items():
+        if ext == extension:
+            return name
+    return (default or EXPORT_FORMAT).lower()
+
+
+def output_filename(name: str = None) -> str:
+    """
+    Nome do arquivo de saída padrão para um formato
+    
+    Args:
+        name: Nome do formato (padrão: EXPORT_FORMAT)
+    
+    Returns:
+        OUTPUT_FILENAME com a extensão do formato
+    """
+    name = (name or EXPORT_FORMAT).lower()
+    return os.path.splitext(OUTPUT_FILENAME)[0] + EXPORTERS[name][1]
+
+
+def save_dialog_filetypes(first: str = None) -> list:
+    """
+    Tipos de arquivo para o diálogo de salvamento, com o formato padrão primeiro
+    
+    Args:
+        first: Formato listado primeiro (padrão: EXPORT_FORMAT)
+    
+    Returns:
+        Lista de tuplas (descrição, padrão) para o tkinter
+    """
+    first = (first or EXPORT_FORMAT).lower()
+    names = sorted(EXPORTERS, key=lambda name: name != first)
+    return [(EXPORTERS[name][2], f"*{EXPORTERS[name][1]}") for name in names] + [("All files", "*.*")]
+
+
+def temp_filename(output: str) -> str:
+    """Arquivo temporário gravado antes de substituir `output` (mesma pasta e extensão)"""
+    base, extension = os.path.splitext(output)
+    return f"{base}.tmp{extension}"
+
+
+def _has_shards(path: str) -> bool:
+    """Só o xlsx é dividido em arquivos numerados (EXCEL_SHARD_MODE=files)"""
+    return os.path.splitext(path)[1].lower() == EXPORTERS['xlsx'][1]
+
+
+def replace_output(temp: str, output: str):
+    """
+    Move o arquivo gerado em `temp` para `output`
+    
+    O os.replace é atômico na mesma pasta: quem lê o arquivo vê a versão
+    anterior ou a nova, nunca um arquivo pela metade. Com o resultado
+    dividido em arquivos numerados (xlsx), cada parte é trocada da mesma
+    forma e partes que sobraram da versão anterior são removidas.
+    
+    Args:
+        temp: Arquivo gerado
+        output: Destino
+    
+    Raises:
+        OSError: Se o destino não puder ser substituído (ex.: aberto no Excel)
+    """
+    if not _has_shards(output):
+        os.replace(temp, output)
+        return
+    shard = 1
+    while os.path.exists(ExcelExporter.shard_filename(temp, shard)):
+        os.replace(ExcelExporter.shard_filename(temp, shard), ExcelExporter.shard_filename(output, shard))
+        shard += 1
+    while os.path.exists(ExcelExporter.shard_filename(output, shard)):
+        os.remove(ExcelExporter.shard_filename(output, shard))
+        shard += 1
+
+
+def remove_output(path: str):
+    """Remove um arquivo gerado (e suas partes numeradas, no xlsx), se existir"""
+    if not _has_shards(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return
+    shard = 1
+    while os.path.exists(ExcelExporter.shard_filename(path, shard)):
+        try:
+            os.remove(ExcelExporter.shard_filename(path, shard))
+        except OSError:
+            break
+        shard += 1
+
+
+def _require_arrow():
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("Formato requer o pacote pyarrow (pip install pyarrow)")
+
+
+@register('csv', '.csv', 'CSV files')
+class CsvExporter:
+    """Exporta CSV em blocos, sem montar o arquivo inteiro na memória"""
+    
+    @staticmethod
+    def export_data(df: pd.DataFrame, filename: str) -> bool:
+        """
+        Exporta DataFrame para CSV
+        
+        Args:
+            df: DataFrame com os dados
+            filename: Nome do arquivo de saída
+        
+        Returns:
+            bool: True se exportou com sucesso
+        """
+        return CsvExporter.export_chunks([df], filename) >= 0
+    
+    @staticmethod
+    def export_chunks(chunks: Iterable[pd.DataFrame], filename: str) -> int:
+        """
+        Exporta lotes de DataFrame para CSV à medida que chegam
+        
+        Args:
+            chunks: Iterável de DataFrames com as mesmas colunas
+            filename: Nome do arquivo de saída
+        
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        try:
+            print(f"📄 Gerando CSV {filename}...")
+            total_rows = 0
+            with open(filename, 'w', encoding=CSV_ENCODING, newline='') as f:
+                for idx, chunk in enumerate(chunks):
+                    with metrics.stage('write'):
+                        chunk.to_csv(f, index=False, header=idx == 0, sep=CSV_SEPARATOR, decimal=CSV_DECIMAL)
+                    total_rows += len(chunk)
+            
+            metrics.count('rows', total_rows)
+            metrics.count('bytes_written', os.path.getsize(filename))
+            print(f"✅ Arquivo {filename} criado com sucesso! {total_rows} linhas gravadas.")
+            return total_rows
+        
+        except Exception as e:
+            print(f"❌ Erro ao exportar para CSV: {e}")
+            return -1
+
+
+class _ArrowExporter(ABC):
+    """Base dos formatos colunares (Arrow): converte lotes sem cópia por linha"""
+    
+    LABEL = ''
+    
+    @staticmethod
+    @abstractmethod
+    def _open_writer(filename: str, schema):
+        """Abre o gravador do formato (com write_table e uso em with)"""
+    
+    @staticmethod
+    def _dictionary_type(field_type):
+        # Índices de largura fixa: lotes com mais categorias cabem no mesmo esquema
+        return pa.dictionary(pa.int32(), field_type.value_type)
+    
+    @classmethod
+    def _arrow_schema(cls, df: pd.DataFrame):
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        for idx, field in enumerate(schema):
+            if pa.types.is_dictionary(field.type):
+                schema = schema.set(idx, field.with_type(cls._dictionary_type(field.type)))
+        return schema
+    
+    @classmethod
+    def export_data(cls, df: pd.DataFrame, filename: str) -> bool:
+        """
+        Exporta DataFrame para o formato colunar
+        
+        Args:
+            df: DataFrame com os dados
+            filename: Nome do arquivo de saída
+        
+        Returns:
+            bool: True se exportou com sucesso
+        """
+        return cls.export_chunks([df], filename) >= 0
+    
+    @classmethod
+    def export_chunks(cls, chunks: Iterable[pd.DataFrame], filename: str) -> int:
+        """
+        Exporta lotes de DataFrame à medida que chegam
+        
+        O esquema Arrow é definido pelo primeiro lote; os seguintes são
+        convertidos para ele.
+        
+        Args:
+            chunks: Iterável de DataFrames com as mesmas colunas
+            filename: Nome do arquivo de saída
+        
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        try:
+            _require_arrow()
+            print(f"📦 Gerando {cls.LABEL} {filename}...")
+            
+            chunks = iter(chunks)
+            first = apply_schema(next(chunks))
+            schema = cls._arrow_schema(first)
+            
+            total_rows = 0
+            with cls._open_writer(filename, schema) as writer:
+                for chunk in itertools.chain([first], chunks):
+                    with metrics.stage('write'):
+                        chunk = apply_schema(chunk)
+                        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                        writer.write_table(table)
+                    total_rows += len(chunk)
+            
+            metrics.count('rows', total_rows)
+            metrics.count('bytes_written', os.path.getsize(filename))
+            print(f"✅ Arquivo {filename} criado com sucesso! {total_rows} linhas gravadas.")
+            return total_rows
+        
+        except Exception as e:
+            print(f"❌ Erro ao exportar para {cls.LABEL}: {e}")
+            return -1
+
+
+@register('parquet', '.parquet', 'Parquet files')
+class ParquetExporter(_ArrowExporter):
+    """Exporta Parquet (colunar, comprimido)"""
+    
+    LABEL = 'Parquet'
+    
+    @staticmethod
+    def _open_writer(filename: str, schema):
+        return pyarrow.parquet.ParquetWriter(filename, schema)
+
+
+@register('feather', '.feather', 'Feather files')
+class FeatherExporter(_ArrowExporter):
+    """Exporta Feather (Arrow IPC, leitura sem cópia)"""
+    
+    LABEL = 'Feather'
+    
+    @staticmethod
+    def _open_writer(filename: str, schema):
+        return pyarrow.ipc.new_file(filename, schema)
+    
+    @staticmethod
+    def _dictionary_type(field_type):
+        # O formato de arquivo IPC não aceita dicionários diferentes entre lotes
+        return field_type.value_type
@@ -0,0 +1,236 @@
+"""
+Extração em vários bancos ao mesmo tempo (um perfil por empresa/filial)
+Cada perfil roda em uma thread própria, com tempo limite e falhas isolados,
+e grava seus lotes em um arquivo temporário (Arrow IPC); os perfis
+concluídos são consolidados na saída na ordem em que terminam, com a coluna
+'origem', sem esperar os bancos mais lentos
+"""
+import itertools
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+from config import DB_PROFILES, DB_PROFILE_TIMEOUTS, PROFILE_TIMEOUT_SECONDS, PROFILE_WORKERS
+from database import DatabaseConnection
+from exporters import temp_filename, replace_output, remove_output
+from spill import ARROW_AVAILABLE, SpillFile
+
+# Coluna com o nome do perfil de origem de cada linha
+SOURCE_COLUMN = 'origem'
+
+
+def select_profiles(names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    Perfis de conexão escolhidos
+    
+    Args:
+        names: Nomes dos perfis (vazio ou None: todos de DB_PROFILES)
+        
+    Returns:
+        Dicionário nome -> parâmetros de conexão
+        
+    Raises:
+        ValueError: Se não houver perfis ou algum nome não existir
+    """
+    if not DB_PROFILES:
+        raise ValueError("Nenhum perfil de banco configurado (defina DB_PROFILES no .env)")
+    if not names:
+        return dict(DB_PROFILES)
+    unknown = [name for name in names if name not in DB_PROFILES]
+    if unknown:
+        raise ValueError(
+            f"Perfis desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(DB_PROFILES)})"
+        )
+    return {name: DB_PROFILES[name] for name in names}
+
+
+class ProfileResult:
+    """Resultado da extração de um perfil"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.seconds = 0.0
+        self.status = 'pendente'   # 'ok', 'erro' ou 'tempo esgotado'
+        self.error = None
+        self.spill = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.status == 'ok'
+    
+    def summary(self) -> str:
+        """Linha de resumo para o log"""
+        if self.ok:
+            return f"   ✅ {self.name}: {self.rows} linhas em {self.seconds:.1f} s"
+        if self.status == 'tempo esgotado':
+            return f"   ⏱️ {self.name}: tempo esgotado após {self.seconds:.1f} s"
+        return f"   ❌ {self.name}: {self.error}"
+
+
+class FanOutExtractor:
+    """Executa a query em todos os perfis ao mesmo tempo e consolida uma saída"""
+    
+    def __init__(self, profiles: Dict[str, dict] = None, timeouts: Dict[str, float] = None,
+                 workers: int = None, fetch_size: int = None):
+        """
+        Args:
+            profiles: Perfis nome -> parâmetros de conexão (padrão: DB_PROFILES)
+            timeouts: Tempo limite por perfil, em segundos (padrão: DB_PROFILE_TIMEOUTS)
+            workers: Bancos consultados ao mesmo tempo (padrão: PROFILE_WORKERS; 0 = todos)
+            fetch_size: Linhas por lote (padrão: FETCH_SIZE)
+        """
+        self.profiles = profiles if profiles is not None else select_profiles()
+        self.timeouts = timeouts or DB_PROFILE_TIMEOUTS
+        self.workers = (workers if workers is not None else PROFILE_WORKERS) or len(self.profiles)
+        self.fetch_size = fetch_size
+        self.results: List[ProfileResult] = []
+        self._active: Dict[str, DatabaseConnection] = {}
+        self._lock = threading.Lock()
+    
+    def timeout(self, name: str) -> float:
+        return self.timeouts.get(name, PROFILE_TIMEOUT_SECONDS)
+    
+    def cancel(self):
+        """Cancela as queries em andamento em todos os perfis"""
+        with self._lock:
+            active = list(self._active.values())
+        for db in active:
+            db.cancel()
+    
+    def run(self, query: str, filename: str, exporter, params: dict = None) -> int:
+        """
+        Executa a query em todos os perfis e grava uma saída consolidada
+        
+        A memória fica limitada a um lote por perfil em andamento, mais o
+        lote em gravação: os resultados passam por arquivos temporários.
+        Perfis com erro ou tempo esgotado ficam fora da saída; os demais
+        são gravados assim que terminam.
+        
+        Args:
+            query: String com a query SQL
+            filename: Nome do arquivo de saída
+            exporter: Exportador com export_chunks
+            params: Parâmetros nomeados da query (%(nome)s)
+            
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        if not ARROW_AVAILABLE:
+            print("❌ A extração em vários bancos requer o pacote pyarrow (pip install pyarrow)")
+            return -1
+        
+        print(f"🏢 Consultando {len(self.profiles)} bancos ({self.workers} por vez): "
+              f"{', '.join(self.profiles)}")
+        self.results = [ProfileResult(name) for name in self.profiles]
+        finished = queue.Queue()
+        temp = temp_filename(filename)
+        
+        with tempfile.TemporaryDirectory(prefix='oferta_perfis_') as spill_dir:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='oferta-perfil')
+            try:
+                for idx, result in enumerate(self.results):
+                    spill = os.path.join(spill_dir, f'perfil_{idx}.arrow')
+                    executor.submit(self._run_profile, result, query, params, spill, finished)
+                
+                with closing(self._consolidated(finished)) as chunks:
+                    first = next(chunks, None)
+                    if first is None:
+                        total_rows = 0
+                    else:
+                        total_rows = exporter.export_chunks(itertools.chain([first], chunks), temp)
+                if total_rows < 0:
+                    self.cancel()
+            except BaseException:
+                # Ctrl+C ou erro na gravação: não espera o tempo limite dos outros bancos
+                self.cancel()
+                remove_output(temp)
+                raise
+            finally:
+                executor.shutdown(wait=True)
+        
+        print("🏢 Resultado por banco:")
+        for result in self.results:
+            print(result.summary())
+        
+        if total_rows > 0:
+            replace_output(temp, filename)
+        else:
+            remove_output(temp)
+        return total_rows
+    
+    def _consolidated(self, finished: queue.Queue) -> Iterator[pd.DataFrame]:
+        """Lotes dos perfis concluídos com sucesso, na ordem em que terminam"""
+        for _ in range(len(self.results)):
+            result = finished.get()
+            if not result.ok or not result.rows:
+                continue
+            try:
+                yield from result.spill.chunks()
+            finally:
+                result.spill.remove()
+    
+    def _run_profile(self, result: ProfileResult, query: str, params: Optional[dict],
+                     spill: str, finished: queue.Queue):
+        """
+        Extrai um perfil para o arquivo temporário (executa em uma thread própria)
+        
+        O tempo limite cobre conexão, query e leitura: ao vencer, a query é
+        cancelada no servidor e o perfil fica fora da saída.
+        """
+        name = result.name
+        timeout = self.timeout(name)
+        db = DatabaseConnection(db_config={**self.profiles[name], 'connect_timeout': max(1, int(timeout))})
+        db.statement_timeout = timeout
+        timed_out = threading.Event()
+        
+        def expire():
+            timed_out.set()
+            db.cancel()
+        
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        start = time.perf_counter()
+        with self._lock:
+            self._active[name] = db
+        timer.start()
+        result.spill = SpillFile(spill)
+        try:
+            if not db.connect():
+                raise ConnectionError("não foi possível conectar (detalhes acima)")
+            result.rows = self._spill(db, name, query, params, result.spill)
+            result.status = 'ok'
+        except Exception as e:
+            # Falha isolada: os outros perfis continuam
+            result.status = 'tempo esgotado' if timed_out.is_set() or isinstance(e, TimeoutError) else 'erro'
+            result.error = str(e).strip() or type(e).__name__
+        finally:
+            timer.cancel()
+            result.seconds = time.perf_counter() - start
+            with self._lock:
+                self._active.pop(name, None)
+            db.close()
+            if not result.ok:
+                # Lotes parciais de um perfil que falhou não entram na saída
+                result.spill.remove()
+            finished.put(result)
+            print(result.summary().strip())
+    
+    def _spill(self, db: DatabaseConnection, name: str, query: str, params: Optional[dict],
+               spill: SpillFile) -> int:
+        """Grava os lotes do perfil, com a coluna de origem, no arquivo temporário"""
+        try:
+            with closing(db.stream_query(query, self.fetch_size, params=params)) as chunks:
+                for chunk in chunks:
+                    if chunk.empty:
+                        continue
+                    chunk.insert(0, SOURCE_COLUMN, name)
+                    spill.write(chunk)
+        finally:
+            spill.finish()
+        return spill.rows
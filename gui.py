@@ -4,13 +4,31 @@ Interface moderna e cross-platform (Windows 11 e macOS)
 """
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
+import argparse
+import importlib
 import threading
+import queue
+import sys
+import time
+import multiprocessing
 import os
 import json
-from datetime import datetime
-from database import DatabaseConnection
-from export_excel import ExcelExporter
-from config import OUTPUT_FILENAME, SQL_FILE
+from datetime import datetime, timedelta
+import metrics
+from metrics import format_age
+from query_params import query_params
+from config import (
+    SQL_FILE, PIPELINE_ENABLED, EXPORT_FORMAT, SPLIT_MODE, DIFF_ENABLED,
+    QUERY_LOCATIONS, PREPARED_STATEMENTS, PREFETCH_ENABLED, PREFETCH_INTERVAL_SECONDS,
+    PREFETCH_MAX_AGE_SECONDS, MEMORY_BUDGET_MB
+)
+
+# Dependências pesadas (pandas, openpyxl, psycopg2), importadas só depois
+# que a janela aparece
+WARM_UP_MODULES = ('database', 'pool', 'cache', 'exporters', 'pipeline', 'matview')
+
+# Espera após abrir a janela antes de iniciar o trabalho em segundo plano
+BACKGROUND_DELAY_MS = 100
 
 
 class OfertaRellampagoGUI:
@@ -31,7 +49,7 @@ class OfertaRellampagoGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Oferta Relâmpago")
-        self.root.geometry("500x550")
+        self.root.geometry("500x750" if PREFETCH_ENABLED else "500x710")
         self.root.resizable(False, False)
         self.root.configure(bg=self.COLOR_BG)
         
@@ -42,8 +60,76 @@ class OfertaRellampagoGUI:
         except:
             pass
         
+        # Cache local dos resultados da query e conexões reaproveitadas durante
+        # toda a sessão da janela; criados no primeiro uso (ver cache e pool)
+        self._cache = None
+        self._pool = None
+        
+        # Linhas da última extração (estimativa para a barra de progresso)
+        self.expected_rows = None
+        
+        # Cancelamento da extração em andamento (botão Cancelar ou fechar a janela)
+        self.cancel_event = threading.Event()
+        self.active_db = None
+        
+        # Caminho escolhido no diálogo, entregue à thread da extração
+        self.save_location = queue.Queue(maxsize=1)
+        self.dialog_closed = threading.Event()
+        
+        # Pré-carregamento: último resultado buscado em segundo plano
+        # (chave do cache, DataFrame, instante da busca)
+        self.prefetched = None
+        self.prefetch_key = None
+        self.prefetch_db = None
+        # Filtros lidos na thread da janela: as variáveis do Tk só podem ser
+        # lidas nela (ver read_filters)
+        self.prefetch_filters = None
+        self.prefetch_status = None
+        self.prefetch_done = threading.Event()
+        self.prefetch_done.set()
+        self.prefetch_wake = threading.Event()
+        self.prefetch_label_job = None
+        self.closing = threading.Event()
+        self.busy = threading.Event()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         self.setup_ui()
         self.load_last_extraction()
+        
+        # Com a janela já visível: imports pesados e pré-carregamento
+        self.root.after(BACKGROUND_DELAY_MS, self.warm_up)
+        if PREFETCH_ENABLED:
+            self.root.after(BACKGROUND_DELAY_MS, self.start_prefetch)
+    
+    @property
+    def cache(self):
+        """Cache local dos resultados (pandas só é importado aqui)"""
+        if self._cache is None:
+            from cache import ResultCache
+            self._cache = ResultCache()
+        return self._cache
+    
+    @property
+    def pool(self):
+        """Pool de conexões da sessão (psycopg2 só é importado aqui)"""
+        if self._pool is None:
+            from pool import ConnectionPool
+            self._pool = ConnectionPool()
+        return self._pool
+    
+    def warm_up(self):
+        """
+        Importa as dependências pesadas em segundo plano, com a janela já
+        visível, para que o primeiro clique não espere por elas
+        """
+        def _import():
+            for module in WARM_UP_MODULES:
+                try:
+                    importlib.import_module(module)
+                except ImportError as e:
+                    print(f"⚠️ Falha ao pré-carregar {module}: {e}")
+        
+        threading.Thread(target=_import, name="oferta-warmup", daemon=True).start()
     
     def setup_ui(self):
         """Configura a interface do usuário"""
@@ -86,6 +172,80 @@ class OfertaRellampagoGUI:
         )
         self.last_extraction_label.pack()
         
+        # Idade dos dados pré-carregados, com atualização manual
+        if PREFETCH_ENABLED:
+            prefetch_row = tk.Frame(info_card, bg=self.COLOR_SURFACE)
+            prefetch_row.pack(pady=(0, 12))
+            self.prefetch_label = tk.Label(
+                prefetch_row,
+                text="⏳ Pré-carregando dados...",
+                font=("Segoe UI", 9),
+                bg=self.COLOR_SURFACE,
+                fg=self.COLOR_TEXT_SECONDARY
+            )
+            self.prefetch_label.pack(side="left")
+            tk.Button(
+                prefetch_row,
+                text="🔄 Atualizar agora",
+                font=("Segoe UI", 9),
+                bg=self.COLOR_SURFACE,
+                fg=self.COLOR_TEXT,
+                activebackground=self.COLOR_PRIMARY_HOVER,
+                activeforeground="white",
+                relief="flat",
+                cursor="hand2",
+                command=self.refresh_prefetch,
+                bd=0,
+                highlightthickness=0
+            ).pack(side="left", padx=(10, 0))
+        
+        # Filtros da query (parâmetros de query.sql)
+        filters_frame = tk.Frame(main_frame, bg=self.COLOR_BG)
+        filters_frame.pack(fill="x", pady=(0, 15))
+        
+        tk.Label(
+            filters_frame,
+            text="Locais:",
+            font=("Segoe UI", 9),
+            bg=self.COLOR_BG,
+            fg=self.COLOR_TEXT_SECONDARY
+        ).pack(side="left")
+        
+        self.locations_var = tk.StringVar(value=QUERY_LOCATIONS)
+        self.locations_entry = tk.Entry(
+            filters_frame,
+            textvariable=self.locations_var,
+            font=("Consolas", 9),
+            bg=self.COLOR_SURFACE,
+            fg=self.COLOR_TEXT,
+            insertbackground=self.COLOR_TEXT,
+            relief="flat",
+            width=24
+        )
+        self.locations_entry.pack(side="left", padx=(5, 10), ipady=3)
+        
+        defaults = query_params()
+        self.produto_var = tk.BooleanVar(value=defaults['produto'])
+        self.ativo_var = tk.BooleanVar(value=defaults['ativo'])
+        for text, variable in (("Produto", self.produto_var), ("Ativo", self.ativo_var)):
+            tk.Checkbutton(
+                filters_frame,
+                text=text,
+                variable=variable,
+                font=("Segoe UI", 9),
+                bg=self.COLOR_BG,
+                fg=self.COLOR_TEXT_SECONDARY,
+                activebackground=self.COLOR_BG,
+                activeforeground=self.COLOR_TEXT,
+                selectcolor=self.COLOR_SURFACE,
+                bd=0,
+                highlightthickness=0
+            ).pack(side="left")
+        
+        # O pré-carregamento segue os filtros da janela
+        for variable in (self.locations_var, self.produto_var, self.ativo_var):
+            variable.trace_add('write', self.on_filters_changed)
+        
         # Botão principal
         self.download_button = tk.Button(
             main_frame,
@@ -108,6 +268,42 @@ class OfertaRellampagoGUI:
         self.download_button.bind("<Enter>", self.on_button_hover)
         self.download_button.bind("<Leave>", self.on_button_leave)
         
+        # Opção para ignorar o cache local
+        self.force_refresh_var = tk.BooleanVar(value=False)
+        self.force_refresh_check = tk.Checkbutton(
+            main_frame,
+            text="🔄 Forçar atualização (ignorar cache)",
+            variable=self.force_refresh_var,
+            font=("Segoe UI", 9),
+            bg=self.COLOR_BG,
+            fg=self.COLOR_TEXT_SECONDARY,
+            activebackground=self.COLOR_BG,
+            activeforeground=self.COLOR_TEXT,
+            selectcolor=self.COLOR_SURFACE,
+            bd=0,
+            highlightthickness=0
+        )
+        self.force_refresh_check.pack(anchor="w", pady=(8, 0))
+        
+        # Botão de cancelamento (habilitado durante a extração)
+        self.cancel_button = tk.Button(
+            main_frame,
+            text="✖ CANCELAR",
+            font=("Segoe UI", 10, "bold"),
+            bg=self.COLOR_SURFACE,
+            fg=self.COLOR_TEXT,
+            activebackground=self.COLOR_ERROR,
+            activeforeground="white",
+            disabledforeground=self.COLOR_TEXT_SECONDARY,
+            relief="flat",
+            cursor="hand2",
+            command=self.cancel_download,
+            state="disabled",
+            bd=0,
+            highlightthickness=0
+        )
+        self.cancel_button.pack(fill="x", ipady=4, pady=(8, 0))
+        
         # Label de status
         self.status_label = tk.Label(
             main_frame,
@@ -181,27 +377,86 @@ class OfertaRellampagoGUI:
             if os.path.exists(self.METADATA_FILE):
                 with open(self.METADATA_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
+                    self.expected_rows = data.get('rows')
                     last_date = data.get('last_extraction')
                     if last_date:
                         dt = datetime.fromisoformat(last_date)
                         formatted_date = dt.strftime("%d/%m/%Y às %H:%M")
-                        self.last_extraction_label.config(
-                            text=f"📅 Última extração: {formatted_date}"
-                        )
+                        text = f"📅 Última extração: {formatted_date}"
+                        
+                        # Indica se a extração usou o cache e a idade dos dados
+                        data_date = data.get('data_timestamp')
+                        if data.get('from_cache') and data_date:
+                            age = (dt - datetime.fromisoformat(data_date)).total_seconds()
+                            text += f"\n♻️ Servida do cache (dados de {format_age(age)} antes)"
+                        
+                        self.last_extraction_label.config(text=text)
         except Exception as e:
             print(f"Erro ao carregar última extração: {e}")
     
-    def save_last_extraction(self):
-        """Salva a data/hora da última extração bem-sucedida"""
+    def save_last_extraction(self, cache_age=None, rows=None, snapshot=None):
+        """
+        Salva a data/hora da última extração bem-sucedida
+        
+        Args:
+            cache_age: Idade (segundos) dos dados servidos do cache, ou None
+                se os dados vieram do banco
+            rows: Quantidade de linhas exportadas
+            snapshot: Snapshot desta extração (base do próximo relatório de
+                alterações); mantém o anterior se None
+        """
         try:
+            now = datetime.now()
+            data_timestamp = now - timedelta(seconds=cache_age or 0)
             data = {
-                'last_extraction': datetime.now().isoformat()
+                'last_extraction': now.isoformat(),
+                'from_cache': cache_age is not None,
+                'data_timestamp': data_timestamp.isoformat(),
+                'rows': rows,
+                'snapshot': snapshot or self.last_snapshot()
             }
             with open(self.METADATA_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2)
         except Exception as e:
             print(f"Erro ao salvar última extração: {e}")
     
+    def last_snapshot(self):
+        """
+        Snapshot registrado na última extração, se ainda existir
+        
+        Returns:
+            Caminho do snapshot ou None
+        """
+        try:
+            with open(self.METADATA_FILE, 'r', encoding='utf-8') as f:
+                path = json.load(f).get('snapshot')
+            return path if path and os.path.exists(path) else None
+        except (OSError, ValueError):
+            return None
+    
+    def report_changes(self, previous, current, file_path):
+        """
+        Gera o relatório de alterações em relação à extração anterior
+        
+        Args:
+            previous: Snapshot da extração anterior (ou None)
+            current: Snapshot desta extração (ou None)
+            file_path: Arquivo gerado (o relatório fica ao lado)
+        """
+        from snapshots import write_changes_report, format_summary
+        
+        if not current:
+            return
+        if not previous:
+            self.log_message("ℹ️ Primeira extração registrada; alterações a partir da próxima")
+            return
+        self.log_message("🔁 Comparando com a extração anterior...")
+        summary = write_changes_report(previous, current, file_path)
+        if summary:
+            self.log_message(format_summary(summary))
+        else:
+            self.log_message("⚠️ Não foi possível gerar o relatório de alterações")
+    
     def log_message(self, message, clear=False):
         """
         Adiciona uma mensagem ao log
@@ -226,71 +481,261 @@ class OfertaRellampagoGUI:
         self.log_message("", clear=True)
         
         # Desabilita o botão durante o processamento
+        self.cancel_event.clear()
         self.download_button.config(state="disabled", bg=self.COLOR_TEXT_SECONDARY)
+        self.cancel_button.config(state="normal")
         self.status_label.config(text="⏳ Processando...", fg=self.COLOR_TEXT)
+        self.progress.config(mode='indeterminate', value=0)
         self.progress.pack(pady=(10, 0))
         self.progress.start(10)
         
-        # Executa em thread para não travar a UI
-        thread = threading.Thread(target=self.download_spreadsheet, daemon=True)
+        self.busy.set()
+        
+        # Executa em thread para não travar a UI; a consulta começa enquanto
+        # o usuário escolhe onde salvar
+        self.save_location = queue.Queue(maxsize=1)
+        self.dialog_closed.clear()
+        thread = threading.Thread(
+            target=self.download_spreadsheet,
+            args=(self.read_filters(), self.force_refresh_var.get()),
+            daemon=True
+        )
         thread.start()
+        
+        self.ask_save_location()
+    
+    def cancel_download(self):
+        """Cancela a extração em andamento, inclusive a query no servidor"""
+        self.cancel_button.config(state="disabled")
+        self.status_label.config(text="🛑 Cancelando...", fg=self.COLOR_TEXT)
+        self.log_message("🛑 Cancelando extração...")
+        self.cancel_extraction()
+    
+    def cancel_extraction(self):
+        """
+        Sinaliza o cancelamento e interrompe a query do clique no servidor
+        
+        O pré-carregamento continua: o clique que o espera para na próxima
+        verificação (ver take_prefetched).
+        """
+        self.cancel_event.set()
+        db = self.active_db
+        if db:
+            db.cancel()
+    
+    def check_cancelled(self):
+        """
+        Interrompe a extração se o cancelamento foi pedido
+        
+        Raises:
+            ExtractionCancelled: Se o botão Cancelar foi clicado
+        """
+        if self.cancel_event.is_set():
+            from database import ExtractionCancelled
+            raise ExtractionCancelled("Extração cancelada pelo usuário")
+    
+    def open_database(self, connection):
+        """
+        Envolve a conexão em um DatabaseConnection que o botão Cancelar alcança
+        
+        Args:
+            connection: Conexão emprestada do pool
+            
+        Returns:
+            DatabaseConnection registrado como a extração em andamento
+        """
+        from database import DatabaseConnection
+        from matview import report_staleness
+        
+        # Com MATVIEW_ENABLED, mostra há quanto tempo a visão foi atualizada
+        report_staleness(connection, log=self.log_message)
+        db = DatabaseConnection(connection)
+        self.active_db = db
+        # Cancelado antes do registro: a primeira leitura já é interrompida
+        if self.cancel_event.is_set():
+            db.cancel()
+        return db
     
-    def download_spreadsheet(self):
-        """Executa o processo de extração e geração da planilha"""
+    def publish_output(self, temp, file_path):
+        """
+        Move o arquivo gerado para o destino escolhido
+        
+        A exportação grava em um arquivo temporário; se a extração foi
+        cancelada durante a gravação, ele é descartado e o destino não muda.
+        
+        Args:
+            temp: Arquivo gerado
+            file_path: Destino escolhido pelo usuário
+            
+        Raises:
+            ExtractionCancelled: Se o botão Cancelar foi clicado
+        """
+        from database import ExtractionCancelled
+        from exporters import replace_output, remove_output
+        
+        if self.cancel_event.is_set():
+            remove_output(temp)
+            raise ExtractionCancelled("Extração cancelada pelo usuário")
+        try:
+            replace_output(temp, file_path)
+        except OSError:
+            remove_output(temp)
+            raise
+    
+    def download_spreadsheet(self, filters, force_refresh=False):
+        """
+        Executa o processo de extração e geração da planilha
+        
+        Args:
+            filters: Filtros da janela no clique (ver read_filters)
+            force_refresh: Se True, ignora o cache e o pré-carregamento
+        """
+        try:
+            with metrics.RunMetrics() as run:
+                self._download_spreadsheet(run, filters, force_refresh)
+        finally:
+            self.busy.clear()
+    
+    def read_filters(self):
+        """
+        Filtros escolhidos na janela (executa na thread da janela)
+        
+        Returns:
+            Tupla (locais, produto, ativo) com os valores das variáveis do Tk
+        """
+        return self.locations_var.get(), self.produto_var.get(), self.ativo_var.get()
+    
+    def on_filters_changed(self, *args):
+        """Guarda os filtros alterados para o próximo pré-carregamento"""
+        self.prefetch_filters = self.read_filters()
+    
+    def current_query(self, filters):
+        """
+        Query SQL e parâmetros para os filtros da janela
+        
+        Args:
+            filters: Filtros lidos por read_filters
+            
+        Returns:
+            Tupla (query, parâmetros)
+        """
+        with open(SQL_FILE, 'r', encoding='utf-8') as f:
+            query = f.read()
+        return query, query_params(*filters)
+    
+    def _download_spreadsheet(self, run, filters, force_refresh):
+        """
+        Etapas da extração, medidas por `run`
+        
+        Args:
+            run: Métricas da execução (metrics.RunMetrics)
+            filters: Filtros da janela no clique (ver read_filters)
+            force_refresh: Se True, ignora o cache e o pré-carregamento
+        """
+        # Já carregados pelo warm_up, salvo em um clique logo ao abrir
+        from database import ExtractionCancelled
+        from exporters import get_exporter, format_from_path, temp_filename, remove_output
+        
         try:
             self.log_message("🚀 Iniciando processo de extração...")
             
-            # Carrega a query SQL
+            # Carrega a query SQL e os filtros escolhidos na janela
             self.log_message("📄 Carregando query SQL...")
-            with open(SQL_FILE, 'r', encoding='utf-8') as f:
-                query = f.read()
+            query, params = self.current_query(filters)
             
-            # Conecta ao banco e executa query
-            self.log_message("🔌 Conectando ao banco de dados...")
-            with DatabaseConnection() as db:
-                if not db.connection:
-                    self.log_message("❌ Falha na conexão com o banco de dados")
-                    self.show_error("Erro ao conectar ao banco de dados.\nVerifique suas credenciais no arquivo .env")
-                    return
-                
-                self.log_message("✅ Conectado com sucesso!")
-                self.log_message("🔍 Consultando dados...")
-                
-                # Executa a query
-                df = db.execute_query(query)
-                
-                if df is None or df.empty:
-                    self.log_message("⚠️ Nenhum dado retornado pela query")
-                    self.show_error("Nenhum dado foi retornado pela query.")
-                    return
-                
-                self.log_message(f"✅ {len(df)} registros encontrados!")
+            # Dados já buscados em segundo plano saem direto para a exportação
+            prefetched = None if force_refresh else self.take_prefetched(query, params)
+            self.check_cancelled()
             
-            self.log_message("📊 Extraindo dados...")
+            # A separação por local precisa do resultado completo, sem pipeline
+            if prefetched is None and PIPELINE_ENABLED and not SPLIT_MODE and (force_refresh or not self.cache.is_fresh(self.cache.fingerprint(query, params))):
+                # Busca e exportação sobrepostas, direto do banco
+                run.mode = 'pipeline'
+                self.download_pipelined(query, run, params)
+                return
             
-            # Pergunta onde salvar o arquivo
-            self.log_message("💾 Aguardando seleção do local de salvamento...")
-            file_path = self.ask_save_location()
+            if prefetched is None and MEMORY_BUDGET_MB and not SPLIT_MODE and (force_refresh or not self.cache.is_fresh(self.cache.fingerprint(query, params))):
+                # Lotes dentro do orçamento de memória; o excedente vai para disco
+                run.mode = 'orcamento'
+                self.download_bounded(query, run, params)
+                return
             
-            if not file_path:
-                self.log_message("⚠️ Operação cancelada pelo usuário")
-                self.reset_ui()
+            if prefetched is not None:
+                df, cache_age = prefetched
+                run.mode = 'prefetch'
+                self.log_message(f"⚡ Dados pré-carregados (de {format_age(cache_age)} atrás)")
+            else:
+                # Busca os dados no cache local ou no banco
+                df, cache_age = self.cache.get_or_fetch(
+                    query,
+                    lambda: self.fetch_from_database(query, params),
+                    force_refresh=force_refresh,
+                    params=params
+                )
+                if PREFETCH_ENABLED and cache_age is None and df is not None and not df.empty:
+                    # Busca nova: passa a ser o dado pré-carregado
+                    self.prefetched = (self.cache.fingerprint(query, params), df, time.time())
+                    self.root.after(0, self.update_prefetch_label)
+            self.check_cancelled()
+            
+            if df is None or df.empty:
+                self.log_message("⚠️ Nenhum dado retornado pela query")
+                self.show_error("Nenhum dado foi retornado pela query.")
                 return
             
+            if cache_age is not None and prefetched is None:
+                run.mode = 'cache'
+                self.log_message(f"♻️ Dados servidos do cache (de {format_age(cache_age)} atrás)")
+            self.log_message(f"✅ {len(df)} registros encontrados!")
+            
+            # Caminho escolhido no diálogo aberto no clique (normalmente já pronto)
+            file_path = self.wait_save_location()
+            
             self.log_message(f"💾 Salvando em: {file_path}")
+            self.check_cancelled()
             
-            # Exporta para Excel
-            success = ExcelExporter.export_data(df, file_path)
+            if SPLIT_MODE:
+                # Uma aba ou um arquivo por local, mais o índice
+                from split import LocationSplitter
+                self.log_message(f"🗂️ Separando por local de armazenagem ({SPLIT_MODE})...")
+                splitter = LocationSplitter(export_format=format_from_path(file_path))
+                success = splitter.export(df, file_path) > 0
+                if success:
+                    self.log_message(f"📇 Índice: {LocationSplitter.index_path(file_path)}")
+            else:
+                # Exporta no formato escolhido pela extensão do arquivo
+                temp = temp_filename(file_path)
+                success = get_exporter(format_from_path(file_path)).export_data(df, temp)
+                if success:
+                    self.publish_output(temp, file_path)
+                else:
+                    remove_output(temp)
             
             if success:
                 self.log_message("✅ Planilha gerada com sucesso!")
-                self.save_last_extraction()
+                snapshot = None
+                if DIFF_ENABLED:
+                    from snapshots import SnapshotStore
+                    previous = self.last_snapshot()
+                    snapshot = SnapshotStore().save(df)
+                    self.report_changes(previous, snapshot, file_path)
+                self.report_metrics(run)
+                self.save_last_extraction(cache_age, rows=len(df), snapshot=snapshot)
                 self.show_success(f"Planilha gerada com sucesso!\n\n📁 {file_path}")
                 self.load_last_extraction()
             else:
                 self.log_message("❌ Erro ao gerar planilha")
                 self.show_error("Falha ao gerar planilha.")
         
+        except ExtractionCancelled:
+            self.log_message("🛑 Extração cancelada; nenhum arquivo foi gerado")
+            self.show_cancelled()
+        except TimeoutError as e:
+            self.log_message(f"⏱️ {e}")
+            self.show_error(f"A consulta demorou demais e foi interrompida.\n{e}")
+        except ConnectionError:
+            self.log_message("❌ Falha na conexão com o banco de dados")
+            self.show_error("Erro ao conectar ao banco de dados.\nVerifique suas credenciais no arquivo .env")
         except FileNotFoundError:
             self.log_message(f"❌ Arquivo {SQL_FILE} não encontrado")
             self.show_error(f"Arquivo {SQL_FILE} não encontrado!")
@@ -298,27 +743,448 @@ class OfertaRellampagoGUI:
             self.log_message(f"❌ Erro: {str(e)}")
             self.show_error(f"Erro inesperado:\n{str(e)}")
     
-    def ask_save_location(self):
-        """Abre dialog para usuário escolher onde salvar o arquivo"""
-        def show_dialog():
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                initialfile=OUTPUT_FILENAME,
-                title="Salvar planilha como"
+    def download_pipelined(self, query, run, params=None):
+        """
+        Busca os lotes enquanto o diálogo está aberto e grava a planilha à
+        medida que chegam
+        
+        A busca começa no clique: os lotes esperam na fila limitada do
+        pipeline até o caminho ser escolhido, e a gravação começa em seguida.
+        
+        Args:
+            query: String com a query SQL
+            run: Métricas da execução (metrics.RunMetrics)
+            params: Parâmetros nomeados da query
+        """
+        from exporters import get_exporter, format_from_path, temp_filename
+        from pipeline import ExportPipeline
+        
+        store, writer, previous = self.new_snapshot_writer()
+        connection = self.acquire_connection()
+        total_rows = -1
+        try:
+            self.log_message("🔀 Consultando e gravando em paralelo...")
+            self.start_row_progress()
+            pipeline = ExportPipeline(
+                on_progress=self.update_row_progress,
+                on_batch=writer.write if writer else None
             )
-            self.selected_file_path = file_path
+            pipeline.start(self.open_database(connection), query, params)
+            try:
+                # Caminho escolhido no diálogo aberto no clique
+                file_path = self.wait_save_location()
+                self.log_message(f"💾 Salvando em: {file_path}")
+                
+                temp = temp_filename(file_path)
+                exporter = get_exporter(format_from_path(file_path))
+                total_rows = pipeline.export(temp, exporter)
+            finally:
+                pipeline.close()
+            if total_rows > 0:
+                self.publish_output(temp, file_path)
+        finally:
+            self.active_db = None
+            self.pool.release(connection)
+            if writer:
+                writer.close(keep=total_rows > 0)
+        
+        self.finish_streamed(run, file_path, total_rows, store, writer, previous)
+    
+    def download_bounded(self, query, run, params=None):
+        """
+        Busca dentro do orçamento de memória (MEMORY_BUDGET_MB) e grava a
+        planilha a partir dos lotes guardados
+        
+        Acima do orçamento os lotes vão para um arquivo temporário; a conexão
+        volta ao pool antes da gravação, que lê o arquivo lote a lote.
+        
+        Args:
+            query: String com a query SQL
+            run: Métricas da execução (metrics.RunMetrics)
+            params: Parâmetros nomeados da query
+        """
+        from exporters import get_exporter, format_from_path, temp_filename, remove_output
+        from spill import SpillBuffer
+        
+        store, writer, previous = self.new_snapshot_writer()
+        total_rows = -1
+        try:
+            with SpillBuffer(MEMORY_BUDGET_MB) as buffer:
+                connection = self.acquire_connection()
+                try:
+                    self.log_message("🔍 Consultando dados...")
+                    # Cursor server-side: o statement preparado traria o resultado inteiro de uma vez
+                    chunks = self.open_database(connection).stream_query(query, params=params)
+                    buffer.extend(chunks, writer.write if writer else None)
+                finally:
+                    self.active_db = None
+                    self.pool.release(connection)
+                self.check_cancelled()
+                
+                if buffer.rows:
+                    self.log_message(f"✅ {buffer.rows} registros encontrados!")
+                    self.log_message(buffer.describe())
+                    buffer.record_metrics()
+                    
+                    # Caminho escolhido no diálogo aberto no clique (normalmente já pronto)
+                    file_path = self.wait_save_location()
+                    self.log_message(f"💾 Salvando em: {file_path}")
+                    
+                    temp = temp_filename(file_path)
+                    exporter = get_exporter(format_from_path(file_path))
+                    total_rows = exporter.export_chunks(self.cancellable(buffer.chunks()), temp)
+                    if total_rows > 0:
+                        self.publish_output(temp, file_path)
+                    else:
+                        remove_output(temp)
+                        self.check_cancelled()
+                else:
+                    total_rows = 0
+                    file_path = None
+        finally:
+            if writer:
+                writer.close(keep=total_rows > 0)
+        
+        self.finish_streamed(run, file_path, total_rows, store, writer, previous)
+    
+    def cancellable(self, chunks):
+        """Repassa os lotes, parando no seguinte se o botão Cancelar foi clicado"""
+        for chunk in chunks:
+            self.check_cancelled()
+            yield chunk
+    
+    def new_snapshot_writer(self):
+        """
+        Gravador do snapshot lote a lote, para o relatório de alterações
+        
+        Returns:
+            Tupla (SnapshotStore, SnapshotWriter, snapshot anterior), com
+            None nos itens quando DIFF_ENABLED está desligado
+        """
+        if not DIFF_ENABLED:
+            return None, None, None
+        from snapshots import SnapshotStore
+        store = SnapshotStore()
+        previous = self.last_snapshot()
+        writer = store.new_writer() if store.enabled else None
+        return store, writer, previous
+    
+    def finish_streamed(self, run, file_path, total_rows, store=None, writer=None, previous=None):
+        """
+        Relatório de alterações, métricas e mensagens ao fim de uma gravação
+        lote a lote
+        
+        Args:
+            run: Métricas da execução (metrics.RunMetrics)
+            file_path: Arquivo gerado
+            total_rows: Linhas gravadas (0 = sem dados, -1 = erro)
+            store: SnapshotStore da extração (ou None)
+            writer: SnapshotWriter já fechado (ou None)
+            previous: Snapshot da extração anterior (ou None)
+        """
+        snapshot = None
+        if writer and total_rows > 0:
+            store.prune()
+            snapshot = writer.path
+            self.report_changes(previous, snapshot, file_path)
+        
+        if total_rows > 0:
+            self.log_message(f"✅ {total_rows} registros exportados!")
+            self.log_message("✅ Planilha gerada com sucesso!")
+            self.report_metrics(run)
+            self.save_last_extraction(rows=total_rows, snapshot=snapshot)
+            self.show_success(f"Planilha gerada com sucesso!\n\n📁 {file_path}")
+            self.load_last_extraction()
+        elif total_rows == 0:
+            self.log_message("⚠️ Nenhum dado retornado pela query")
+            self.show_error("Nenhum dado foi retornado pela query.")
+        else:
+            self.log_message("❌ Erro ao gerar planilha")
+            self.show_error("Falha ao gerar planilha.")
+    
+    def report_metrics(self, run):
+        """
+        Mostra o resumo de tempos no log e grava o registro no histórico
+        
+        Args:
+            run: Métricas da execução (metrics.RunMetrics)
+        """
+        for line in run.summary_lines():
+            self.log_message(line)
+        run.save()
+    
+    def start_row_progress(self):
+        """Troca a barra para progresso real quando há estimativa de linhas"""
+        expected_rows = self.expected_rows
+        
+        def _start():
+            if expected_rows:
+                self.progress.stop()
+                self.progress.config(mode='determinate', maximum=expected_rows, value=0)
+        
+        self.root.after(0, _start)
+    
+    def update_row_progress(self, rows):
+        """
+        Atualiza a barra e o status com as linhas já processadas
+        
+        Args:
+            rows: Total de linhas exportadas até o momento
+        """
+        def _update():
+            if str(self.progress.cget('mode')) == 'determinate':
+                self.progress.config(value=min(rows, self.progress.cget('maximum')))
+            self.status_label.config(text=f"⏳ {rows:,} linhas processadas".replace(',', '.'))
         
-        # Executa na thread principal
-        self.selected_file_path = None
-        self.root.after(0, show_dialog)
+        self.root.after(0, _update)
+    
+    def acquire_connection(self):
+        """
+        Obtém uma conexão do pool e registra no log o tempo de conexão
         
-        # Aguarda a seleção
-        while self.selected_file_path is None:
-            import time
-            time.sleep(0.1)
+        Returns:
+            Conexão psycopg2 (devolver com self.pool.release)
+            
+        Raises:
+            ConnectionError: Se não for possível conectar ao banco
+            ExtractionCancelled: Se o botão Cancelar foi clicado
+        """
+        import psycopg2
         
-        return self.selected_file_path
+        # Não reabre o pool depois de Cancelar (ou de fechar a janela)
+        self.check_cancelled()
+        self.log_message("🔌 Conectando ao banco de dados...")
+        try:
+            with metrics.stage('connect'):
+                connection = self.pool.acquire()
+        except psycopg2.Error as e:
+            print(f"❌ Erro ao conectar ao banco de dados: {e}")
+            raise ConnectionError("Falha na conexão com o banco de dados") from e
+        
+        elapsed_ms = self.pool.last_acquire_seconds * 1000
+        origin = "nova conexão" if self.pool.last_acquire_new else "conexão reutilizada"
+        self.log_message(f"✅ Conectado em {elapsed_ms:.0f} ms ({origin})")
+        return connection
+    
+    def fetch_from_database(self, query, params=None):
+        """
+        Conecta ao banco e executa a query
+        
+        Conexões do pool são reaproveitadas entre cliques, então a query é
+        preparada no servidor uma vez e executada de novo só com os valores.
+        Se a conexão cair durante a consulta, ela é repetida uma vez em uma
+        conexão nova.
+        
+        Args:
+            query: String com a query SQL
+            params: Parâmetros nomeados da query
+            
+        Returns:
+            DataFrame com os resultados ou None em caso de erro
+            
+        Raises:
+            ConnectionError: Se não for possível conectar ao banco
+        """
+        def query_once(connection):
+            try:
+                self.log_message("🔍 Consultando dados...")
+                
+                # Executa a query (o botão Cancelar a interrompe no servidor)
+                return self.open_database(connection).execute_query(
+                    query, params=params, prepared=PREPARED_STATEMENTS
+                )
+            finally:
+                self.active_db = None
+        
+        # Conexão que cai no meio da query: repete uma vez em outra conexão
+        return self.pool.run(query_once, acquire=self.acquire_connection)
+    
+    def start_prefetch(self):
+        """Inicia o pré-carregamento em segundo plano"""
+        self.prefetch_filters = self.read_filters()
+        threading.Thread(target=self.prefetch_loop, name="oferta-prefetch", daemon=True).start()
+        self.update_prefetch_label()
+    
+    def prefetch_loop(self):
+        """
+        Busca os dados ao abrir a janela e a cada PREFETCH_INTERVAL_SECONDS
+        (executa em uma thread própria)
+        """
+        while not self.closing.is_set():
+            if not self.busy.is_set():
+                # Execução própria no histórico de métricas, fora da do clique
+                with metrics.RunMetrics(mode='prefetch') as run:
+                    self.prefetch()
+                if self.prefetch_status == 'ok':
+                    run.save()
+            self.prefetch_wake.wait(PREFETCH_INTERVAL_SECONDS or None)
+            self.prefetch_wake.clear()
+    
+    def prefetch(self):
+        """Executa a query em segundo plano e guarda o resultado em memória e no cache"""
+        from database import DatabaseConnection, ExtractionCancelled
+        
+        self.prefetch_done.clear()
+        self.prefetch_status = None
+        self.root.after(0, self.update_prefetch_label)
+        try:
+            query, params = self.current_query(self.prefetch_filters)
+            key = self.cache.fingerprint(query, params)
+            # O clique só espera por esta busca se os filtros forem os mesmos
+            self.prefetch_key = key
+            
+            def acquire():
+                # Não reabre o pool depois de fechar a janela
+                if self.closing.is_set():
+                    raise ExtractionCancelled("Janela fechada")
+                return self.pool.acquire()
+            
+            def query_once(connection):
+                self.prefetch_db = DatabaseConnection(connection)
+                try:
+                    return self.prefetch_db.execute_query(query, params=params, prepared=PREPARED_STATEMENTS)
+                finally:
+                    self.prefetch_db = None
+            
+            # Conexão que cai no meio da query: repete uma vez em outra conexão
+            df = self.pool.run(query_once, acquire=acquire)
+            
+            if df is not None and not df.empty:
+                self.cache.put(key, df)
+                self.prefetched = (key, df, time.time())
+                self.prefetch_status = 'ok'
+            else:
+                self.prefetch_status = 'erro'
+        except ExtractionCancelled:
+            self.prefetch_status = None
+        except Exception as e:
+            print(f"⚠️ Falha no pré-carregamento: {e}")
+            self.prefetch_status = 'erro'
+        finally:
+            self.prefetch_done.set()
+            self.prefetch_key = None
+            if not self.closing.is_set():
+                self.root.after(0, self.update_prefetch_label)
+    
+    def take_prefetched(self, query, params):
+        """
+        Dados pré-carregados para a query e filtros atuais, se houver
+        
+        Se o pré-carregamento em andamento for da mesma query e filtros,
+        espera por ele em vez de executar a query uma segunda vez; com outros
+        filtros, não espera. Dados mais velhos que PREFETCH_MAX_AGE_SECONDS
+        são descartados.
+        
+        Args:
+            query: String com a query SQL
+            params: Parâmetros nomeados da query
+            
+        Returns:
+            Tupla (DataFrame, idade em segundos) ou None
+            
+        Raises:
+            ExtractionCancelled: Se o botão Cancelar foi clicado durante a espera
+        """
+        if not PREFETCH_ENABLED:
+            return None
+        key = self.cache.fingerprint(query, params)
+        if not self.prefetch_done.is_set() and self.prefetch_key == key:
+            self.log_message("⏳ Aguardando o pré-carregamento em andamento...")
+            with metrics.stage('prefetch_wait'):
+                # Cancelar não interrompe o pré-carregamento, só a espera
+                while not self.prefetch_done.wait(0.2):
+                    self.check_cancelled()
+        
+        prefetched = self.prefetched
+        if prefetched is None or prefetched[0] != key:
+            return None
+        _, df, fetched_at = prefetched
+        age = time.time() - fetched_at
+        if PREFETCH_MAX_AGE_SECONDS and age > PREFETCH_MAX_AGE_SECONDS:
+            self.log_message(f"⌛ Dados pré-carregados há {format_age(age)}: buscando de novo...")
+            return None
+        return df, age
+    
+    def refresh_prefetch(self):
+        """Pede uma nova busca em segundo plano imediatamente"""
+        if self.prefetch_done.is_set() and not self.busy.is_set():
+            self.prefetch_wake.set()
+    
+    def update_prefetch_label(self):
+        """Mostra a idade dos dados pré-carregados (atualizado a cada 30 s)"""
+        if not PREFETCH_ENABLED or self.closing.is_set():
+            return
+        if not self.prefetch_done.is_set():
+            text = "⏳ Pré-carregando dados..."
+        elif self.prefetch_status == 'erro':
+            text = "⚠️ Falha no pré-carregamento"
+        elif self.prefetched is not None:
+            text = f"⚡ Dados pré-carregados há {format_age(time.time() - self.prefetched[2])}"
+        else:
+            text = "⏸️ Dados não pré-carregados"
+        self.prefetch_label.config(text=text)
+        
+        if self.prefetch_label_job:
+            self.root.after_cancel(self.prefetch_label_job)
+        self.prefetch_label_job = self.root.after(30000, self.update_prefetch_label)
+    
+    def on_close(self):
+        """Cancela a extração em andamento, fecha as conexões do pool e encerra a janela"""
+        try:
+            # Sem isso, a query continuaria rodando no servidor após fechar a janela
+            self.closing.set()
+            self.prefetch_wake.set()
+            self.cancel_extraction()
+            prefetch_db = self.prefetch_db
+            if prefetch_db:
+                prefetch_db.cancel()
+            self.dialog_closed.set()
+            if self._pool is not None:
+                self._pool.close()
+        finally:
+            self.root.destroy()
+    
+    def ask_save_location(self):
+        """
+        Abre o diálogo de salvamento (thread principal) e entrega o caminho
+        escolhido à thread da extração pela fila save_location
+        
+        Cancelar o diálogo cancela a extração, inclusive a query que já
+        estiver rodando no servidor.
+        """
+        from exporters import EXPORTERS, output_filename, save_dialog_filetypes
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=EXPORTERS[EXPORT_FORMAT][1],
+            filetypes=save_dialog_filetypes(),
+            initialfile=output_filename(),
+            title="Salvar planilha como"
+        )
+        if not file_path:
+            self.log_message("⚠️ Operação cancelada pelo usuário")
+            self.cancel_extraction()
+        self.save_location.put(file_path or None)
+        self.dialog_closed.set()
+    
+    def wait_save_location(self):
+        """
+        Espera o caminho escolhido no diálogo (executa na thread da extração)
+        
+        Returns:
+            Caminho do arquivo de saída
+            
+        Raises:
+            ExtractionCancelled: Se o diálogo foi cancelado
+        """
+        if not self.dialog_closed.is_set():
+            self.log_message("💾 Aguardando seleção do local de salvamento...")
+        # Só o tempo que o diálogo ainda ficou aberto após a busca
+        with metrics.stage('dialog'):
+            file_path = self.save_location.get()
+        if not file_path:
+            from database import ExtractionCancelled
+            raise ExtractionCancelled("Operação cancelada pelo usuário")
+        return file_path
     
     def reset_ui(self):
         """Reseta a interface para o estado inicial"""
@@ -327,9 +1193,21 @@ class OfertaRellampagoGUI:
             self.progress.pack_forget()
             self.status_label.config(text="")
             self.download_button.config(state="normal", bg=self.COLOR_PRIMARY)
+            self.cancel_button.config(state="disabled")
         
         self.root.after(0, _reset)
     
+    def show_cancelled(self):
+        """Volta a interface ao estado inicial após um cancelamento"""
+        def _cancelled():
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.status_label.config(text="🛑 Cancelado", fg=self.COLOR_TEXT_SECONDARY)
+            self.download_button.config(state="normal", bg=self.COLOR_PRIMARY)
+            self.cancel_button.config(state="disabled")
+        
+        self.root.after(0, _cancelled)
+    
     def show_success(self, message):
         """Mostra mensagem de sucesso"""
         self.root.after(0, lambda: self._show_success_ui(message))
@@ -340,11 +1218,13 @@ class OfertaRellampagoGUI:
         self.progress.pack_forget()
         self.status_label.config(text="✅ Concluído!", fg=self.COLOR_SUCCESS)
         self.download_button.config(state="normal", bg=self.COLOR_PRIMARY)
+        self.cancel_button.config(state="disabled")
         messagebox.showinfo("Sucesso", message)
         self.status_label.config(text="")
     
     def show_error(self, message):
-        """Mostra mensagem de erro"""
+        """Mostra mensagem de erro (depois que o diálogo de salvamento fechar)"""
+        self.dialog_closed.wait()
         self.root.after(0, lambda: self._show_error_ui(message))
     
     def _show_error_ui(self, message):
@@ -353,12 +1233,49 @@ class OfertaRellampagoGUI:
         self.progress.pack_forget()
         self.status_label.config(text="❌ Erro!", fg=self.COLOR_ERROR)
         self.download_button.config(state="normal", bg=self.COLOR_PRIMARY)
+        self.cancel_button.config(state="disabled")
         messagebox.showerror("Erro", message)
         self.status_label.config(text="")
 
 
+def parse_args():
+    """Lê os argumentos da linha de comando"""
+    parser = argparse.ArgumentParser(description="Oferta Relâmpago - interface gráfica")
+    parser.add_argument(
+        '--startup-time',
+        action='store_true',
+        help="Mede o tempo até a janela aparecer, grava no histórico de métricas e fecha"
+    )
+    return parser.parse_args()
+
+
+def report_startup(imports_done: float):
+    """
+    Mostra e grava no histórico o tempo de abertura da janela
+    
+    Args:
+        imports_done: Segundos desde o início do processo até o fim dos imports
+    """
+    window_shown = metrics.process_uptime()
+    run = metrics.RunMetrics(mode='startup')
+    run.add_time('imports', imports_done)
+    run.add_time('window', window_shown - imports_done)
+    run.total_seconds = window_shown
+    
+    for line in run.summary_lines():
+        print(line)
+    loaded = [name for name in ('pandas', 'openpyxl', 'psycopg2', 'pyarrow') if name in sys.modules]
+    print(f"📦 Carregados antes da janela: {', '.join(loaded) or 'nenhuma dependência pesada'}")
+    run.save()
+
+
 def main():
     """Função principal"""
+    # Necessário para o pool de processos no executável (PyInstaller)
+    multiprocessing.freeze_support()
+    args = parse_args()
+    imports_done = metrics.process_uptime()
+    
     root = tk.Tk()
     app = OfertaRellampagoGUI(root)
     
@@ -370,6 +1287,13 @@ def main():
     y = (root.winfo_screenheight() // 2) - (height // 2)
     root.geometry(f'{width}x{height}+{x}+{y}')
     
+    if args.startup_time:
+        # Desenha a janela e mede, sem esperar o trabalho em segundo plano
+        root.update()
+        report_startup(imports_done)
+        root.destroy()
+        return
+    
     root.mainloop()
 
 
@@ -2,11 +2,20 @@
 Script principal - Gerador de Planilha Oferta Relâmpago
 Extrai dados do PostgreSQL e gera planilha Excel formatada
 """
+import argparse
+import multiprocessing
 import os
 import sys
+import metrics
+from cache import ResultCache
 from database import DatabaseConnection
-from export_excel import ExcelExporter
-from config import OUTPUT_FILENAME, SQL_FILE
+from exporters import EXPORTERS, get_exporter, output_filename, temp_filename, replace_output, remove_output
+from matview import report_staleness
+from query_params import query_params
+from config import (
+    SQL_FILE, PARALLEL_EXTRACTION, PIPELINE_ENABLED, EXPORT_FORMAT, SPLIT_MODE, DIFF_ENABLED, MATVIEW_ENABLED,
+    MEMORY_BUDGET_MB
+)
 
 
 def load_sql_query(sql_file: str) -> str:
@@ -31,15 +40,122 @@ def load_sql_query(sql_file: str) -> str:
         sys.exit(1)
 
 
-def main():
-    """Função principal do script"""
-    print("=" * 60)
-    print("🚀 GERADOR DE PLANILHA OFERTA RELÂMPAGO")
-    print("=" * 60)
-    print()
+def parse_args():
+    """Lê os argumentos da linha de comando"""
+    parser = argparse.ArgumentParser(description="Gerador de Planilha Oferta Relâmpago")
+    parser.add_argument(
+        '--parallel',
+        action='store_true',
+        default=PARALLEL_EXTRACTION,
+        help="Executa a query em paralelo, particionada por local de armazenagem"
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help="Ignora o cache local e busca os dados direto no banco"
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        default=PIPELINE_ENABLED,
+        help="Sobrepõe a busca no banco e a gravação da planilha (memória limitada)"
+    )
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        default=MEMORY_BUDGET_MB,
+        metavar='MB',
+        help="Orçamento de memória para os dados buscados; o excedente vai para um arquivo "
+             "temporário e a exportação lê desse arquivo (padrão: MEMORY_BUDGET_MB; 0 = sem limite)"
+    )
+    parser.add_argument(
+        '--format',
+        choices=sorted(EXPORTERS),
+        default=EXPORT_FORMAT,
+        help="Formato do arquivo de saída (padrão: xlsx formatado)"
+    )
+    parser.add_argument(
+        '--split',
+        choices=['sheets', 'files'],
+        default=SPLIT_MODE or None,
+        help="Separa por local de armazenagem: uma aba ('sheets') ou um arquivo ('files') por local"
+    )
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        default=DIFF_ENABLED,
+        help="Gera o relatório de alterações em relação à extração anterior"
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help="Executa continuamente, regenerando o arquivo só quando os dados mudam"
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        help="Segundos entre execuções no modo --daemon (padrão: DAEMON_INTERVAL_SECONDS)"
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help="Serve a planilha por HTTP, gerada em memória e compartilhada entre pedidos simultâneos"
+    )
+    parser.add_argument(
+        '--host',
+        help="Endereço do modo --serve (padrão: SERVER_HOST)"
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        help="Porta do modo --serve (padrão: SERVER_PORT)"
+    )
+    parser.add_argument(
+        '--profiles',
+        nargs='*',
+        metavar='PERFIL',
+        help="Consulta ao mesmo tempo os bancos dos perfis de DB_PROFILES (sem nomes: todos) "
+             "e consolida uma saída com a coluna 'origem'"
+    )
+    parser.add_argument(
+        '--locais',
+        help="Códigos dos locais de armazenagem, separados por vírgula (padrão: QUERY_LOCATIONS)"
+    )
+    parser.add_argument(
+        '--produto',
+        help="Filtro m.produto: true ou false (padrão: QUERY_PRODUTO)"
+    )
+    parser.add_argument(
+        '--ativo',
+        help="Filtro m.ativo: true ou false (padrão: QUERY_ATIVO)"
+    )
+    parser.add_argument(
+        '--output',
+        help="Caminho do arquivo de saída (padrão: Oferta_Relampago com a extensão do formato)"
+    )
+    return parser.parse_args()
+
+
+def fetch_data(query: str, parallel: bool, params: dict = None):
+    """
+    Executa a query no banco de dados
     
-    # Carrega a query SQL
-    query = load_sql_query(SQL_FILE)
+    Args:
+        query: String com a query SQL
+        parallel: Se True, executa particionada por local de armazenagem
+        params: Parâmetros nomeados da query
+        
+    Returns:
+        DataFrame com os resultados ou None em caso de erro
+    """
+    if parallel:
+        # Executa a query particionada sobre um pool de conexões
+        from parallel import ParallelExtractor
+        if MATVIEW_ENABLED:
+            with DatabaseConnection() as db:
+                if db.connection:
+                    report_staleness(db.connection)
+        return ParallelExtractor().extract(query, params)
     
     # Conecta ao banco e executa query
     with DatabaseConnection() as db:
@@ -49,17 +165,322 @@ def main():
             sys.exit(1)
         
         # Executa a query
-        df = db.execute_query(query)
+        report_staleness(db.connection)
+        return db.execute_query(query, params=params)
+
+
+def publish_output(temp: str, filename: str) -> bool:
+    """
+    Move o arquivo gerado em `temp` para o destino
+    
+    Até aqui o destino guarda a versão anterior: uma exportação vazia, com
+    erro ou interrompida não apaga nem trunca a última planilha boa.
+    
+    Args:
+        temp: Arquivo gerado (exporters.temp_filename)
+        filename: Nome do arquivo de saída
+        
+    Returns:
+        bool: True se o arquivo foi publicado
+    """
+    try:
+        with metrics.stage('publish'):
+            replace_output(temp, filename)
+        return True
+    except OSError as e:
+        # No Windows, o destino aberto no Excel não pode ser substituído
+        remove_output(temp)
+        print(f"❌ Erro ao gravar {filename}: {e}")
+        return False
+
+
+def export_pipelined(query: str, filename: str, exporter, on_batch=None, params: dict = None) -> bool:
+    """
+    Busca e exporta ao mesmo tempo, lote a lote
+    
+    Args:
+        query: String com a query SQL
+        filename: Nome do arquivo de saída
+        exporter: Exportador do formato de saída
+        on_batch: Função chamada com cada lote (ex.: gravação do snapshot)
+        params: Parâmetros nomeados da query
+        
+    Returns:
+        bool: True se exportou com sucesso
+    """
+    from pipeline import ExportPipeline
+    
+    with DatabaseConnection() as db:
+        if not db.connection:
+            print("❌ Não foi possível conectar ao banco de dados.")
+            print("💡 Verifique suas credenciais no arquivo .env")
+            sys.exit(1)
+        
+        report_staleness(db.connection)
+        # O pipeline grava no temporário e o remove se não houver dados, erro ou cancelamento
+        temp = temp_filename(filename)
+        total_rows = ExportPipeline(on_batch=on_batch).run(db, query, temp, exporter, params)
+    
+    if total_rows == 0:
+        print("⚠️ Nenhum dado foi retornado pela query.")
+        sys.exit(1)
+    return total_rows > 0 and publish_output(temp, filename)
+
+
+def export_bounded(query: str, filename: str, exporter, budget_mb: float,
+                   on_batch=None, params: dict = None) -> bool:
+    """
+    Busca os lotes dentro do orçamento de memória e exporta a partir deles
+    
+    Acima do orçamento os lotes vão para um arquivo temporário; a conexão é
+    fechada antes da gravação, que lê o arquivo lote a lote. A saída é
+    gravada em um temporário e só substitui a anterior com sucesso.
+    
+    Args:
+        query: String com a query SQL
+        filename: Nome do arquivo de saída
+        exporter: Exportador do formato de saída
+        budget_mb: Orçamento de memória em MB
+        on_batch: Função chamada com cada lote (ex.: gravação do snapshot)
+        params: Parâmetros nomeados da query
+        
+    Returns:
+        bool: True se exportou com sucesso
+    """
+    from spill import SpillBuffer
+    
+    with SpillBuffer(budget_mb) as buffer:
+        with DatabaseConnection() as db:
+            if not db.connection:
+                print("❌ Não foi possível conectar ao banco de dados.")
+                print("💡 Verifique suas credenciais no arquivo .env")
+                sys.exit(1)
+            
+            report_staleness(db.connection)
+            print("🔍 Executando query...")
+            # Cursor server-side: o statement preparado traria o resultado inteiro de uma vez
+            buffer.extend(db.stream_query(query, params=params), on_batch)
+        
+        if buffer.rows == 0:
+            print("⚠️ Nenhum dado foi retornado pela query.")
+            sys.exit(1)
+        print(f"✅ Query executada! {buffer.rows} registros encontrados.")
+        print(buffer.describe())
+        buffer.record_metrics()
+        
+        temp = temp_filename(filename)
+        try:
+            total_rows = exporter.export_chunks(buffer.chunks(), temp)
+        except BaseException:
+            remove_output(temp)
+            raise
+    
+    if total_rows <= 0:
+        remove_output(temp)
+        return False
+    return publish_output(temp, filename)
+
+
+def export_profiles(query: str, names: list, filename: str, exporter, params: dict = None) -> bool:
+    """
+    Executa a query em vários bancos ao mesmo tempo e grava uma saída consolidada
+    
+    Args:
+        query: String com a query SQL
+        names: Perfis de DB_PROFILES (vazio: todos)
+        filename: Nome do arquivo de saída
+        exporter: Exportador do formato de saída
+        params: Parâmetros nomeados da query
+        
+    Returns:
+        bool: True se exportou com sucesso
+    """
+    from fanout import FanOutExtractor, select_profiles
+    
+    try:
+        profiles = select_profiles(names)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    total_rows = FanOutExtractor(profiles).run(query, filename, exporter, params)
+    if total_rows == 0:
+        print("⚠️ Nenhum dado foi retornado pelos bancos.")
+        sys.exit(1)
+    return total_rows > 0
+
+
+def report_changes(previous: str, current: str, output: str):
+    """
+    Gera o relatório de alterações entre o snapshot anterior e o atual
+    
+    Args:
+        previous: Snapshot da extração anterior (ou None)
+        current: Snapshot desta extração (ou None)
+        output: Arquivo gerado (o relatório fica ao lado)
+    """
+    from snapshots import write_changes_report, format_summary
+    
+    if not current:
+        return
+    if not previous:
+        print("ℹ️ Primeira extração registrada; o relatório de alterações começa na próxima.")
+        return
+    summary = write_changes_report(previous, current, output)
+    if summary:
+        print(format_summary(summary))
+
+
+def run_extraction(args, run) -> bool:
+    """
+    Busca os dados e gera a planilha
+    
+    Args:
+        args: Argumentos da linha de comando
+        run: Métricas da execução (metrics.RunMetrics)
+        
+    Returns:
+        bool: True se a planilha foi gerada
+    """
+    print("=" * 60)
+    print("🚀 GERADOR DE PLANILHA OFERTA RELÂMPAGO")
+    print("=" * 60)
+    print()
+    
+    # Carrega a query SQL
+    query = load_sql_query(SQL_FILE)
+    params = query_params(args.locais, args.produto, args.ativo)
+    
+    exporter = get_exporter(args.format)
+    
+    if args.profiles is not None:
+        # Um banco por perfil: sem cache, particionamento, separação por local nem snapshots
+        ignored = [flag for flag, enabled in (
+            ('--parallel', args.parallel), ('--split', args.split), ('--diff', args.diff)
+        ) if enabled]
+        if ignored:
+            print(f"ℹ️ --profiles ignora {', '.join(ignored)}.")
+        run.mode = 'multi_banco'
+        return export_profiles(query, args.profiles, args.output, exporter, params)
+    
+    cache = ResultCache()
+    
+    # Snapshot desta extração, comparado com o anterior
+    store, previous, current = None, None, None
+    if args.diff:
+        from snapshots import SnapshotStore
+        store = SnapshotStore()
+        previous = store.latest()
+    
+    if args.parallel:
+        run.mode = 'paralelo'
+    
+    if args.split and args.pipeline:
+        # A separação por local precisa do resultado completo
+        print("ℹ️ --split ignora o pipeline: o resultado é buscado por completo antes de separar.")
+        args.pipeline = False
+    
+    bounded = args.memory_budget > 0
+    if bounded and (args.split or args.parallel):
+        # A separação e as partições montam o resultado completo na memória
+        print("ℹ️ --memory-budget não se aplica a --split nem a --parallel.")
+        bounded = False
+    
+    if (args.pipeline or bounded) and (args.refresh or not cache.is_fresh(cache.fingerprint(query, params))):
+        writer = store.new_writer() if store and store.enabled else None
+        success = False
+        try:
+            if args.pipeline:
+                # Busca e exportação sobrepostas, direto do banco
+                run.mode = 'pipeline'
+                success = export_pipelined(
+                    query, args.output, exporter, writer.write if writer else None, params
+                )
+            else:
+                # Busca limitada ao orçamento de memória, exportação a partir do buffer
+                run.mode = 'orcamento'
+                success = export_bounded(
+                    query, args.output, exporter, args.memory_budget, writer.write if writer else None, params
+                )
+        finally:
+            if writer:
+                writer.close(keep=success)
+        if writer and success:
+            store.prune()
+            current = writer.path
+    else:
+        # Usa o cache local quando houver resultado recente da mesma query
+        df, cache_age = cache.get_or_fetch(
+            query,
+            lambda: fetch_data(query, args.parallel, params),
+            force_refresh=args.refresh,
+            params=params
+        )
+        if cache_age is not None:
+            run.mode = 'cache'
+            print(f"♻️ Dados servidos do cache ({len(df)} registros, de {metrics.format_age(cache_age)} atrás).")
         
         if df is None or df.empty:
             print("⚠️ Nenhum dado foi retornado pela query.")
             sys.exit(1)
+        
+        if args.split:
+            # Uma aba ou um arquivo por local, mais o índice
+            from split import LocationSplitter
+            splitter = LocationSplitter(args.split, export_format=args.format)
+            success = splitter.export(df, args.output) > 0
+        else:
+            # Exporta no formato escolhido, em um temporário que só substitui
+            # a saída anterior com sucesso (Ctrl+C não deixa arquivo truncado)
+            temp = temp_filename(args.output)
+            try:
+                success = exporter.export_data(df, temp)
+            except BaseException:
+                remove_output(temp)
+                raise
+            if success:
+                success = publish_output(temp, args.output)
+            else:
+                remove_output(temp)
+        
+        if store and success:
+            current = store.save(df)
     
-    # Exporta para Excel
-    success = ExcelExporter.export_data(df, OUTPUT_FILENAME)
+    if success and store:
+        report_changes(previous, current, args.output)
+    return success
+
+
+def main():
+    """Função principal do script"""
+    args = parse_args()
+    args.output = args.output or output_filename(args.format)
+    
+    if args.daemon:
+        # Conexão mantida aberta e publicação atômica, sem cache nem planilha parcial
+        from daemon import ExtractionDaemon
+        params = query_params(args.locais, args.produto, args.ativo)
+        ExtractionDaemon(args.output, args.interval, params=params).run_forever()
+        return
+    
+    if args.serve:
+        # Planilha em memória servida por HTTP; sem cache em disco nem arquivo de saída
+        from server import serve
+        params = query_params(args.locais, args.produto, args.ativo)
+        serve(args.host, args.port, params=params)
+        return
+    
+    with metrics.RunMetrics() as run:
+        success = run_extraction(args, run)
     
     if success:
-        file_path = os.path.abspath(OUTPUT_FILENAME)
+        file_path = os.path.abspath(args.output)
+        if args.split == 'files':
+            file_path = os.path.splitext(file_path)[0]
+        print()
+        for line in run.summary_lines():
+            print(line)
+        run.save()
         print()
         print("=" * 60)
         print(f"✅ SUCESSO! Arquivo gerado:")
@@ -71,6 +492,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos no executável (PyInstaller)
+    multiprocessing.freeze_support()
     try:
         main()
     except KeyboardInterrupt:
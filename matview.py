@@ -0,0 +1,422 @@
+"""
+Diagnóstico do plano da query e visão materializada do agregado
+
+Subcomandos:
+    explain  Executa EXPLAIN (ANALYZE, BUFFERS) na query configurada (ou nas
+             informadas em --sql) e mostra o plano com tempos e buffers
+    create   Cria a visão materializada definida em matview.sql
+    refresh  Atualiza a visão (CONCURRENTLY quando possível)
+    status   Mostra quando a visão foi atualizada pela última vez
+    drop     Remove a visão e o registro de atualizações
+
+Com MATVIEW_ENABLED=true no .env, o extrator lê a query_matview.sql, que
+consulta a visão em vez de agregar material x vgerenciarmaterial a cada
+execução, e avisa quando a visão passou de MATVIEW_MAX_AGE_SECONDS.
+
+Exemplos:
+    python matview.py explain --sql query.sql query_matview.sql
+    python matview.py create
+    python matview.py refresh
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from typing import Callable, Optional
+import psycopg2
+from psycopg2 import sql
+import metrics
+from config import (
+    SQL_FILE, MATVIEW_NAME, MATVIEW_SQL_FILE, MATVIEW_MAX_AGE_SECONDS, MATVIEW_ENABLED
+)
+from database import DatabaseConnection
+from query_params import bind, placeholders, query_params
+
+# Chave única exigida pelo REFRESH ... CONCURRENTLY
+UNIQUE_KEY = ('cdlocalarmazenagem', 'cdmaterial')
+
+# Linhas de resumo no fim do EXPLAIN ANALYZE em texto
+TIMING_LINE = re.compile(r'^(Planning|Execution) Time: ([\d.]+) ms$')
+
+
+def read_sql(path: str) -> str:
+    """
+    Lê um arquivo SQL
+    
+    Args:
+        path: Caminho do arquivo
+        
+    Returns:
+        Conteúdo do arquivo
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def explain(connection, query: str, params: dict = None, output_format: str = 'text') -> str:
+    """
+    Executa a query com EXPLAIN (ANALYZE, BUFFERS) e devolve o plano
+    
+    A query roda de verdade no servidor (ANALYZE), dentro de uma transação
+    desfeita ao final.
+    
+    Args:
+        connection: Conexão psycopg2
+        query: Query SQL (marcadores %(nome)s)
+        params: Parâmetros nomeados da query
+        output_format: 'text' ou 'json'
+        
+    Returns:
+        Plano em texto (uma linha por nó) ou JSON
+    """
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if output_format == 'json' else 'ANALYZE, BUFFERS'
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN ({options}) {query.strip().rstrip(';')}", bind(query, params))
+            rows = cursor.fetchall()
+    finally:
+        connection.rollback()
+    
+    if output_format == 'json':
+        return json.dumps(rows[0][0], indent=2, ensure_ascii=False)
+    return '\n'.join(row[0] for row in rows)
+
+
+def plan_timings(plan: str) -> dict:
+    """
+    Extrai os tempos de planejamento e execução de um plano em texto
+    
+    Args:
+        plan: Saída de explain() em texto
+        
+    Returns:
+        Dicionário {'Planning': ms, 'Execution': ms}
+    """
+    timings = {}
+    for line in plan.splitlines():
+        match = TIMING_LINE.match(line.strip())
+        if match:
+            timings[match.group(1)] = float(match.group(2))
+    return timings
+
+
+class MaterializedView:
+    """Cria, atualiza e inspeciona a visão materializada do agregado"""
+    
+    def __init__(self, connection, name: str = MATVIEW_NAME):
+        """
+        Args:
+            connection: Conexão psycopg2
+            name: Nome da visão materializada
+        """
+        self.connection = connection
+        self.name = name
+        # Registro da última atualização (o PostgreSQL não guarda essa data)
+        self.refresh_table = f'{name}_refresh'
+    
+    def _execute(self, statement, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            return cursor.fetchall() if cursor.description else None
+    
+    def exists(self) -> bool:
+        """Indica se a visão existe"""
+        return self._execute("SELECT to_regclass(%s) IS NOT NULL", (self.name,))[0][0]
+    
+    def can_refresh_concurrently(self) -> bool:
+        """
+        Indica se a visão aceita REFRESH ... CONCURRENTLY: precisa estar
+        populada e ter um índice único simples (sem expressão nem WHERE)
+        
+        Returns:
+            bool
+        """
+        rows = self._execute(
+            """
+            SELECT mv.ispopulated AND EXISTS (
+                SELECT 1 FROM pg_index i
+                WHERE i.indrelid = to_regclass(%(name)s)
+                  AND i.indisunique
+                  AND i.indexprs IS NULL
+                  AND i.indpred IS NULL
+            )
+            FROM pg_matviews mv
+            WHERE mv.matviewname = %(name)s
+            """,
+            {'name': self.name}
+        )
+        return bool(rows and rows[0][0])
+    
+    def create(self, definition: str, replace: bool = False) -> int:
+        """
+        Cria a visão materializada, o índice único e o registro de atualizações
+        
+        Args:
+            definition: SELECT que define a visão (matview.sql)
+            replace: Se True, recria a visão caso já exista
+            
+        Returns:
+            Quantidade de linhas da visão
+            
+        Raises:
+            ValueError: Se a definição usar parâmetros (%(nome)s)
+        """
+        if placeholders(definition):
+            raise ValueError(
+                f"{MATVIEW_SQL_FILE} não pode ter parâmetros: os filtros ficam na query de leitura"
+            )
+        
+        start = time.perf_counter()
+        name = sql.Identifier(self.name)
+        try:
+            if replace:
+                self._execute(sql.SQL("DROP MATERIALIZED VIEW IF EXISTS {}").format(name))
+            self._execute(
+                sql.SQL("CREATE MATERIALIZED VIEW IF NOT EXISTS {} AS {} WITH DATA").format(
+                    name, sql.SQL(definition.strip().rstrip(';'))
+                )
+            )
+            self._execute(
+                sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                    sql.Identifier(f'{self.name}_key'), name,
+                    sql.SQL(', ').join(sql.Identifier(column) for column in UNIQUE_KEY)
+                )
+            )
+            self._execute(
+                sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} ("
+                    "refreshed_at timestamptz NOT NULL, "
+                    "duration_seconds double precision, "
+                    "row_count bigint, "
+                    "concurrent boolean)"
+                ).format(sql.Identifier(self.refresh_table))
+            )
+            rows = self._record_refresh(time.perf_counter() - start, concurrent=False)
+            self.connection.commit()
+            return rows
+        except Exception:
+            self.connection.rollback()
+            raise
+    
+    def refresh(self, concurrently: bool = True) -> int:
+        """
+        Atualiza a visão materializada
+        
+        Com CONCURRENTLY, quem lê a visão durante a atualização continua
+        vendo os dados anteriores em vez de esperar o fim do REFRESH.
+        
+        Args:
+            concurrently: Se True, usa CONCURRENTLY quando a visão permitir
+            
+        Returns:
+            Quantidade de linhas da visão
+        """
+        concurrent = concurrently and self.can_refresh_concurrently()
+        if concurrently and not concurrent:
+            print("ℹ️ Visão vazia ou sem índice único: atualização com bloqueio de leitura.")
+        
+        start = time.perf_counter()
+        statement = "REFRESH MATERIALIZED VIEW CONCURRENTLY {}" if concurrent else "REFRESH MATERIALIZED VIEW {}"
+        try:
+            self._execute(sql.SQL(statement).format(sql.Identifier(self.name)))
+            rows = self._record_refresh(time.perf_counter() - start, concurrent)
+            self.connection.commit()
+            return rows
+        except Exception:
+            self.connection.rollback()
+            raise
+    
+    def _record_refresh(self, duration: float, concurrent: bool) -> int:
+        """Grava a data da atualização (na mesma transação do REFRESH)"""
+        # Estatísticas novas: o planejador passa a estimar as linhas da visão
+        self._execute(sql.SQL("ANALYZE {}").format(sql.Identifier(self.name)))
+        rows = self._execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(self.name)))[0][0]
+        table = sql.Identifier(self.refresh_table)
+        self._execute(sql.SQL("DELETE FROM {}").format(table))
+        self._execute(
+            sql.SQL("INSERT INTO {} VALUES (now(), %s, %s, %s)").format(table),
+            (duration, rows, concurrent)
+        )
+        return rows
+    
+    def status(self) -> Optional[dict]:
+        """
+        Dados da última atualização
+        
+        Returns:
+            Dicionário com refreshed_at, age_seconds, duration_seconds,
+            row_count e concurrent, ou None se a visão não existe
+        """
+        if not self.exists():
+            return None
+        if not self._execute("SELECT to_regclass(%s) IS NOT NULL", (self.refresh_table,))[0][0]:
+            return {'refreshed_at': None, 'age_seconds': None}
+        rows = self._execute(
+            sql.SQL(
+                "SELECT refreshed_at, EXTRACT(EPOCH FROM now() - refreshed_at), "
+                "duration_seconds, row_count, concurrent FROM {} "
+                "ORDER BY refreshed_at DESC LIMIT 1"
+            ).format(sql.Identifier(self.refresh_table))
+        )
+        if not rows:
+            return {'refreshed_at': None, 'age_seconds': None}
+        refreshed_at, age, duration, row_count, concurrent = rows[0]
+        return {
+            'refreshed_at': refreshed_at,
+            'age_seconds': float(age),
+            'duration_seconds': duration,
+            'row_count': row_count,
+            'concurrent': concurrent,
+        }
+    
+    def drop(self):
+        """Remove a visão e o registro de atualizações"""
+        try:
+            self._execute(sql.SQL("DROP MATERIALIZED VIEW IF EXISTS {}").format(sql.Identifier(self.name)))
+            self._execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(self.refresh_table)))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+
+def report_staleness(connection, log: Callable[[str], None] = print) -> Optional[float]:
+    """
+    Informa há quanto tempo a visão materializada foi atualizada
+    
+    Chamado pelo extrator antes de ler a visão (MATVIEW_ENABLED=true); a
+    idade também vai para o histórico de métricas.
+    
+    Args:
+        connection: Conexão psycopg2 usada na extração
+        log: Função que recebe as mensagens (padrão: print)
+        
+    Returns:
+        Idade em segundos, ou None se a visão nunca foi atualizada
+    """
+    if not MATVIEW_ENABLED:
+        return None
+    try:
+        status = MaterializedView(connection).status()
+    except psycopg2.Error as e:
+        connection.rollback()
+        log(f"⚠️ Não foi possível consultar a visão materializada: {e}")
+        return None
+    
+    if status is None:
+        log(f"⚠️ Visão materializada {MATVIEW_NAME} não encontrada: rode 'python matview.py create'")
+        return None
+    age = status['age_seconds']
+    if age is None:
+        log(f"⚠️ Data de atualização da visão {MATVIEW_NAME} desconhecida: rode 'python matview.py refresh'")
+        return None
+    
+    metrics.count('matview_age_seconds', int(age))
+    if age > MATVIEW_MAX_AGE_SECONDS:
+        log(f"⚠️ Visão materializada desatualizada: última atualização há {metrics.format_age(age)}")
+    else:
+        log(f"🕒 Visão materializada atualizada há {metrics.format_age(age)}")
+    return age
+
+
+def run_explain(db: DatabaseConnection, args):
+    """Mostra o plano de cada arquivo SQL e um resumo dos tempos"""
+    params = query_params(args.locais, args.produto, args.ativo)
+    plans = []
+    summary = []
+    for path in args.sql:
+        print(f"\n📋 EXPLAIN (ANALYZE, BUFFERS) {path}")
+        plan = explain(db.connection, read_sql(path), params, args.format)
+        print(plan)
+        plans.append(f"-- {path}\n{plan}")
+        if args.format == 'text':
+            timings = plan_timings(plan)
+            summary.append(
+                f"   {path}: planejamento {timings.get('Planning', 0):.1f} ms, "
+                f"execução {timings.get('Execution', 0):.1f} ms"
+            )
+    
+    if summary:
+        print("\n⏱️ Resumo:")
+        for line in summary:
+            print(line)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write('\n\n'.join(plans) + '\n')
+        print(f"💾 Planos salvos em {args.output}")
+
+
+def run_status(db: DatabaseConnection, args):
+    """Mostra os dados da última atualização da visão"""
+    status = MaterializedView(db.connection).status()
+    if status is None:
+        print(f"❌ Visão materializada {MATVIEW_NAME} não existe (use 'python matview.py create').")
+        sys.exit(1)
+    if status['refreshed_at'] is None:
+        print(f"⚠️ Visão {MATVIEW_NAME} existe, mas sem registro de atualização.")
+        return
+    concurrent = "CONCURRENTLY" if status['concurrent'] else "com bloqueio"
+    print(f"🕒 {MATVIEW_NAME}: atualizada em {status['refreshed_at']:%d/%m/%Y %H:%M:%S} "
+          f"(há {metrics.format_age(status['age_seconds'])})")
+    print(f"   {status['row_count']} linhas, atualização em {status['duration_seconds']:.2f} s ({concurrent})")
+    if status['age_seconds'] > MATVIEW_MAX_AGE_SECONDS:
+        print(f"⚠️ Mais antiga que MATVIEW_MAX_AGE_SECONDS ({MATVIEW_MAX_AGE_SECONDS:.0f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plano da query e visão materializada do agregado")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    explain_parser = subparsers.add_parser('explain', help="EXPLAIN (ANALYZE, BUFFERS) da query")
+    explain_parser.add_argument('--sql', nargs='+', default=[SQL_FILE],
+                                help="Arquivos SQL (padrão: a query usada pelo extrator)")
+    explain_parser.add_argument('--format', choices=['text', 'json'], default='text')
+    explain_parser.add_argument('--output', help="Grava os planos neste arquivo")
+    explain_parser.add_argument('--locais', help="Códigos dos locais (padrão: QUERY_LOCATIONS)")
+    explain_parser.add_argument('--produto', help="Filtro m.produto (padrão: QUERY_PRODUTO)")
+    explain_parser.add_argument('--ativo', help="Filtro m.ativo (padrão: QUERY_ATIVO)")
+    
+    create_parser = subparsers.add_parser('create', help=f"Cria a visão a partir de {MATVIEW_SQL_FILE}")
+    create_parser.add_argument('--replace', action='store_true',
+                               help="Recria a visão se já existir (após mudar a definição)")
+    
+    refresh_parser = subparsers.add_parser('refresh', help="Atualiza a visão")
+    refresh_parser.add_argument('--blocking', action='store_true',
+                                help="Não usa CONCURRENTLY (mais rápido, mas bloqueia a leitura)")
+    
+    subparsers.add_parser('status', help="Mostra a última atualização")
+    subparsers.add_parser('drop', help="Remove a visão")
+    args = parser.parse_args()
+    
+    with DatabaseConnection() as db:
+        if not db.connection:
+            print("❌ Não foi possível conectar ao banco de dados.")
+            print("💡 Verifique suas credenciais no arquivo .env")
+            sys.exit(1)
+        
+        view = MaterializedView(db.connection)
+        if args.command == 'explain':
+            run_explain(db, args)
+        elif args.command == 'create':
+            start = time.perf_counter()
+            rows = view.create(read_sql(MATVIEW_SQL_FILE), replace=args.replace)
+            print(f"✅ Visão {MATVIEW_NAME} criada com {rows} linhas em {time.perf_counter() - start:.2f} s")
+            if not MATVIEW_ENABLED:
+                print("💡 Defina MATVIEW_ENABLED=true no .env para o extrator ler da visão.")
+        elif args.command == 'refresh':
+            if not view.exists():
+                print(f"❌ Visão materializada {MATVIEW_NAME} não existe (use 'python matview.py create').")
+                sys.exit(1)
+            start = time.perf_counter()
+            rows = view.refresh(concurrently=not args.blocking)
+            print(f"✅ Visão {MATVIEW_NAME} atualizada: {rows} linhas em {time.perf_counter() - start:.2f} s")
+        elif args.command == 'status':
+            run_status(db, args)
+        elif args.command == 'drop':
+            view.drop()
+            print(f"🗑️ Visão {MATVIEW_NAME} removida.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+-- Definição da visão materializada mv_oferta_relampago (python matview.py create)
+-- Mesmas junções da query.sql, agregadas por local e material sem os filtros
+-- parametrizados; a query_matview.sql aplica os filtros e a trava de negativo
+SELECT
+    l.cdlocalarmazenagem,
+    m.cdmaterial,
+    m.produto,
+    m.ativo,
+    l.nome AS local_estoque,
+    m.identificacao AS sku,
+    m.nome AS material,
+    SUM(COALESCE(v.qtdedisponivel, 0)) AS qtde,
+    m.valorvendaminimo AS custo,
+    m.precovendafantasia,
+    m.valorvenda AS preco_por
+FROM 
+    material m
+    LEFT JOIN ecommaterial e ON m.cdmaterial = e.cdmaterial
+    LEFT JOIN vgerenciarmaterial v ON m.cdmaterial = v.cdmaterial 
+    LEFT JOIN localarmazenagem l ON v.cdlocalarmazenagem = l.cdlocalarmazenagem 
+WHERE
+    m.ecommerce = true
+    AND l.cdlocalarmazenagem IS NOT NULL
+GROUP BY
+    l.cdlocalarmazenagem,
+    m.cdmaterial,
+    m.produto,
+    m.ativo,
+    l.nome, 
+    m.identificacao, 
+    m.nome, 
+    m.valorvendaminimo, 
+    m.precovendafantasia, 
+    m.valorvenda;
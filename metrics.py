@@ -0,0 +1,348 @@
+"""
+Instrumentação das etapas da extração
+Mede o tempo de cada etapa, contadores (linhas, bytes) e o pico de memória,
+gerando um registro JSON por execução e um histórico em disco
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+from config import METRICS_HISTORY_FILE, METRICS_HISTORY_MAX
+
+# Execução em andamento em cada thread; etapas fora de uma execução são
+# ignoradas. Threads auxiliares de uma execução entram nela com bind()
+_local = threading.local()
+
+# Referência para process_uptime() onde o início do processo não é conhecido
+_IMPORTED_AT = time.perf_counter()
+
+
+# Intervalo da amostragem de memória durante uma execução
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def _windows_memory_counters():
+    """Contadores de memória do processo no Windows (GetProcessMemoryInfo)"""
+    import ctypes
+    from ctypes import wintypes
+    
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+    
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+    return counters
+
+
+def peak_rss_bytes() -> int:
+    """
+    Pico de memória residente do processo
+    
+    Returns:
+        int: Pico de RSS em bytes (0 se não for possível medir)
+    """
+    try:
+        if sys.platform == 'win32':
+            return int(_windows_memory_counters().PeakWorkingSetSize)
+        
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB; macOS em bytes
+        return int(peak if sys.platform == 'darwin' else peak * 1024)
+    except Exception:
+        return 0
+
+
+def current_rss_bytes() -> int:
+    """
+    Memória residente atual do processo
+    
+    Returns:
+        int: RSS em bytes (0 se não for possível medir)
+    """
+    try:
+        if sys.platform == 'win32':
+            return int(_windows_memory_counters().WorkingSetSize)
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    return 0
+
+
+def process_uptime() -> float:
+    """
+    Segundos desde a criação do processo, incluindo a inicialização do Python
+    e os imports (no executável onefile, sem a extração feita pelo processo pai)
+    
+    Returns:
+        float: Segundos; onde não é possível medir, conta a partir do import
+        deste módulo
+    """
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            
+            creation, exit_time, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetProcessTimes(
+                kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exit_time),
+                ctypes.byref(kernel), ctypes.byref(user)
+            )
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            ticks = lambda value: (value.dwHighDateTime << 32) | value.dwLowDateTime
+            # FILETIME em unidades de 100 ns
+            return (ticks(now) - ticks(creation)) / 1e7
+        
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/stat', 'r') as f:
+                # starttime: 22º campo, em ticks desde o boot (após o nome entre parênteses)
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/uptime', 'r') as f:
+                uptime = float(f.read().split()[0])
+            return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        pass
+    return time.perf_counter() - _IMPORTED_AT
+
+
+class RunMetrics:
+    """Coleta as métricas de uma execução da extração"""
+    
+    def __init__(self, mode: str = 'sequencial'):
+        """
+        Args:
+            mode: Modo da execução (ex.: 'sequencial', 'pipeline', 'cache')
+        """
+        self.mode = mode
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.counters = {}
+        self.total_seconds = None
+        # Memória no início e pico amostrado durante a execução: o pico do
+        # processo (peak_rss_bytes) inclui execuções anteriores na interface
+        self.start_rss = current_rss_bytes()
+        self.run_peak_rss = self.start_rss
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._sampling = threading.Event()
+    
+    def __enter__(self):
+        self._previous = current_run()
+        _local.run = self
+        if self.start_rss:
+            threading.Thread(target=self._sample_rss, name="oferta-rss", daemon=True).start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if current_run() is self:
+            _local.run = self._previous
+        self._sampling.set()
+        self.run_peak_rss = max(self.run_peak_rss, current_rss_bytes())
+        self.total_seconds = time.perf_counter() - self._start
+    
+    def _sample_rss(self):
+        """Acompanha o pico de memória até o fim da execução (thread própria)"""
+        while not self._sampling.wait(RSS_SAMPLE_SECONDS):
+            self.run_peak_rss = max(self.run_peak_rss, current_rss_bytes())
+    
+    def add_time(self, name: str, seconds: float):
+        """Soma o tempo de uma etapa (etapas repetidas são acumuladas)"""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def add(self, name: str, value: int):
+        """Soma um valor a um contador"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def record(self) -> dict:
+        """
+        Monta o registro estruturado da execução
+        
+        Returns:
+            Dicionário serializável em JSON
+        """
+        total = self.total_seconds
+        if total is None:
+            total = time.perf_counter() - self._start
+        record = {
+            'timestamp': self.started_at.isoformat(),
+            'mode': self.mode,
+            'total_seconds': round(total, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'rows': self.counters.get('rows', 0),
+            'bytes_written': self.counters.get('bytes_written', 0),
+            'peak_rss_mb': round(peak_rss_bytes() / (1024 * 1024), 1),
+        }
+        if self.start_rss:
+            record['start_rss_mb'] = round(self.start_rss / (1024 * 1024), 1)
+            record['run_peak_rss_mb'] = round(self.run_peak_rss / (1024 * 1024), 1)
+        if 'matview_age_seconds' in self.counters:
+            # Idade da visão materializada lida (MATVIEW_ENABLED=true)
+            record['matview_age_seconds'] = self.counters['matview_age_seconds']
+        if self.counters.get('memory_budget_bytes'):
+            # Extração com orçamento de memória (MEMORY_BUDGET_MB)
+            record['memory_budget_mb'] = round(self.counters['memory_budget_bytes'] / (1024 * 1024), 1)
+            record['buffer_peak_mb'] = round(self.counters.get('buffer_peak_bytes', 0) / (1024 * 1024), 1)
+            record['spilled_rows'] = self.counters.get('spilled_rows', 0)
+            record['spilled_mb'] = round(self.counters.get('spilled_bytes', 0) / (1024 * 1024), 1)
+        return record
+    
+    def summary_lines(self) -> list:
+        """
+        Resumo legível das etapas, para log
+        
+        Returns:
+            Lista de linhas de texto
+        """
+        record = self.record()
+        lines = [f"⏱️ Tempo total: {record['total_seconds']:.2f} s ({record['mode']})"]
+        for name, seconds in record['stages'].items():
+            lines.append(f"   • {name}: {seconds:.2f} s")
+        if 'run_peak_rss_mb' in record:
+            memory = (f"pico de memória {record['run_peak_rss_mb']:.0f} MB "
+                      f"(+{record['run_peak_rss_mb'] - record['start_rss_mb']:.0f} MB na execução)")
+        else:
+            memory = f"pico de memória {record['peak_rss_mb']:.0f} MB"
+        lines.append(
+            f"   {record['rows']} linhas, {record['bytes_written'] / 1024:.0f} KB gravados, {memory}"
+        )
+        if 'memory_budget_mb' in record:
+            lines.append(
+                f"   orçamento {record['memory_budget_mb']:.0f} MB: buffer até {record['buffer_peak_mb']:.0f} MB, "
+                f"{record['spilled_rows']} linhas em disco ({record['spilled_mb']:.0f} MB)"
+            )
+        return lines
+    
+    def save(self, history_file: str = None, max_entries: int = None) -> dict:
+        """
+        Acrescenta o registro ao histórico (JSON Lines), mantendo só os mais recentes
+        
+        Args:
+            history_file: Caminho do histórico (padrão: METRICS_HISTORY_FILE)
+            max_entries: Registros mantidos (padrão: METRICS_HISTORY_MAX)
+            
+        Returns:
+            O registro gravado
+        """
+        history_file = history_file or METRICS_HISTORY_FILE
+        max_entries = max_entries or METRICS_HISTORY_MAX
+        record = self.record()
+        
+        try:
+            lines = []
+            if os.path.exists(history_file):
+                with open(history_file, 'r', encoding='utf-8') as f:
+                    lines = [line for line in f.read().splitlines() if line.strip()]
+            lines.append(json.dumps(record, ensure_ascii=False))
+            with open(history_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines[-max_entries:]) + '\n')
+        except Exception as e:
+            print(f"Erro ao salvar histórico de métricas: {e}")
+        
+        return record
+
+
+def current_run():
+    """
+    Execução em andamento nesta thread
+    
+    Returns:
+        RunMetrics ou None fora de uma execução
+    """
+    return getattr(_local, 'run', None)
+
+
+def bind(function: Callable) -> Callable:
+    """
+    Prende `function` à execução em andamento nesta thread
+    
+    Etapas e contadores de uma thread auxiliar (ex.: a busca do pipeline)
+    só entram na execução de quem a criou por meio desta função.
+    
+    Args:
+        function: Função executada em outra thread
+        
+    Returns:
+        Função que registra as métricas na execução atual
+    """
+    run = current_run()
+    
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        previous = current_run()
+        _local.run = run
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.run = previous
+    
+    return bound
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Mede o tempo de um bloco como uma etapa da execução em andamento
+    
+    Args:
+        name: Nome da etapa (ex.: 'connect', 'fetch', 'save')
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run = current_run()
+        if run is not None:
+            run.add_time(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int):
+    """
+    Soma um valor a um contador da execução em andamento
+    
+    Args:
+        name: Nome do contador (ex.: 'rows', 'bytes_written')
+        value: Valor a somar
+    """
+    run = current_run()
+    if run is not None:
+        run.add(name, value)
+
+
+def format_age(seconds: float) -> str:
+    """
+    Formata a idade dos dados em texto curto
+    
+    Args:
+        seconds: Idade em segundos
+        
+    Returns:
+        Texto como "45 s", "3 min" ou "2 h"
+    """
+    if seconds < 60:
+        return f"{int(seconds)} s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    return f"{int(seconds // 3600)} h"
@@ -0,0 +1,236 @@
+"""
+Extração paralela por local de armazenagem
+Divide a lista de locais da query.sql em partições executadas em paralelo
+sobre um pool de conexões, mantendo a ordem do ORDER BY original
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import pandas as pd
+from psycopg2.pool import ThreadedConnectionPool
+import metrics
+from config import DB_CONFIG, PARALLEL_WORKERS, PARTITION_STRATEGY
+from database import DatabaseConnection
+from query_params import placeholders
+from schema import apply_schema
+
+# Parâmetro da lista de locais na query.sql: "l.cdlocalarmazenagem = ANY(%(locais)s)"
+LOCATION_PARAM = 'locais'
+
+# Filtro de locais em queries sem parâmetros: "l.cdlocalarmazenagem IN (34, 67, ...)"
+LOCATION_FILTER = re.compile(r'(l\.cdlocalarmazenagem\s+IN\s*\()([^)]*)(\))', re.IGNORECASE)
+
+# Ordem dos locais segundo a collation do banco (a mesma do ORDER BY l.nome)
+LOCATION_ORDER_SQL = """
+    SELECT cdlocalarmazenagem, nome
+    FROM localarmazenagem
+    WHERE cdlocalarmazenagem = ANY(%s)
+    ORDER BY nome ASC
+"""
+
+STRATEGIES = ('per_location', 'round_robin')
+
+
+def location_ids(query: str, params: dict = None) -> List[int]:
+    """
+    Extrai a lista de locais de armazenagem filtrada pela query
+    
+    Args:
+        query: String com a query SQL
+        params: Parâmetros da query (usados se ela tiver o marcador de locais)
+        
+    Returns:
+        Lista com os códigos dos locais
+        
+    Raises:
+        ValueError: Se a query não tiver o filtro de locais
+    """
+    if LOCATION_PARAM in placeholders(query):
+        if not params or LOCATION_PARAM not in params:
+            raise ValueError(f"Parâmetro '{LOCATION_PARAM}' sem valor")
+        return [int(value) for value in params[LOCATION_PARAM]]
+    match = LOCATION_FILTER.search(query)
+    if not match:
+        raise ValueError("Filtro 'l.cdlocalarmazenagem IN (...)' não encontrado na query")
+    return [int(value) for value in match.group(2).split(',') if value.strip()]
+
+
+def with_locations(query: str, ids: List[int], params: dict = None) -> tuple:
+    """
+    Restringe a query a uma partição de locais
+    
+    Com o marcador de locais, só o parâmetro muda (o texto da query, e o
+    plano do banco, são os mesmos em todas as partições); sem ele, o filtro
+    IN (...) é reescrito.
+    
+    Args:
+        query: String com a query SQL
+        ids: Códigos dos locais da partição
+        params: Parâmetros da query
+        
+    Returns:
+        Tupla (query, parâmetros) restrita aos locais informados
+    """
+    if LOCATION_PARAM in placeholders(query):
+        return query, {**params, LOCATION_PARAM: list(ids)}
+    values = ', '.join(str(int(value)) for value in ids)
+    return LOCATION_FILTER.sub(lambda m: f"{m.group(1)}{values}{m.group(3)}", query, count=1), params
+
+
+def partition_locations(groups: List[List[int]], strategy: str, workers: int) -> List[List[int]]:
+    """
+    Agrupa os locais em partições
+    
+    Args:
+        groups: Códigos dos locais agrupados por nome, na ordem do banco
+            (locais com o mesmo nome ficam juntos, pois o GROUP BY os soma)
+        strategy: 'per_location' (uma partição por nome de local) ou
+            'round_robin' (distribui os nomes entre `workers` partições)
+        workers: Quantidade de conexões simultâneas
+        
+    Returns:
+        Lista de partições, cada uma com os códigos dos seus locais
+    """
+    if strategy == 'per_location':
+        return [list(group) for group in groups]
+    if strategy == 'round_robin':
+        partitions = [[] for _ in range(min(workers, len(groups)))]
+        for idx, group in enumerate(groups):
+            partitions[idx % len(partitions)].extend(group)
+        return partitions
+    raise ValueError(f"Estratégia de partição inválida: {strategy} (use {', '.join(STRATEGIES)})")
+
+
+class ParallelExtractor:
+    """Executa a query.sql em paralelo, uma partição de locais por conexão"""
+    
+    def __init__(self, workers: int = None, strategy: str = None):
+        """
+        Args:
+            workers: Máximo de conexões/consultas simultâneas (padrão: PARALLEL_WORKERS)
+            strategy: Estratégia de partição (padrão: PARTITION_STRATEGY)
+        """
+        self.workers = max(1, workers or PARALLEL_WORKERS)
+        self.strategy = strategy or PARTITION_STRATEGY
+    
+    def extract(self, query: str, params: dict = None) -> Optional[pd.DataFrame]:
+        """
+        Executa a query particionada e junta os resultados na ordem original
+        
+        Args:
+            query: String com a query SQL
+            params: Parâmetros nomeados da query (%(nome)s)
+            
+        Returns:
+            DataFrame com os resultados ou None em caso de erro
+        """
+        pool = None
+        try:
+            ids = location_ids(query, params)
+            with metrics.stage('connect'):
+                pool = ThreadedConnectionPool(1, self.workers, **DB_CONFIG)
+            print(f"✅ Pool de conexões criado ({self.workers} conexões no máximo).")
+            
+            names = self._location_names(pool, ids)
+            groups = {}
+            for location_id, name in names:
+                groups.setdefault(name, []).append(location_id)
+            partitions = partition_locations(list(groups.values()), self.strategy, self.workers)
+            
+            print(f"🔍 Executando query em {len(partitions)} partições ({self.strategy})...")
+            # Tempo de parede: as etapas das partições, simultâneas, ficam fora da execução
+            with metrics.stage('fetch'):
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    results = list(executor.map(
+                        lambda part: self._run_partition(pool, *with_locations(query, part, params)),
+                        partitions
+                    ))
+            
+            if any(df is None for df in results):
+                print("❌ Falha em uma ou mais partições.")
+                return None
+            
+            df = self._merge(results, list(groups))
+            print(f"✅ Query executada! {len(df)} registros encontrados.")
+            return df
+            
+        except Exception as e:
+            print(f"❌ Erro na extração paralela: {e}")
+            return None
+        finally:
+            if pool:
+                pool.closeall()
+    
+    @staticmethod
+    def _location_names(pool: ThreadedConnectionPool, ids: List[int]) -> list:
+        """
+        Busca os nomes dos locais na ordem da collation do banco
+        
+        Args:
+            pool: Pool de conexões
+            ids: Códigos dos locais
+            
+        Returns:
+            Lista de tuplas (código, nome) ordenada por nome
+        """
+        connection = pool.getconn()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LOCATION_ORDER_SQL, (ids,))
+                rows = cursor.fetchall()
+            connection.rollback()
+            return rows
+        finally:
+            pool.putconn(connection)
+    
+    @staticmethod
+    def _run_partition(pool: ThreadedConnectionPool, query: str,
+                       params: dict = None) -> Optional[pd.DataFrame]:
+        """
+        Executa uma partição em uma conexão emprestada do pool
+        
+        Args:
+            pool: Pool de conexões
+            query: Query restrita aos locais da partição
+            params: Parâmetros da partição
+            
+        Returns:
+            DataFrame da partição ou None em caso de erro
+        """
+        connection = pool.getconn()
+        try:
+            return DatabaseConnection(connection).execute_query(query, params=params)
+        finally:
+            pool.putconn(connection)
+    
+    @staticmethod
+    def _merge(results: List[pd.DataFrame], location_order: List[str]) -> pd.DataFrame:
+        """
+        Junta as partições respeitando ORDER BY l.nome, m.nome
+        
+        Cada partição já vem ordenada pelo banco; basta reposicionar os blocos
+        de cada local conforme a ordem dos nomes no banco.
+        
+        Args:
+            results: DataFrames de cada partição
+            location_order: Nomes dos locais na ordem do banco
+            
+        Returns:
+            DataFrame único com todas as partições
+        """
+        location_column = next(
+            column for column in results[0].columns if str(column).lower() == 'local_estoque'
+        )
+        
+        blocks = {}
+        for df in results:
+            for name, block in df.groupby(location_column, sort=False, observed=True):
+                blocks[name] = block
+        
+        ordered = [blocks[name] for name in location_order if name in blocks]
+        if not ordered:
+            return results[0]
+        
+        # Categorias diferentes entre partições: reaplica o esquema após juntar
+        df = pd.concat(ordered, ignore_index=True)
+        return apply_schema(df)
@@ -0,0 +1,160 @@
+"""
+Pipeline de extração com busca e exportação sobrepostas
+Uma thread busca lotes no banco e os coloca em uma fila limitada enquanto
+a thread chamadora grava esses lotes na planilha
+"""
+import queue
+import threading
+from contextlib import closing
+from typing import Callable, Optional
+import pandas as pd
+import metrics
+from config import PIPELINE_QUEUE_SIZE
+from database import DatabaseConnection, ExtractionCancelled
+from export_excel import ExcelExporter
+from exporters import remove_output
+
+# Marca o fim dos lotes na fila
+_DONE = object()
+
+
+class ExportPipeline:
+    """Produtor (busca) e consumidor (exportação) ligados por uma fila limitada"""
+    
+    def __init__(self, queue_size: int = None, fetch_size: int = None,
+                 on_progress: Optional[Callable[[int], None]] = None,
+                 on_batch: Optional[Callable[[pd.DataFrame], None]] = None):
+        """
+        Args:
+            queue_size: Máximo de lotes aguardando exportação (padrão: PIPELINE_QUEUE_SIZE)
+            fetch_size: Linhas por lote (padrão: FETCH_SIZE)
+            on_progress: Função chamada com o total de linhas já exportadas
+            on_batch: Função chamada com cada lote antes da exportação
+                (ex.: gravação do snapshot)
+        """
+        self.queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.fetch_size = fetch_size
+        self.on_progress = on_progress
+        self.on_batch = on_batch
+    
+    def run(self, db: DatabaseConnection, query: str, filename: str, exporter=None,
+            params: dict = None) -> int:
+        """
+        Executa a query e grava a planilha à medida que os lotes chegam
+        
+        A memória fica limitada a queue_size lotes, mais o lote em gravação.
+        Se db.cancel() for chamado, a query é cancelada no servidor, a
+        gravação para no lote seguinte e o arquivo parcial é removido.
+        
+        O arquivo é gravado aos poucos: quem chama passa um nome temporário
+        (exporters.temp_filename) e só o move para o destino com sucesso
+        (exporters.replace_output), preservando a versão anterior.
+        
+        Args:
+            db: Conexão aberta com o banco
+            query: String com a query SQL
+            filename: Arquivo gravado (temporário)
+            exporter: Exportador com export_chunks (padrão: ExcelExporter)
+            params: Parâmetros nomeados da query (%(nome)s)
+            
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+            
+        Raises:
+            ExtractionCancelled: Se a extração foi cancelada
+        """
+        self.start(db, query, params)
+        return self.export(filename, exporter)
+    
+    def start(self, db: DatabaseConnection, query: str, params: dict = None):
+        """
+        Inicia a busca em segundo plano, antes de o destino ser conhecido
+        
+        Os lotes esperam na fila até export(); com a fila cheia, a busca
+        para até a gravação começar. Quem chama start() precisa chamar
+        export() ou close().
+        
+        Args:
+            db: Conexão aberta com o banco
+            query: String com a query SQL
+            params: Parâmetros nomeados da query (%(nome)s)
+        """
+        self._db = db
+        self._batches = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        
+        def produce():
+            try:
+                with closing(db.stream_query(query, self.fetch_size, params=params)) as chunks:
+                    for chunk in chunks:
+                        if not self._put(chunk):
+                            return
+                self._put(_DONE)
+            except Exception as e:
+                self._put(e)
+        
+        print(f"🔀 Pipeline iniciado (fila de {self.queue_size} lotes)...")
+        self._producer = threading.Thread(target=metrics.bind(produce), name="oferta-fetch", daemon=True)
+        self._producer.start()
+    
+    def _put(self, item) -> bool:
+        """Espera espaço na fila, desistindo se o consumidor parou"""
+        while not self._stop.is_set():
+            try:
+                self._batches.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _consume(self):
+        """Lotes da fila, na ordem da busca, até o fim ou o primeiro erro"""
+        rows = 0
+        while True:
+            item = self._batches.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            self._db.check_cancelled()
+            rows += len(item)
+            if self.on_batch:
+                self.on_batch(item)
+            yield item
+            if self.on_progress:
+                self.on_progress(rows)
+    
+    def export(self, filename: str, exporter=None) -> int:
+        """
+        Grava a planilha com os lotes da busca iniciada por start()
+        
+        Args:
+            filename: Arquivo gravado (temporário)
+            exporter: Exportador com export_chunks (padrão: ExcelExporter)
+            
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+            
+        Raises:
+            ExtractionCancelled: Se a extração foi cancelada
+        """
+        db = self._db
+        try:
+            total_rows = (exporter or ExcelExporter).export_chunks(self._consume(), filename)
+        except BaseException:
+            remove_output(filename)
+            raise
+        finally:
+            self.close()
+        
+        if total_rows <= 0 or db.cancelled:
+            # Sem dados, com erro ou cancelado: nenhum arquivo parcial fica para trás
+            remove_output(filename)
+        if db.cancelled:
+            raise ExtractionCancelled("Extração cancelada pelo usuário")
+        return total_rows
+    
+    def close(self):
+        """Para a busca (se ainda estiver rodando) e espera a thread terminar"""
+        self._stop.set()
+        self._producer.join()
@@ -0,0 +1,219 @@
+"""
+Pool de conexões persistente com verificação de saúde
+Mantém conexões abertas (com keepalive TCP) entre execuções e reconecta
+de forma transparente quando uma conexão cai, inclusive no meio de uma query
+"""
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from config import DB_CONFIG, POOL_MAX_CONNECTIONS, POOL_PING_AFTER, KEEPALIVE_IDLE
+from database import prepare_connection
+
+# Parâmetros de keepalive TCP da libpq
+KEEPALIVE_OPTIONS = {
+    'keepalives': 1,
+    'keepalives_idle': KEEPALIVE_IDLE,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+
+class ConnectionPool:
+    """Pool de conexões PostgreSQL validadas antes do uso"""
+    
+    def __init__(self, max_connections: int = None, ping_after: float = None):
+        """
+        Args:
+            max_connections: Máximo de conexões abertas (padrão: POOL_MAX_CONNECTIONS)
+            ping_after: Segundos ociosos após os quais a conexão é testada com
+                SELECT 1 antes do uso (padrão: POOL_PING_AFTER)
+        """
+        self.max_connections = max_connections or POOL_MAX_CONNECTIONS
+        self.ping_after = POOL_PING_AFTER if ping_after is None else ping_after
+        self._pool = None
+        # Último uso de cada conexão; a entrada some com a conexão (um id()
+        # poderia ser reaproveitado por uma conexão nova)
+        self._last_used = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Tempo e origem da última conexão obtida (para exibir no log)
+        self.last_acquire_seconds = 0.0
+        self.last_acquire_new = False
+    
+    def _get_pool(self) -> ThreadedConnectionPool:
+        """Cria o pool na primeira utilização, e não na abertura da janela"""
+        with self._lock:
+            if self._pool is None:
+                # Abre uma conexão agora; o psycopg2 mantém ociosas até `minconn`
+                self._pool = ThreadedConnectionPool(
+                    1, self.max_connections, **DB_CONFIG, **KEEPALIVE_OPTIONS
+                )
+            return self._pool
+    
+    def _is_healthy(self, connection) -> bool:
+        """
+        Verifica se uma conexão do pool ainda pode ser usada
+        
+        Args:
+            connection: Conexão psycopg2
+            
+        Returns:
+            bool: True se a conexão está utilizável
+        """
+        if connection.closed:
+            return False
+        
+        idle = time.monotonic() - self._last_used.get(connection, 0)
+        if idle < self.ping_after:
+            return True
+        
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def acquire(self):
+        """
+        Obtém uma conexão saudável do pool, reconectando se necessário
+        
+        Returns:
+            Conexão psycopg2 pronta para uso
+            
+        Raises:
+            psycopg2.OperationalError: Se não for possível conectar ao banco
+        """
+        start = time.perf_counter()
+        pool = self._get_pool()
+        
+        # Descarta conexões quebradas até obter uma válida (ou abrir uma nova)
+        for _ in range(self.max_connections + 1):
+            connection = pool.getconn()
+            is_new = connection not in self._last_used
+            if is_new or self._is_healthy(connection):
+                break
+            self._last_used.pop(connection, None)
+            pool.putconn(connection, close=True)
+        else:
+            raise psycopg2.OperationalError("Nenhuma conexão saudável disponível no pool")
+        
+        if is_new:
+            prepare_connection(connection)
+        
+        self.last_acquire_seconds = time.perf_counter() - start
+        self.last_acquire_new = is_new
+        return connection
+    
+    def release(self, connection, discard: bool = False):
+        """
+        Devolve uma conexão ao pool
+        
+        Se o pool foi fechado enquanto a conexão estava em uso (janela
+        fechada no meio da query, daemon encerrado), a conexão é só fechada.
+        
+        Args:
+            connection: Conexão obtida por acquire()
+            discard: Se True, fecha a conexão em vez de reaproveitá-la
+        """
+        with self._lock:
+            pool = self._pool
+        if pool is None or pool.closed:
+            self._close_orphan(connection)
+            return
+        
+        discard = discard or bool(connection.closed)
+        if not discard:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        
+        try:
+            pool.putconn(connection, close=discard)
+        except PoolError:
+            # Conexão de um pool fechado e já recriado
+            self._close_orphan(connection)
+            return
+        if connection.closed:
+            self._last_used.pop(connection, None)
+        else:
+            self._last_used[connection] = time.monotonic()
+    
+    def _close_orphan(self, connection):
+        """Fecha uma conexão que não pertence mais a nenhum pool aberto"""
+        self._last_used.pop(connection, None)
+        if not connection.closed:
+            connection.close()
+    
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão do pool durante um bloco 'with'
+        
+        Yields:
+            Conexão psycopg2
+        """
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except psycopg2.OperationalError:
+            # Conexão provavelmente caiu: não devolve ao pool
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+    
+    def run(self, work: Callable, acquire: Callable = None):
+        """
+        Executa `work(conexão)` com uma conexão do pool, repetindo uma vez em
+        uma conexão nova se a conexão cair durante a execução
+        
+        O teste do acquire() só roda após `ping_after` segundos ociosos; uma
+        conexão que cai no meio da query (servidor reiniciado, rede) só é
+        percebida pelo próprio `work`. `work` deve poder ser repetido: ler
+        o resultado para a memória, sem gravar nada antes de retornar.
+        
+        Args:
+            work: Função que recebe a conexão e devolve o resultado (None em
+                caso de erro, como DatabaseConnection.execute_query)
+            acquire: Função que obtém a conexão (padrão: self.acquire)
+            
+        Returns:
+            Resultado de `work`
+            
+        Raises:
+            psycopg2.OperationalError: Se não for possível conectar ao banco
+        """
+        acquire = acquire or self.acquire
+        for attempt in range(2):
+            connection = acquire()
+            try:
+                result = work(connection)
+                lost = result is None and bool(connection.closed)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt or not connection.closed:
+                    raise
+                result, lost = None, True
+            finally:
+                self.release(connection)
+            
+            if not lost or attempt:
+                return result
+            print("🔌 Conexão perdida durante a consulta; tentando de novo em uma nova conexão...")
+    
+    def close(self):
+        """Fecha todas as conexões do pool"""
+        with self._lock:
+            if self._pool is not None and not self._pool.closed:
+                self._pool.closeall()
+                print("🔌 Pool de conexões fechado.")
+            self._pool = None
+            self._last_used.clear()
@@ -13,10 +13,10 @@ FROM
     LEFT JOIN vgerenciarmaterial v ON m.cdmaterial = v.cdmaterial 
     LEFT JOIN localarmazenagem l ON v.cdlocalarmazenagem = l.cdlocalarmazenagem 
 WHERE
-    m.produto = true
-    AND m.ativo = true
+    m.produto = %(produto)s
+    AND m.ativo = %(ativo)s
     AND m.ecommerce = true
-    AND l.cdlocalarmazenagem IN (34, 67, 397, 265, 506, 507)
+    AND l.cdlocalarmazenagem = ANY(%(locais)s)
 GROUP BY
     l.nome, 
     m.identificacao, 
@@ -0,0 +1,26 @@
+-- Leitura da visão materializada (MATVIEW_ENABLED=true): mesmo resultado da query.sql
+SELECT
+    mv.local_estoque AS LOCAL_ESTOQUE,
+    mv.sku AS SKU,
+    mv.material AS MATERIAL,
+    -- Locais com o mesmo nome ou SKUs repetidos voltam a ser somados, como na query.sql
+    GREATEST(SUM(mv.qtde), 0) AS QTDE,
+    mv.custo AS CUSTO,
+    mv.precovendafantasia / 100 AS PRECO_DE,
+    mv.preco_por AS PRECO_POR
+FROM 
+    mv_oferta_relampago mv
+WHERE
+    mv.produto = %(produto)s
+    AND mv.ativo = %(ativo)s
+    AND mv.cdlocalarmazenagem = ANY(%(locais)s)
+GROUP BY
+    mv.local_estoque, 
+    mv.sku, 
+    mv.material, 
+    mv.custo, 
+    mv.precovendafantasia, 
+    mv.preco_por
+ORDER BY 
+    mv.local_estoque ASC,
+    mv.material ASC;
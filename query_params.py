@@ -0,0 +1,136 @@
+"""
+Parâmetros nomeados da query.sql
+A query usa marcadores no formato do psycopg2 (%(nome)s); os valores vêm do
+config (.env), da linha de comando ou da interface gráfica
+"""
+import hashlib
+import re
+from typing import List, Optional, Tuple
+from config import QUERY_LOCATIONS, QUERY_PRODUTO, QUERY_ATIVO
+
+# Marcador de parâmetro nomeado: %(locais)s
+PLACEHOLDER = re.compile(r'%\((\w+)\)s')
+
+TRUE_VALUES = ('1', 'true', 'sim', 't', 's')
+FALSE_VALUES = ('0', 'false', 'nao', 'não', 'f', 'n')
+
+
+def parse_locations(text: str) -> List[int]:
+    """
+    Converte uma lista de locais em texto ("34, 67 397") para inteiros
+    
+    Args:
+        text: Códigos separados por vírgula ou espaço
+        
+    Returns:
+        Lista com os códigos dos locais
+        
+    Raises:
+        ValueError: Se algum código não for um número inteiro
+    """
+    values = [value for value in re.split(r'[\s,;]+', str(text).strip()) if value]
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ValueError(f"Lista de locais inválida: {text} (use códigos numéricos separados por vírgula)")
+
+
+def parse_bool(text) -> bool:
+    """
+    Converte 'true'/'sim'/'1' (ou 'false'/'não'/'0') para booleano
+    
+    Args:
+        text: Valor em texto (ou já booleano)
+        
+    Returns:
+        bool
+        
+    Raises:
+        ValueError: Se o valor não for reconhecido
+    """
+    if isinstance(text, bool):
+        return text
+    value = str(text).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"Valor booleano inválido: {text}")
+
+
+def query_params(locations=None, produto=None, ativo=None) -> dict:
+    """
+    Monta os parâmetros da query, usando o config para os não informados
+    
+    Args:
+        locations: Códigos dos locais (lista ou texto) (padrão: QUERY_LOCATIONS)
+        produto: Filtro m.produto (padrão: QUERY_PRODUTO)
+        ativo: Filtro m.ativo (padrão: QUERY_ATIVO)
+        
+    Returns:
+        Dicionário com os parâmetros nomeados
+    """
+    if locations is None:
+        locations = QUERY_LOCATIONS
+    if isinstance(locations, str):
+        locations = parse_locations(locations)
+    return {
+        'locais': [int(value) for value in locations],
+        'produto': parse_bool(QUERY_PRODUTO if produto is None else produto),
+        'ativo': parse_bool(QUERY_ATIVO if ativo is None else ativo),
+    }
+
+
+def placeholders(query: str) -> List[str]:
+    """
+    Nomes dos parâmetros usados na query, na ordem da primeira ocorrência
+    
+    Args:
+        query: String com a query SQL
+        
+    Returns:
+        Lista de nomes sem repetição
+    """
+    return list(dict.fromkeys(PLACEHOLDER.findall(query)))
+
+
+def bind(query: str, params: Optional[dict]) -> Optional[dict]:
+    """
+    Parâmetros a enviar com a query: só os usados, ou None se a query não
+    tiver marcadores (query.sql antiga, com valores fixos)
+    
+    Args:
+        query: String com a query SQL
+        params: Parâmetros disponíveis
+        
+    Returns:
+        Dicionário com os parâmetros usados, ou None
+        
+    Raises:
+        KeyError: Se a query usar um parâmetro não informado
+    """
+    names = placeholders(query)
+    if not names:
+        return None
+    missing = [name for name in names if name not in (params or {})]
+    if missing:
+        raise KeyError(f"Parâmetros sem valor na query: {', '.join(missing)}")
+    return {name: params[name] for name in names}
+
+
+def to_prepared(query: str) -> Tuple[str, str, List[str]]:
+    """
+    Converte a query para um PREPARE do PostgreSQL ($1, $2, ...)
+    
+    Args:
+        query: String com a query SQL (marcadores %(nome)s)
+        
+    Returns:
+        Tupla (nome do statement, texto com $n, nomes dos parâmetros na ordem)
+    """
+    names = placeholders(query)
+    body = PLACEHOLDER.sub(lambda match: f"${names.index(match.group(1)) + 1}", query)
+    # Sem interpolação do psycopg2, o '%%' escapado volta a ser '%'
+    body = body.replace('%%', '%').strip().rstrip(';')
+    name = 'oferta_' + hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+    return name, body, names
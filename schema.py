@@ -0,0 +1,93 @@
+"""
+Esquema tipado do resultado da query.sql
+Define os dtypes nativos de cada coluna e os formatos numéricos do Excel
+"""
+import hashlib
+import pandas as pd
+
+# O PostgreSQL devolve os apelidos sem aspas em minúsculas
+COLUMN_DTYPES = {
+    # Perfil de banco de origem (extração com --profiles)
+    'origem': 'category',
+    'local_estoque': 'category',
+    'sku': 'string',
+    'material': 'string',
+    'qtde': 'float64',
+    'custo': 'float64',
+    'preco_de': 'float64',
+    'preco_por': 'float64',
+}
+
+# Formato de moeda aplicado às colunas de valores
+CURRENCY_FORMAT = '"R$" #,##0.00'
+
+NUMBER_FORMATS = {
+    'custo': CURRENCY_FORMAT,
+    'preco_de': CURRENCY_FORMAT,
+    'preco_por': CURRENCY_FORMAT,
+    # Relatório de alterações entre extrações
+    'preco_por_anterior': CURRENCY_FORMAT,
+    'preco_por_atual': CURRENCY_FORMAT,
+    'variacao_preco_por': CURRENCY_FORMAT,
+}
+
+# Chave de uma linha do resultado: um SKU em um local de armazenagem
+KEY_COLUMNS = ('local_estoque', 'sku')
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas conhecidas para os dtypes nativos do esquema
+    
+    Colunas fora do esquema (queries customizadas) são mantidas como vieram.
+    
+    Args:
+        df: DataFrame retornado pela query
+        
+    Returns:
+        DataFrame com as colunas convertidas
+    """
+    dtypes = {}
+    for column in df.columns:
+        dtype = COLUMN_DTYPES.get(str(column).lower())
+        if dtype and df[column].dtype != dtype:
+            dtypes[column] = dtype
+    return df.astype(dtypes) if dtypes else df
+
+
+def number_format(column: str) -> str:
+    """
+    Retorna o formato numérico do Excel para uma coluna, se houver
+    
+    Args:
+        column: Nome da coluna
+        
+    Returns:
+        Formato numérico ou None
+    """
+    return NUMBER_FORMATS.get(str(column).lower())
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo do resultado, independente da ordem das linhas
+    
+    As linhas são ordenadas por local e SKU e cada uma vira um hash de 64
+    bits (vetorizado); o SHA-256 é calculado sobre esses hashes.
+    
+    Args:
+        df: DataFrame com os dados
+        
+    Returns:
+        Hash SHA-256 em hexadecimal
+    """
+    columns = {str(name).lower(): name for name in df.columns}
+    keys = [columns[key] for key in KEY_COLUMNS if key in columns]
+    if keys:
+        # Ordena pelo texto: a ordem das categorias varia entre extrações
+        df = df.sort_values(keys, key=lambda values: values.astype(str), kind='stable')
+    
+    digest = hashlib.sha256()
+    digest.update('\x1f'.join(str(name) for name in df.columns).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
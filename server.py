@@ -0,0 +1,287 @@
+"""
+Servidor HTTP local que serve a planilha
+Gera a planilha em memória, responde com ETag/Last-Modified para que dados
+sem mudança não sejam baixados de novo e junta requisições simultâneas em
+uma única extração (single-flight)
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+import psycopg2
+import metrics
+from config import SQL_FILE, SERVER_HOST, SERVER_PORT, SERVER_MAX_AGE_SECONDS, SERVER_MIN_REFRESH_SECONDS, PREPARED_STATEMENTS
+from database import DatabaseConnection
+from export_excel import ExcelExporter
+from exporters import output_filename
+from matview import report_staleness
+from pool import ConnectionPool
+from query_params import query_params
+from schema import content_hash
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Workbook:
+    """Planilha gerada em memória, com os metadados usados no cache HTTP"""
+    
+    def __init__(self, content: bytes, digest: str, rows: int):
+        """
+        Args:
+            content: Conteúdo do arquivo .xlsx
+            digest: Hash do conteúdo dos dados (schema.content_hash)
+            rows: Quantidade de linhas
+        """
+        self.content = content
+        self.digest = digest
+        self.rows = rows
+        self.etag = f'"{digest[:32]}"'
+        # Última mudança dos dados (segundos inteiros, como no cabeçalho HTTP)
+        self.last_modified = int(time.time())
+        # Última consulta ao banco que confirmou estes dados
+        self.checked_at = time.monotonic()
+
+
+class WorkbookService:
+    """Mantém a planilha atual e junta pedidos simultâneos em uma só extração"""
+    
+    def __init__(self, max_age: float = None, params: dict = None, min_refresh: float = None):
+        """
+        Args:
+            max_age: Segundos em que a planilha é servida sem consultar o
+                banco de novo (padrão: SERVER_MAX_AGE_SECONDS)
+            params: Parâmetros da query (padrão: valores do config)
+            min_refresh: Idade mínima da planilha, em segundos, para que um
+                pedido de atualização consulte o banco (padrão:
+                SERVER_MIN_REFRESH_SECONDS)
+        """
+        self.max_age = SERVER_MAX_AGE_SECONDS if max_age is None else max_age
+        self.min_refresh = SERVER_MIN_REFRESH_SECONDS if min_refresh is None else min_refresh
+        self.params = params or query_params()
+        # Uma conexão mantida aberta, com a query preparada no servidor
+        self.pool = ConnectionPool(max_connections=1)
+        self.current: Optional[Workbook] = None
+        self._flight: Optional[Future] = None
+        self._lock = threading.Lock()
+    
+    def is_fresh(self, max_age: float = None) -> bool:
+        """Indica se a planilha atual ainda está dentro da validade (padrão: self.max_age)"""
+        current = self.current
+        max_age = self.max_age if max_age is None else max_age
+        return current is not None and time.monotonic() - current.checked_at < max_age
+    
+    def get(self, refresh: bool = False) -> Workbook:
+        """
+        Devolve a planilha atual, extraindo de novo se ela tiver vencido
+        
+        Pedidos que chegam durante uma extração esperam por ela em vez de
+        iniciar outra: N downloads simultâneos custam uma consulta. Pedidos
+        de atualização só consultam o banco se a planilha tiver mais de
+        `min_refresh` segundos, para que clientes repetindo ?refresh=1 não
+        transformem cada download em uma query.
+        
+        Args:
+            refresh: Se True, ignora a validade e consulta o banco (respeitando
+                a idade mínima)
+            
+        Returns:
+            Planilha atual
+            
+        Raises:
+            RuntimeError: Se a extração falhar
+        """
+        with self._lock:
+            max_age = min(self.min_refresh, self.max_age) if refresh else None
+            if self.is_fresh(max_age):
+                return self.current
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = Future()
+        
+        if not leader:
+            print("⏳ Aguardando a extração em andamento...")
+            return flight.result()
+        
+        try:
+            workbook = self._extract()
+            flight.set_result(workbook)
+            return workbook
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+    
+    def _extract(self) -> Workbook:
+        """Executa a query e gera a planilha, reaproveitando a anterior se os dados não mudaram"""
+        with metrics.RunMetrics(mode='servidor') as run:
+            with open(SQL_FILE, 'r', encoding='utf-8') as f:
+                query = f.read()
+            
+            def query_once(connection):
+                report_staleness(connection)
+                return DatabaseConnection(connection).execute_query(
+                    query, params=self.params, prepared=PREPARED_STATEMENTS
+                )
+            
+            try:
+                # Conexão que cai no meio da query: repete uma vez em outra conexão
+                df = self.pool.run(query_once)
+            except psycopg2.Error as e:
+                raise RuntimeError(f"Erro ao conectar ao banco de dados: {e}") from e
+            if df is None:
+                raise RuntimeError("Falha ao executar a query")
+            
+            with metrics.stage('hash'):
+                digest = content_hash(df)
+            
+            previous = self.current
+            if previous is not None and previous.digest == digest:
+                # Mesmos dados: mesma planilha, mesmo ETag e Last-Modified
+                run.mode = 'servidor_sem_mudancas'
+                previous.checked_at = time.monotonic()
+                print(f"💤 Sem mudanças ({len(df)} registros); planilha mantida.")
+                workbook = previous
+            else:
+                content = ExcelExporter.export_bytes(df)
+                if content is None:
+                    raise RuntimeError("Falha ao gerar a planilha")
+                workbook = Workbook(content, digest, len(df))
+                self.current = workbook
+                print(f"📊 Planilha gerada em memória ({len(df)} registros, {len(content) / 1024:.0f} KB).")
+        
+        for line in run.summary_lines():
+            print(line)
+        run.save()
+        return workbook
+    
+    def close(self):
+        """Fecha a conexão com o banco"""
+        self.pool.close()
+
+
+class SpreadsheetHandler(BaseHTTPRequestHandler):
+    """
+    GET /            -> planilha (também em /<nome do arquivo>.xlsx)
+    GET /?refresh=1  -> consulta o banco mesmo dentro da validade (se a
+                        planilha tiver mais de SERVER_MIN_REFRESH_SECONDS)
+    GET /status      -> estado da planilha atual (JSON)
+    """
+    
+    service: WorkbookService = None
+    filename = os.path.basename(output_filename('xlsx'))
+    
+    def do_HEAD(self):
+        self._serve(send_body=False)
+    
+    def do_GET(self):
+        self._serve(send_body=True)
+    
+    def _serve(self, send_body: bool):
+        url = urlsplit(self.path)
+        if url.path == '/status':
+            self._send_status(send_body)
+            return
+        if url.path not in ('/', f'/{self.filename}'):
+            self.send_error(404, "Use / para baixar a planilha")
+            return
+        
+        refresh = parse_qs(url.query).get('refresh', ['0'])[0].lower() in ('1', 'true', 'sim')
+        try:
+            workbook = self.service.get(refresh=refresh)
+        except Exception as e:
+            print(f"❌ Erro na extração: {e}")
+            self.send_error(503, "Falha ao gerar a planilha", str(e))
+            return
+        
+        if self._not_modified(workbook):
+            self.send_response(304)
+            self._send_cache_headers(workbook)
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', XLSX_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(workbook.content)))
+        self.send_header('Content-Disposition', f'attachment; filename="{self.filename}"')
+        self._send_cache_headers(workbook)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(workbook.content)
+    
+    def _not_modified(self, workbook: Workbook) -> bool:
+        """Pedido condicional de quem já tem esta versão da planilha"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match tem precedência sobre If-Modified-Since (RFC 9110)
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or workbook.etag in tags or f'W/{workbook.etag}' in tags
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return workbook.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+    
+    def _send_cache_headers(self, workbook: Workbook):
+        self.send_header('ETag', workbook.etag)
+        self.send_header('Last-Modified', formatdate(workbook.last_modified, usegmt=True))
+        # O cliente sempre revalida; com dados iguais recebe 304 sem corpo
+        self.send_header('Cache-Control', 'no-cache')
+    
+    def _send_status(self, send_body: bool):
+        import json
+        
+        current = self.service.current
+        status = {'fresh': self.service.is_fresh(), 'workbook': None}
+        if current is not None:
+            status['workbook'] = {
+                'etag': current.etag,
+                'last_modified': formatdate(current.last_modified, usegmt=True),
+                'rows': current.rows,
+                'bytes': len(current.content),
+            }
+        body = json.dumps(status, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        print(f"🌐 {self.address_string()} {format % args}")
+
+
+def serve(host: str = None, port: int = None, max_age: float = None, params: dict = None):
+    """
+    Inicia o servidor HTTP e atende até Ctrl+C
+    
+    Args:
+        host: Endereço de escuta (padrão: SERVER_HOST)
+        port: Porta (padrão: SERVER_PORT)
+        max_age: Validade da planilha em segundos (padrão: SERVER_MAX_AGE_SECONDS)
+        params: Parâmetros da query (padrão: valores do config)
+    """
+    host = host or SERVER_HOST
+    port = SERVER_PORT if port is None else port
+    service = WorkbookService(max_age, params)
+    handler = type('Handler', (SpreadsheetHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    
+    print(f"🌐 Servindo a planilha em http://{host}:{server.server_port}/ "
+          f"(validade de {service.max_age:.0f} s)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,331 @@
+"""
+Snapshots das extrações e relatório de alterações
+Cada extração é guardada em formato colunar compacto (Parquet, só as colunas
+comparadas) e comparada com a anterior em um único merge vetorizado
+"""
+import os
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pandas as pd
+import metrics
+from cache import PARQUET_AVAILABLE
+from config import SNAPSHOT_DIR, SNAPSHOT_KEEP
+from export_excel import ExcelExporter
+from schema import KEY_COLUMNS, apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet
+except ImportError:
+    pass
+
+# Colunas guardadas em cada snapshot
+SNAPSHOT_COLUMNS = KEY_COLUMNS + ('material', 'custo', 'preco_de', 'qtde', 'preco_por')
+
+# Colunas comparadas entre duas extrações
+COMPARED_COLUMNS = ('qtde', 'preco_por')
+
+# Colunas sem as quais não há relatório (CUSTO e PRECO_DE só ajudam a parear)
+REQUIRED_COLUMNS = KEY_COLUMNS + ('material',) + COMPARED_COLUMNS
+
+# Colunas que ordenam as chaves repetidas antes do pareamento (nunca as
+# comparadas: uma alteração não pode trocar os pares)
+PAIRING_COLUMNS = ('material', 'custo', 'preco_de')
+
+CHANGES_SHEET = 'Alterações'
+
+# Situação de cada linha do relatório
+ADDED = 'Novo'
+REMOVED = 'Removido'
+CHANGED = 'Alterado'
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduz o resultado às colunas do snapshot, com nomes em minúsculas
+    
+    Args:
+        df: DataFrame da extração
+        
+    Returns:
+        DataFrame só com as colunas do snapshot presentes no resultado
+    """
+    columns = {str(name).lower(): name for name in df.columns}
+    present = [name for name in SNAPSHOT_COLUMNS if name in columns]
+    return df[[columns[name] for name in present]].set_axis(present, axis=1)
+
+
+class SnapshotWriter:
+    """Grava um snapshot lote a lote (usado no pipeline)"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Arquivo final do snapshot (gravado em .tmp e renomeado ao fechar)
+        """
+        self.path = path
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._writer = None
+        self._schema = None
+        self.rows = 0
+    
+    def write(self, chunk: pd.DataFrame):
+        """Acrescenta um lote ao snapshot"""
+        chunk = compact(apply_schema(chunk))
+        # Categorias viram texto: cada lote tem o seu próprio dicionário
+        chunk = chunk.astype({
+            name: 'string' for name in chunk.columns
+            if isinstance(chunk[name].dtype, pd.CategoricalDtype)
+        })
+        with metrics.stage('snapshot'):
+            if self._writer is None:
+                self._schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                self._writer = pyarrow.parquet.ParquetWriter(self._tmp_path, self._schema)
+            self._writer.write_table(pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False))
+        self.rows += len(chunk)
+    
+    def close(self, keep: bool = True):
+        """
+        Fecha o snapshot
+        
+        Args:
+            keep: Se False (extração com erro), descarta o arquivo
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        if keep:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+
+class SnapshotStore:
+    """Pasta com os snapshots das últimas extrações"""
+    
+    PREFIX = 'snapshot_'
+    EXTENSION = '.parquet'
+    
+    def __init__(self, directory: str = None, keep: int = None):
+        """
+        Args:
+            directory: Pasta dos snapshots (padrão: SNAPSHOT_DIR)
+            keep: Quantidade de snapshots mantidos (padrão: SNAPSHOT_KEEP)
+        """
+        self.directory = directory or SNAPSHOT_DIR
+        self.keep = max(2, keep or SNAPSHOT_KEEP)
+        self.enabled = PARQUET_AVAILABLE
+    
+    def paths(self) -> list:
+        """Snapshots existentes, do mais antigo para o mais recente"""
+        try:
+            names = sorted(
+                name for name in os.listdir(self.directory)
+                if name.startswith(self.PREFIX) and name.endswith(self.EXTENSION)
+            )
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+    
+    def latest(self) -> Optional[str]:
+        """Caminho do snapshot mais recente, ou None"""
+        paths = self.paths()
+        return paths[-1] if paths else None
+    
+    def new_writer(self) -> SnapshotWriter:
+        """Cria o gravador do próximo snapshot"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.PREFIX}{datetime.now():%Y%m%d_%H%M%S_%f}{self.EXTENSION}"
+        return SnapshotWriter(os.path.join(self.directory, name))
+    
+    def save(self, df: pd.DataFrame) -> Optional[str]:
+        """
+        Grava o snapshot de uma extração e remove os mais antigos
+        
+        Args:
+            df: DataFrame da extração
+            
+        Returns:
+            Caminho do snapshot, ou None se não foi possível gravar
+        """
+        if not self.enabled:
+            return None
+        writer = self.new_writer()
+        try:
+            writer.write(df)
+            writer.close()
+        except Exception as e:
+            print(f"⚠️ Não foi possível gravar o snapshot: {e}")
+            writer.close(keep=False)
+            return None
+        self.prune()
+        return writer.path
+    
+    def prune(self):
+        """Mantém só os `keep` snapshots mais recentes"""
+        for path in self.paths()[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _joint_codes(left: pd.Series, right: pd.Series) -> tuple:
+    """
+    Códigos inteiros comuns às duas colunas (valores iguais, código igual)
+    
+    Returns:
+        Tupla (códigos da esquerda, códigos da direita, valores únicos)
+    """
+    values = pd.concat([left.astype('string'), right.astype('string')], ignore_index=True)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return codes[:len(left)], codes[len(left):], uniques
+
+
+def _occurrence(frame: pd.DataFrame, keys: list) -> np.ndarray:
+    """
+    Número da ocorrência de cada chave repetida (0 na primeira)
+    
+    Só as linhas com chave repetida são ordenadas, pelas colunas de
+    PAIRING_COLUMNS e depois pela ordem original, para que o pareamento não
+    dependa da ordem em que vieram do banco nem dos valores comparados.
+    """
+    occurrence = np.zeros(len(frame), dtype=np.int64)
+    repeated = frame.duplicated(keys, keep=False).to_numpy()
+    if repeated.any():
+        order = keys + [name for name in PAIRING_COLUMNS if name in frame.columns]
+        subset = frame[repeated].sort_values(order, kind='stable')
+        numbered = subset.groupby(keys, sort=False).cumcount()
+        occurrence[numbered.index.to_numpy()] = numbered.to_numpy()
+    return occurrence
+
+
+def diff_snapshots(previous: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compara duas extrações por (LOCAL_ESTOQUE, SKU) em um único merge
+    
+    As chaves viram códigos inteiros comuns às duas extrações, então o merge
+    compara inteiros em vez de textos. Chaves repetidas são pareadas pela
+    ordem de ocorrência.
+    
+    Args:
+        previous: Snapshot anterior (colunas do snapshot)
+        current: Snapshot atual (colunas do snapshot)
+        
+    Returns:
+        DataFrame com as linhas novas, removidas ou com QTDE/PRECO_POR
+        alterados, com os valores anteriores, atuais e a variação
+        
+    Raises:
+        ValueError: Se faltar em algum dos snapshots uma coluna de REQUIRED_COLUMNS
+            (ex.: query personalizada sem MATERIAL)
+    """
+    keys = list(KEY_COLUMNS)
+    previous, current = compact(previous), compact(current)
+    missing = [
+        name.upper() for name in REQUIRED_COLUMNS
+        if name not in previous.columns or name not in current.columns
+    ]
+    if missing:
+        raise ValueError(f"Colunas não encontradas no resultado para comparar extrações: {', '.join(missing)}")
+    # Snapshots antigos não têm CUSTO e PRECO_DE: usa só as colunas comuns
+    common = [name for name in previous.columns if name in current.columns]
+    previous, current = previous[common], current[common]
+    
+    with metrics.stage('diff'):
+        codes, uniques = {}, {}
+        for key in keys:
+            left, right, uniques[key] = _joint_codes(previous[key], current[key])
+            codes[key] = (left, right)
+        
+        join = [f"_{key}" for key in keys] + ['_ocorrencia']
+        values = [name for name in previous.columns if name not in keys]
+        sides = []
+        for side, frame in enumerate((previous, current)):
+            coded = pd.DataFrame({f"_{key}": codes[key][side] for key in keys})
+            for name in values:
+                coded[name] = frame[name].to_numpy()
+            coded['_ocorrencia'] = _occurrence(coded, join[:-1])
+            sides.append(coded)
+        
+        merged = sides[0].merge(
+            sides[1], on=join, how='outer', suffixes=('_anterior', '_atual'), indicator=True
+        )
+        
+        changed = np.zeros(len(merged), dtype=bool)
+        for name in COMPARED_COLUMNS:
+            before, after = merged[f"{name}_anterior"], merged[f"{name}_atual"]
+            same = (before == after) | (before.isna() & after.isna())
+            changed |= ~same.to_numpy(dtype=bool)
+        
+        status = np.select(
+            [merged['_merge'].eq('right_only'), merged['_merge'].eq('left_only'), changed],
+            [ADDED, REMOVED, CHANGED],
+            default=''
+        )
+        mask = status != ''
+        merged = merged[mask]
+        
+        # Só as linhas alteradas voltam dos códigos para o texto
+        report = pd.DataFrame({
+            key: uniques[key].take(merged[f"_{key}"].to_numpy()) for key in keys
+        })
+        # O nome do material vem da extração atual (ou da anterior, se removido)
+        report['material'] = merged['material_atual'].fillna(merged['material_anterior']).to_numpy()
+        report['situacao'] = status[mask]
+        for name in COMPARED_COLUMNS:
+            before = merged[f"{name}_anterior"].to_numpy()
+            after = merged[f"{name}_atual"].to_numpy()
+            report[f"{name}_anterior"] = before
+            report[f"{name}_atual"] = after
+            report[f"variacao_{name}"] = np.nan_to_num(after) - np.nan_to_num(before)
+        
+        return report.sort_values(keys, kind='stable', ignore_index=True)
+
+
+def changes_filename(output: str) -> str:
+    """Arquivo do relatório de alterações, ao lado da planilha"""
+    return f"{os.path.splitext(output)[0]}_alteracoes.xlsx"
+
+
+def write_changes_report(previous_path: str, current_path: str, output: str) -> Optional[dict]:
+    """
+    Compara dois snapshots e grava a planilha de alterações
+    
+    Args:
+        previous_path: Snapshot da extração anterior
+        current_path: Snapshot da extração atual
+        output: Planilha da extração (o relatório é gravado ao lado)
+        
+    Returns:
+        Dicionário com a quantidade de linhas por situação e o arquivo
+        gerado, ou None em caso de erro
+    """
+    try:
+        with metrics.stage('snapshot'):
+            previous = pd.read_parquet(previous_path)
+            current = pd.read_parquet(current_path)
+        
+        changes = diff_snapshots(previous, current)
+        report = changes_filename(output)
+        if ExcelExporter.export_sheets([(CHANGES_SHEET, changes)], report) < 0:
+            return None
+        
+        summary = changes['situacao'].value_counts().to_dict()
+        summary = {status: int(summary.get(status, 0)) for status in (ADDED, REMOVED, CHANGED)}
+        summary['arquivo'] = report
+        return summary
+    
+    except Exception as e:
+        print(f"❌ Erro ao gerar relatório de alterações: {e}")
+        return None
+
+
+def format_summary(summary: dict) -> str:
+    """Resumo curto do relatório de alterações, para log"""
+    return (
+        f"🔁 Alterações: {summary[ADDED]} novos, {summary[REMOVED]} removidos, "
+        f"{summary[CHANGED]} alterados ({summary['arquivo']})"
+    )
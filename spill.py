@@ -0,0 +1,214 @@
+"""
+Buffer de lotes com orçamento de memória
+Os lotes buscados ficam na memória até o orçamento (MEMORY_BUDGET_MB); acima
+dele, passam para um arquivo temporário colunar (Arrow IPC) que a exportação
+lê lote a lote, sem montar o resultado inteiro
+"""
+import os
+import tempfile
+from typing import Callable, Iterable, Iterator, Optional
+import pandas as pd
+import metrics
+from config import MEMORY_BUDGET_MB, SPILL_DIR
+from schema import apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+
+def _require_arrow():
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("Gravação em disco requer o pacote pyarrow (pip install pyarrow)")
+
+
+class SpillFile:
+    """Arquivo temporário Arrow IPC gravado e lido lote a lote"""
+    
+    def __init__(self, path: str = None, directory: str = None):
+        """
+        Args:
+            path: Caminho do arquivo (padrão: novo arquivo temporário)
+            directory: Pasta do arquivo temporário (padrão: SPILL_DIR ou a
+                pasta temporária do sistema)
+        """
+        _require_arrow()
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='oferta_', suffix='.arrow', dir=directory or SPILL_DIR or None)
+            os.close(fd)
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+    
+    def write(self, chunk: pd.DataFrame):
+        """Acrescenta um lote ao arquivo"""
+        with metrics.stage('spill_write'):
+            table = pa.Table.from_pandas(apply_schema(chunk), preserve_index=False)
+            if self._writer is None:
+                # Sem dicionários: o formato de arquivo IPC exige os mesmos em todos os lotes
+                self._schema = pa.schema([
+                    field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                    for field in table.schema
+                ])
+                self._writer = pyarrow.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        self.rows += len(chunk)
+    
+    def finish(self):
+        """Fecha a gravação (o arquivo passa a poder ser lido)"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+    
+    @property
+    def size(self) -> int:
+        """Tamanho do arquivo em bytes"""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+    
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """
+        Lê os lotes gravados, um por vez (leitura comum, não memory map: as
+        páginas mapeadas contariam na memória do processo até o fim da leitura)
+        
+        Yields:
+            DataFrame de cada lote, com o esquema aplicado
+        """
+        self.finish()
+        if not self.rows:
+            return
+        with pa.OSFile(self.path, 'rb') as source:
+            reader = pyarrow.ipc.open_file(source)
+            for idx in range(reader.num_record_batches):
+                with metrics.stage('spill_read'):
+                    chunk = apply_schema(reader.get_batch(idx).to_pandas())
+                yield chunk
+    
+    def remove(self):
+        """Apaga o arquivo"""
+        self.finish()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class SpillBuffer:
+    """Lotes na memória até o orçamento; o excedente vai para um SpillFile"""
+    
+    def __init__(self, budget_mb: float = None, directory: str = None):
+        """
+        Args:
+            budget_mb: Orçamento de memória para os lotes, em MB
+                (padrão: MEMORY_BUDGET_MB; 0 = sem limite)
+            directory: Pasta do arquivo temporário (padrão: SPILL_DIR)
+        """
+        budget_mb = MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.directory = directory
+        self.rows = 0
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.spill: Optional[SpillFile] = None
+        self._chunks = []
+    
+    @property
+    def spilled(self) -> bool:
+        """Indica se os lotes passaram para o disco"""
+        return self.spill is not None
+    
+    def append(self, chunk: pd.DataFrame):
+        """
+        Guarda um lote, passando tudo para o disco ao estourar o orçamento
+        
+        Args:
+            chunk: Lote buscado no banco
+        """
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        
+        if self.spill is not None:
+            self.spill.write(chunk)
+            return
+        
+        size = int(chunk.memory_usage(index=False, deep=True).sum())
+        if self.budget_bytes and self.memory_bytes + size > self.budget_bytes:
+            self.spill = SpillFile(directory=self.directory)
+            for held in self._chunks + [chunk]:
+                self.spill.write(held)
+            self._chunks = []
+            self.memory_bytes = 0
+            return
+        
+        self._chunks.append(chunk)
+        self.memory_bytes += size
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+    
+    def extend(self, chunks: Iterable[pd.DataFrame],
+               on_batch: Optional[Callable[[pd.DataFrame], None]] = None) -> int:
+        """
+        Guarda todos os lotes de um iterável (ex.: DatabaseConnection.stream_query)
+        
+        Args:
+            chunks: Lotes buscados no banco
+            on_batch: Função chamada com cada lote (ex.: gravação do snapshot)
+            
+        Returns:
+            Total de linhas guardadas
+        """
+        for chunk in chunks:
+            if on_batch and not chunk.empty:
+                on_batch(chunk)
+            self.append(chunk)
+        if self.spill is not None:
+            self.spill.finish()
+        return self.rows
+    
+    def chunks(self) -> Iterator[pd.DataFrame]:
+        """
+        Lotes guardados, na ordem em que chegaram
+        
+        Yields:
+            DataFrame de cada lote
+        """
+        if self.spill is not None:
+            yield from self.spill.chunks()
+        else:
+            for chunk in self._chunks:
+                yield apply_schema(chunk)
+    
+    def record_metrics(self):
+        """Registra o orçamento e o uso do buffer nas métricas da execução"""
+        metrics.count('memory_budget_bytes', self.budget_bytes)
+        metrics.count('buffer_peak_bytes', self.peak_memory_bytes)
+        if self.spill is not None:
+            metrics.count('spilled_rows', self.spill.rows)
+            metrics.count('spilled_bytes', self.spill.size)
+    
+    def describe(self) -> str:
+        """Resumo do uso do buffer, para log"""
+        if self.spill is None:
+            return f"💾 {self.rows} registros na memória ({self.peak_memory_bytes / 1024 / 1024:.0f} MB)"
+        return (
+            f"💽 Acima do orçamento de {self.budget_bytes / 1024 / 1024:.0f} MB: "
+            f"{self.spill.rows} registros em disco ({self.spill.size / 1024 / 1024:.0f} MB)"
+        )
+    
+    def close(self):
+        """Libera os lotes e apaga o arquivo temporário"""
+        self._chunks = []
+        if self.spill is not None:
+            self.spill.remove()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
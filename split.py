@@ -0,0 +1,276 @@
+"""
+Exportação separada por local de armazenagem
+Particiona o resultado por LOCAL_ESTOQUE com um único groupby e grava uma
+aba ou um arquivo por local, com os arquivos gerados em processos paralelos
+"""
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import pandas as pd
+import metrics
+from config import SPLIT_MODE, SPLIT_WORKERS, CSV_SEPARATOR, CSV_ENCODING, EXPORT_FORMAT
+from export_excel import ExcelExporter
+from exporters import EXPORTERS, get_exporter, temp_filename, replace_output, remove_output
+
+MODES = ('sheets', 'files')
+
+# Coluna usada na partição
+LOCATION_COLUMN = 'local_estoque'
+
+# Nome usado para linhas sem local
+NO_LOCATION = 'Sem local'
+
+# Limite de caracteres e caracteres proibidos em nomes de abas do Excel
+MAX_SHEET_TITLE = 31
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+# Caracteres proibidos em nomes de arquivo (Windows)
+INVALID_FILE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def partition(df: pd.DataFrame) -> List[Tuple[str, pd.DataFrame]]:
+    """
+    Separa o DataFrame por local de armazenagem em uma única passada
+    
+    Args:
+        df: DataFrame com a coluna LOCAL_ESTOQUE
+    
+    Returns:
+        Lista de tuplas (local, linhas do local), na ordem em que os locais
+        aparecem no resultado
+    
+    Raises:
+        ValueError: Se o DataFrame não tiver a coluna de local
+    """
+    column = next((name for name in df.columns if str(name).lower() == LOCATION_COLUMN), None)
+    if column is None:
+        raise ValueError(f"Coluna {LOCATION_COLUMN.upper()} não encontrada no resultado")
+    
+    with metrics.stage('split'):
+        # O resultado já vem no ORDER BY l.nome, na collation do banco (a mesma
+        # ordem que parallel.py reproduz); ordenar aqui usaria a ordem do Python
+        groups = df.groupby(column, observed=True, sort=False, dropna=False)
+        return [
+            (NO_LOCATION if pd.isna(location) else str(location), group)
+            for location, group in groups
+        ]
+
+
+def _unique(name: str, used: set, max_length: int = None) -> str:
+    """Acrescenta um sufixo numérico até o nome não repetir (sem diferenciar maiúsculas)"""
+    candidate = name[:max_length] if max_length else name
+    suffix = 2
+    while candidate.lower() in used:
+        tail = f" ({suffix})"
+        candidate = (name[:max_length - len(tail)] if max_length else name) + tail
+        suffix += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def sheet_title(location: str, used: set) -> str:
+    """
+    Nome de aba válido e único para um local
+    
+    Args:
+        location: Nome do local
+        used: Nomes já usados (atualizado)
+    
+    Returns:
+        Nome da aba
+    """
+    name = INVALID_SHEET_CHARS.sub('-', location).strip("' ") or NO_LOCATION
+    return _unique(name, used, MAX_SHEET_TITLE)
+
+
+def file_stem(location: str, used: set) -> str:
+    """
+    Nome de arquivo válido e único para um local (sem extensão)
+    
+    Args:
+        location: Nome do local
+        used: Nomes já usados (atualizado)
+    
+    Returns:
+        Nome do arquivo
+    """
+    name = INVALID_FILE_CHARS.sub('_', location).strip('. ') or NO_LOCATION
+    return _unique(name, used)
+
+
+def _export_group(job: tuple) -> Tuple[int, int]:
+    """
+    Grava o arquivo de um local (executado em um processo do pool)
+    
+    Args:
+        job: Tupla (exportador, DataFrame, caminho)
+    
+    Returns:
+        Tupla (linhas gravadas, bytes do arquivo), com -1 linhas em caso de erro
+    """
+    exporter, group, path = job
+    if not exporter.export_data(group, path):
+        return -1, 0
+    return len(group), os.path.getsize(path)
+
+
+class LocationSplitter:
+    """Grava uma aba ou um arquivo por local de armazenagem, mais um índice"""
+    
+    def __init__(self, mode: str = None, workers: int = None, export_format: str = None):
+        """
+        Args:
+            mode: 'sheets' (uma aba por local) ou 'files' (um arquivo por local)
+                (padrão: SPLIT_MODE)
+            workers: Processos que geram os arquivos (padrão: SPLIT_WORKERS, ou
+                o número de núcleos)
+            export_format: Formato dos arquivos do modo 'files' (padrão: EXPORT_FORMAT)
+        
+        Raises:
+            ValueError: Se o modo for inválido, ou 'sheets' com formato diferente de xlsx
+        """
+        self.mode = (mode or SPLIT_MODE or 'sheets').lower()
+        if self.mode not in MODES:
+            raise ValueError(f"Modo de separação inválido: {self.mode} (use {', '.join(MODES)})")
+        self.export_format = (export_format or EXPORT_FORMAT).lower()
+        self.exporter = get_exporter(self.export_format)
+        if self.mode == 'sheets' and self.exporter is not ExcelExporter:
+            raise ValueError("Uma aba por local só é possível no formato xlsx")
+        self.workers = max(1, workers or SPLIT_WORKERS or os.cpu_count() or 1)
+    
+    @staticmethod
+    def index_path(output: str) -> str:
+        """Caminho do índice gerado ao lado da saída"""
+        return f"{os.path.splitext(output)[0]}_indice.csv"
+    
+    def export(self, df: pd.DataFrame, output: str) -> int:
+        """
+        Separa o DataFrame por local e grava as saídas e o índice
+        
+        No modo 'sheets', `output` é a planilha com uma aba por local; no modo
+        'files', os arquivos vão para uma pasta com o nome de `output` sem a
+        extensão. Tudo é gravado em temporários (a planilha, a pasta e o
+        índice) que só substituem as saídas anteriores ao final; em caso de
+        erro ou interrupção, os temporários são removidos.
+        
+        Args:
+            df: DataFrame com os dados
+            output: Caminho da planilha (ou base da pasta de arquivos)
+        
+        Returns:
+            int: Quantidade de linhas gravadas, ou -1 em caso de erro
+        """
+        temp = temp_filename(output)
+        published = False
+        try:
+            groups = partition(df)
+            print(f"🗂️ Separando {len(df)} registros em {len(groups)} locais ({self.mode})...")
+            
+            if self.mode == 'sheets':
+                entries = self._export_sheets(groups, temp, output)
+            else:
+                entries = self._export_files(groups, temp, output)
+            if entries is None:
+                return -1
+            
+            index = pd.DataFrame(entries, columns=['local', 'arquivo', 'aba', 'linhas'])
+            index.to_csv(self.index_path(temp), index=False, sep=CSV_SEPARATOR, encoding=CSV_ENCODING)
+            
+            with metrics.stage('publish'):
+                self._publish(temp, output)
+            published = True
+            print(f"📇 Índice gravado em {self.index_path(output)}")
+            return int(index['linhas'].sum())
+        
+        except Exception as e:
+            print(f"❌ Erro ao separar por local: {e}")
+            return -1
+        finally:
+            if not published:
+                self._discard(temp)
+    
+    def _publish(self, temp: str, output: str):
+        """
+        Move a saída e o índice gerados em `temp` para `output`
+        
+        No modo 'files', a pasta anterior é renomeada antes de a nova tomar
+        o seu lugar e só então apagada, para não misturar arquivos de locais
+        que deixaram de existir.
+        
+        Raises:
+            OSError: Se o destino não puder ser substituído (ex.: aberto no Excel)
+        """
+        if self.mode == 'sheets':
+            replace_output(temp, output)
+        else:
+            directory, staging = os.path.splitext(output)[0], os.path.splitext(temp)[0]
+            previous = f"{directory}.old"
+            if os.path.isdir(directory):
+                shutil.rmtree(previous, ignore_errors=True)
+                os.replace(directory, previous)
+            os.replace(staging, directory)
+            shutil.rmtree(previous, ignore_errors=True)
+        os.replace(self.index_path(temp), self.index_path(output))
+    
+    def _discard(self, temp: str):
+        """Remove os temporários de uma exportação que não terminou"""
+        if self.mode == 'sheets':
+            remove_output(temp)
+        else:
+            shutil.rmtree(os.path.splitext(temp)[0], ignore_errors=True)
+        remove_output(self.index_path(temp))
+    
+    def _export_sheets(self, groups: list, path: str, output: str) -> Optional[list]:
+        """
+        Grava uma aba por local na planilha `path` (o índice cita `output`)
+        
+        As abas são gravadas em sequência, em um único processo: as abas de
+        uma mesma planilha só poderiam ser geradas em paralelo montando o
+        XML do arquivo fora do openpyxl. O paralelismo fica no modo 'files'.
+        """
+        used = set()
+        sheets = [(sheet_title(location, used), group) for location, group in groups]
+        if ExcelExporter.export_sheets(sheets, path) < 0:
+            return None
+        
+        filename = os.path.basename(output)
+        return [
+            (location, filename, title, len(group))
+            for (location, group), (title, _) in zip(groups, sheets)
+        ]
+    
+    def _export_files(self, groups: list, path: str, output: str) -> Optional[list]:
+        """Grava um arquivo por local na pasta de `path`, em processos paralelos (o índice cita a de `output`)"""
+        directory = os.path.splitext(path)[0]
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        
+        used = set()
+        paths = [
+            os.path.join(directory, file_stem(location, used) + EXPORTERS[self.export_format][1])
+            for location, _ in groups
+        ]
+        jobs = [(self.exporter, group, path) for (_, group), path in zip(groups, paths)]
+        
+        workers = min(self.workers, len(jobs))
+        if workers > 1:
+            print(f"⚙️ Gerando {len(jobs)} arquivos em {workers} processos...")
+            with metrics.stage('write'):
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(_export_group, jobs))
+            # Os processos do pool não registram contadores nesta execução
+            metrics.count('rows', sum(max(rows, 0) for rows, _ in results))
+            metrics.count('bytes_written', sum(size for _, size in results))
+        else:
+            results = [_export_group(job) for job in jobs]
+        
+        if any(rows < 0 for rows, _ in results):
+            print("❌ Falha ao gerar o arquivo de um ou mais locais")
+            return None
+        
+        return [
+            (location, os.path.join(os.path.basename(os.path.splitext(output)[0]), os.path.basename(file)), '', rows)
+            for (location, _), file, (rows, _) in zip(groups, paths, results)
+        ]
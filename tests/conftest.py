@@ -0,0 +1,23 @@
+"""
+Configuração dos testes: os módulos do projeto ficam na raiz do repositório
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database():
+    """Conexão com o PostgreSQL do .env; o teste é pulado sem banco acessível"""
+    from config import DB_CONFIG
+    from database import DatabaseConnection
+    
+    if not DB_CONFIG.get('database'):
+        pytest.skip("Banco não configurado (DB_NAME no .env)")
+    db = DatabaseConnection(db_config={**DB_CONFIG, 'connect_timeout': 5})
+    if not db.connect():
+        pytest.skip("Banco configurado não está acessível")
+    yield db
+    db.close()
@@ -0,0 +1,80 @@
+"""
+PostgreSQL simulado para os testes
+Conexão e cursor em memória com o necessário da interface do psycopg2: o
+cursor entrega as linhas de um DataFrame em lotes de tuplas, como o banco
+"""
+import numpy as np
+import pandas as pd
+
+
+def sample_data(rows: int, locations, seed: int = 0) -> pd.DataFrame:
+    """
+    Gera linhas sintéticas com as colunas e a ordem da query.sql
+    
+    Args:
+        rows: Quantidade de linhas
+        locations: Nomes dos locais de armazenagem
+        seed: Semente do gerador (mesma semente, mesmos dados)
+        
+    Returns:
+        DataFrame ordenado por local_estoque e material, como o ORDER BY da query
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'local_estoque': rng.choice(np.array(sorted(set(locations))), size=rows),
+        'sku': [f'SKU{value:07d}' for value in rng.integers(1, 10_000_000, size=rows)],
+        'material': [f'Material {value:04d}' for value in rng.integers(1, 5000, size=rows)],
+        'qtde': np.round(rng.gamma(2.0, 15.0, size=rows), 3),
+        'custo': np.round(rng.uniform(5, 500, size=rows), 2),
+        'preco_de': np.round(rng.uniform(20, 1500, size=rows), 4),
+        'preco_por': np.round(rng.uniform(10, 1200, size=rows), 2),
+    })
+    return df.sort_values(['local_estoque', 'material'], kind='stable', ignore_index=True)
+
+
+class StandInCursor:
+    """Cursor simulado: entrega as linhas do DataFrame como tuplas, em lotes"""
+    
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.position = 0
+        self.itersize = 2000
+        self.description = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+    
+    def execute(self, query, params=None):
+        self.position = 0
+        self.description = [(name,) for name in self.df.columns]
+    
+    def fetchmany(self, size):
+        chunk = self.df.iloc[self.position:self.position + size]
+        self.position += len(chunk)
+        # Converte como o psycopg2 faria: uma tupla de objetos Python por linha
+        return list(chunk.astype(object).itertuples(index=False, name=None))
+    
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    """Conexão em memória que responde a toda query com o mesmo DataFrame"""
+    
+    closed = 0
+    encoding = 'UTF8'
+    
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+    
+    def cursor(self, name=None):
+        return StandInCursor(self.df)
+    
+    def rollback(self):
+        pass
+    
+    def commit(self):
+        pass
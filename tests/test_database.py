@@ -0,0 +1,29 @@
+"""
+Testes dos motores de busca (database.py) no PostgreSQL do .env
+Pulados quando não há banco configurado
+"""
+import pandas as pd
+
+QUERY = r"""
+SELECT * FROM (VALUES
+    (1, E'\\N', NULL::text, ''),
+    (2, 'texto', 'outro', NULL)
+) AS t(id, marcador, nulo, vazio)
+ORDER BY id
+"""
+
+
+def values(df: pd.DataFrame) -> list:
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def test_copy_keeps_text_equal_to_null_marker(database):
+    df = database.execute_query(QUERY, engine='copy')
+    assert values(df) == [[1, '\\N', None, ''], [2, 'texto', 'outro', None]]
+
+
+def test_copy_matches_cursor(database):
+    copy = database.execute_query(QUERY.replace(r"E'\\N'", "'sem marcador'"), engine='copy')
+    cursor = database.execute_query(QUERY.replace(r"E'\\N'", "'sem marcador'"), engine='cursor')
+    assert values(copy) == values(cursor)
+    assert values(copy)[0] == [1, 'sem marcador', None, '']
@@ -0,0 +1,75 @@
+"""
+Testes da exportação Excel em lotes (export_excel.py)
+A planilha gravada lote a lote deve ser igual à de um DataFrame só
+"""
+import pytest
+from openpyxl import load_workbook
+import export_excel
+from benchmark import synthetic_data
+from export_excel import ExcelExporter
+from schema import apply_schema
+
+
+@pytest.fixture
+def data():
+    df = apply_schema(synthetic_data(3000, seed=11))
+    # Valores longos só depois do primeiro lote
+    df.loc[2500, 'material'] = 'Material com um nome bem mais comprido que os demais'
+    df.loc[2200, 'preco_por'] = 12345678.9
+    return df
+
+
+def chunked(df, size=1000):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+def sheets(path):
+    wb = load_workbook(path)
+    return [
+        (
+            ws.title,
+            ws.freeze_panes,
+            [ws.column_dimensions[letter].width for letter in 'ABCDEFG'],
+            [[cell.value for cell in row] for row in ws.iter_rows()],
+        )
+        for ws in wb.worksheets
+    ]
+
+
+def test_chunks_like_single_dataframe(data, tmp_path):
+    whole, streamed = tmp_path / 'inteiro.xlsx', tmp_path / 'lotes.xlsx'
+    assert ExcelExporter.export_data(data, str(whole))
+    assert ExcelExporter.export_chunks(chunked(data), str(streamed)) == len(data)
+    
+    expected = sheets(whole)
+    assert sheets(streamed) == expected
+    # A largura veio do lote 3 (linha 2500), dentro da amostra
+    first_batch = ExcelExporter._column_widths(data.iloc[:1000])
+    assert expected[0][2][2] > first_batch[2]
+
+
+def test_chunks_widths_from_bounded_sample(data, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_excel, 'WIDTH_SAMPLE_ROWS', 1500)
+    whole, streamed = tmp_path / 'inteiro.xlsx', tmp_path / 'lotes.xlsx'
+    assert ExcelExporter.export_data(data, str(whole))
+    assert ExcelExporter.export_chunks(chunked(data), str(streamed)) == len(data)
+    
+    (title, panes, widths, rows), = sheets(streamed)
+    # Amostra de dois lotes: a linha 2500 fica de fora das larguras
+    assert widths == ExcelExporter._column_widths(data.iloc[:2000])
+    expected_title, expected_panes, _, expected_rows = sheets(whole)[0]
+    assert (title, panes, rows) == (expected_title, expected_panes, expected_rows)
+
+
+def test_chunks_across_sheets(data, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_excel, 'EXCEL_MAX_ROWS', 1201)
+    monkeypatch.setattr(export_excel, 'EXCEL_SHARD_MODE', 'sheets')
+    # Amostra maior que uma aba: os lotes lidos que não couberam vão para a próxima
+    monkeypatch.setattr(export_excel, 'WIDTH_SAMPLE_ROWS', 2500)
+    whole, streamed = tmp_path / 'inteiro.xlsx', tmp_path / 'lotes.xlsx'
+    assert ExcelExporter.export_data(data, str(whole))
+    assert ExcelExporter.export_chunks(chunked(data), str(streamed)) == len(data)
+    
+    result = sheets(streamed)
+    assert len(result) == 3
+    assert result == sheets(whole)
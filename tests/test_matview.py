@@ -0,0 +1,111 @@
+"""
+Testes do diagnóstico do plano e da visão materializada (matview.py)
+A comparação entre query.sql e query_matview.sql usa o PostgreSQL do .env
+(fixture database do conftest.py) e é pulada quando não há banco configurado
+"""
+import os
+from unittest import mock
+import pandas as pd
+import psycopg2
+import pytest
+import matview
+from matview import MaterializedView, plan_timings, read_sql, report_staleness
+from query_params import query_params
+
+ROOT = os.path.dirname(os.path.abspath(matview.__file__))
+
+PLAN = """
+Sort  (cost=10.1..10.2 rows=4 width=96) (actual time=0.051..0.052 rows=4 loops=1)
+  Sort Key: l.nome, m.nome
+  Buffers: shared hit=12
+Planning Time: 0.412 ms
+Execution Time: 21.875 ms
+"""
+
+
+def connection_returning(*results):
+    """Conexão simulada: cada execute devolve o próximo resultado de fetchall"""
+    connection = mock.MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = list(results)
+    return connection
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(matview, 'MATVIEW_ENABLED', True)
+    monkeypatch.setattr(matview, 'MATVIEW_MAX_AGE_SECONDS', 3600)
+
+
+def test_plan_timings():
+    assert plan_timings(PLAN) == {'Planning': 0.412, 'Execution': 21.875}
+    assert plan_timings("Seq Scan on material") == {}
+
+
+def test_create_rejects_parameters():
+    connection = mock.MagicMock()
+    with pytest.raises(ValueError):
+        MaterializedView(connection).create("SELECT * FROM material WHERE ativo = %(ativo)s")
+    connection.cursor.assert_not_called()
+    connection.commit.assert_not_called()
+
+
+def test_report_staleness_disabled(monkeypatch):
+    monkeypatch.setattr(matview, 'MATVIEW_ENABLED', False)
+    connection = mock.MagicMock()
+    assert report_staleness(connection, log=pytest.fail) is None
+    connection.cursor.assert_not_called()
+
+
+def test_report_staleness_missing_view(enabled):
+    messages = []
+    # to_regclass da visão: não existe
+    assert report_staleness(connection_returning([(False,)]), messages.append) is None
+    assert 'não encontrada' in messages[0]
+
+
+def test_report_staleness_unknown_refresh(enabled):
+    messages = []
+    # Visão existe, mas sem a tabela de registro das atualizações
+    assert report_staleness(connection_returning([(True,)], [(False,)]), messages.append) is None
+    assert 'desconhecida' in messages[0]
+
+
+def test_report_staleness_stale(enabled):
+    messages = []
+    connection = connection_returning([(True,)], [(True,)], [(None, 7200.0, 1.5, 4886, True)])
+    assert report_staleness(connection, messages.append) == 7200.0
+    assert 'desatualizada' in messages[0]
+
+
+def test_report_staleness_fresh(enabled):
+    messages = []
+    connection = connection_returning([(True,)], [(True,)], [(None, 60.0, 1.5, 4886, True)])
+    assert report_staleness(connection, messages.append) == 60.0
+    assert 'atualizada há' in messages[0] and 'desatualizada' not in messages[0]
+
+
+def test_report_staleness_database_error(enabled):
+    messages = []
+    connection = mock.MagicMock()
+    connection.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.Error("sem permissão")
+    assert report_staleness(connection, messages.append) is None
+    connection.rollback.assert_called_once()
+    assert 'Não foi possível' in messages[0]
+
+
+def test_matview_query_matches_base_query(database):
+    connection = database.connection
+    # Tabela TEMP com o nome da visão: a query_matview.sql a lê no lugar da
+    # visão (pg_temp vem antes no search_path) e nada fica gravado no banco
+    definition = read_sql(os.path.join(ROOT, 'matview.sql')).strip().rstrip(';')
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE {matview.MATVIEW_NAME} AS {definition}")
+    # Cada leitura termina em rollback: o commit mantém a tabela na sessão
+    connection.commit()
+    
+    params = query_params()
+    base = database.execute_query(read_sql(os.path.join(ROOT, 'query.sql')), params=params)
+    from_view = database.execute_query(read_sql(os.path.join(ROOT, 'query_matview.sql')), params=params)
+    assert base is not None and from_view is not None
+    pd.testing.assert_frame_equal(from_view, base)
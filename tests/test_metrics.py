@@ -0,0 +1,51 @@
+"""
+Testes da instrumentação das etapas (metrics.py)
+Cada thread registra na própria execução; threads auxiliares só entram na
+execução de quem as criou por meio de metrics.bind
+"""
+import threading
+import metrics
+
+
+def run_in_thread(function):
+    thread = threading.Thread(target=function)
+    thread.start()
+    thread.join()
+
+
+def test_other_threads_do_not_record_into_run():
+    with metrics.RunMetrics() as run:
+        # Ex.: pré-carregamento ou partição rodando durante o clique
+        run_in_thread(lambda: metrics.count('rows', 10))
+        metrics.count('rows', 1)
+    assert run.counters == {'rows': 1}
+
+
+def test_bind_records_into_caller_run():
+    with metrics.RunMetrics() as run:
+        run_in_thread(metrics.bind(lambda: metrics.count('rows', 10)))
+    assert run.counters == {'rows': 10}
+    assert metrics.current_run() is None
+
+
+def test_concurrent_runs_stay_separate():
+    runs = {}
+    ready = threading.Barrier(2)
+    
+    def extraction(name, rows):
+        with metrics.RunMetrics(mode=name) as run:
+            # As duas execuções ficam abertas ao mesmo tempo
+            ready.wait()
+            metrics.count('rows', rows)
+            with metrics.stage(name):
+                pass
+            ready.wait()
+        runs[name] = run
+    
+    threads = [threading.Thread(target=extraction, args=args) for args in (('clique', 5), ('prefetch', 7))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert runs['clique'].counters == {'rows': 5} and list(runs['clique'].stages) == ['clique']
+    assert runs['prefetch'].counters == {'rows': 7} and list(runs['prefetch'].stages) == ['prefetch']
@@ -0,0 +1,195 @@
+"""
+Testes da extração paralela (parallel.py) contra um PostgreSQL simulado
+O simulador (tests/standin.py) entrega os dados sintéticos filtrados pelos
+locais de cada partição, como o banco faria
+"""
+import os
+import random
+import threading
+import pandas as pd
+import pytest
+import database
+import parallel
+from database import DatabaseConnection
+from parallel import (
+    LOCATION_ORDER_SQL, ParallelExtractor, location_ids, partition_locations, with_locations,
+)
+from standin import StandInConnection, StandInCursor, sample_data
+
+ROOT = os.path.dirname(os.path.abspath(parallel.__file__))
+
+with open(os.path.join(ROOT, 'query.sql'), 'r', encoding='utf-8') as f:
+    QUERY = f.read()
+
+# Query antiga, com os locais fixos no texto
+LITERAL_QUERY = (
+    "SELECT l.nome FROM localarmazenagem l "
+    "WHERE l.cdlocalarmazenagem IN (34, 67, 397) ORDER BY l.nome"
+)
+
+# Códigos dos locais; 508 tem o mesmo nome de 506 (o GROUP BY soma os dois)
+LOCATION_NAMES = {
+    34: 'CD Principal', 67: 'Deposito Norte', 397: 'Expedicao',
+    265: 'Loja Centro', 506: 'Loja Sul', 507: 'Showroom', 508: 'Loja Sul',
+}
+
+PARAMS = {'locais': list(LOCATION_NAMES), 'produto': True, 'ativo': True}
+
+
+class LocationCursor(StandInCursor):
+    """Cursor simulado que responde à busca dos nomes e filtra pelos locais da partição"""
+    
+    def __init__(self, df: pd.DataFrame):
+        super().__init__(df)
+        self.rows = []
+    
+    def execute(self, query, params=None):
+        if query == LOCATION_ORDER_SQL:
+            ids = params[0]
+            self.rows = sorted(
+                ((location_id, LOCATION_NAMES[location_id]) for location_id in ids),
+                key=lambda row: row[1]
+            )
+            return
+        names = {LOCATION_NAMES[location_id] for location_id in params['locais']}
+        self.df = self.df[self.df['local_estoque'].isin(names)]
+        super().execute(query, params)
+    
+    def fetchall(self):
+        return self.rows
+
+
+class LocationStandIn(StandInConnection):
+    """Conexão simulada com o filtro de locais da query.sql"""
+    
+    def cursor(self, name=None):
+        return LocationCursor(self.df)
+
+
+class StandInPool:
+    """Pool simulado com a mesma interface do ThreadedConnectionPool"""
+    
+    def __init__(self, df: pd.DataFrame, maxconn: int):
+        self.df = df
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.peak = 0
+        self.closed = False
+        self._lock = threading.Lock()
+    
+    def getconn(self):
+        with self._lock:
+            self.in_use += 1
+            assert self.in_use <= self.maxconn, "pool excedeu o máximo de conexões"
+            self.peak = max(self.peak, self.in_use)
+        return LocationStandIn(self.df)
+    
+    def putconn(self, connection):
+        with self._lock:
+            self.in_use -= 1
+    
+    def closeall(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def standin_session(monkeypatch):
+    # Os tipos do psycopg2 só se registram em conexões reais
+    monkeypatch.setattr(database, 'prepare_connection', lambda connection: None)
+
+
+@pytest.fixture(scope='module')
+def data():
+    return sample_data(3000, LOCATION_NAMES.values(), seed=7)
+
+
+@pytest.fixture
+def pools(data, monkeypatch):
+    created = []
+    
+    def factory(minconn, maxconn, **kwargs):
+        pool = StandInPool(data, maxconn)
+        created.append(pool)
+        return pool
+    
+    monkeypatch.setattr(parallel, 'ThreadedConnectionPool', factory)
+    return created
+
+
+def sequential(data: pd.DataFrame) -> pd.DataFrame:
+    """Resultado da query inteira em uma conexão, como no modo sequencial"""
+    return DatabaseConnection(LocationStandIn(data)).execute_query(QUERY, params=PARAMS)
+
+
+def test_location_ids_from_parameter():
+    assert location_ids(QUERY, PARAMS) == list(LOCATION_NAMES)
+
+
+def test_location_ids_from_literal_filter():
+    assert location_ids(LITERAL_QUERY) == [34, 67, 397]
+
+
+def test_location_ids_errors():
+    with pytest.raises(ValueError):
+        location_ids(QUERY, {'produto': True, 'ativo': True})
+    with pytest.raises(ValueError):
+        location_ids("SELECT 1")
+
+
+def test_with_locations_parameter_keeps_query_text():
+    query, params = with_locations(QUERY, [67, 34], PARAMS)
+    assert query == QUERY
+    assert params == {**PARAMS, 'locais': [67, 34]}
+    # Os parâmetros originais não são alterados
+    assert PARAMS['locais'] == list(LOCATION_NAMES)
+
+
+def test_with_locations_rewrites_literal_filter():
+    query, params = with_locations(LITERAL_QUERY, [397], None)
+    assert "IN (397)" in query
+    assert params is None
+    assert location_ids(query) == [397]
+
+
+def test_partition_per_location():
+    groups = [[34], [506, 508], [67]]
+    assert partition_locations(groups, 'per_location', 2) == [[34], [506, 508], [67]]
+
+
+def test_partition_round_robin():
+    groups = [[34], [506, 508], [67], [397], [265]]
+    partitions = partition_locations(groups, 'round_robin', 2)
+    assert partitions == [[34, 67, 265], [506, 508, 397]]
+    # Mais conexões que locais: uma partição por local, sem partições vazias
+    assert partition_locations(groups[:2], 'round_robin', 4) == [[34], [506, 508]]
+
+
+def test_partition_invalid_strategy():
+    with pytest.raises(ValueError):
+        partition_locations([[34]], 'aleatoria', 2)
+
+
+def test_merge_restores_sequential_order(data):
+    expected = sequential(data)
+    names = sorted(set(LOCATION_NAMES.values()))
+    partitions = []
+    for group in (names[0::2], names[1::2]):
+        ids = [location_id for location_id, name in LOCATION_NAMES.items() if name in group]
+        query, params = with_locations(QUERY, ids, PARAMS)
+        partitions.append(DatabaseConnection(LocationStandIn(data)).execute_query(query, params=params))
+    # As partições terminam em qualquer ordem
+    random.Random(1).shuffle(partitions)
+    merged = ParallelExtractor._merge(partitions, names)
+    pd.testing.assert_frame_equal(merged, expected)
+
+
+@pytest.mark.parametrize('strategy', parallel.STRATEGIES)
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_extract_matches_sequential(data, pools, strategy, workers):
+    df = ParallelExtractor(workers=workers, strategy=strategy).extract(QUERY, PARAMS)
+    pd.testing.assert_frame_equal(df, sequential(data))
+    assert len(df) == len(data)
+    pool, = pools
+    assert pool.maxconn == workers
+    assert pool.closed
+    assert pool.in_use == 0
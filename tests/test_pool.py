@@ -0,0 +1,189 @@
+"""
+Testes da reconexão do pool (pool.py)
+A queda da conexão no meio da query usa o PostgreSQL do .env (encerrando
+o processo da conexão no servidor) e é pulada quando não há banco
+"""
+import gc
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import pytest
+from psycopg2.pool import PoolError
+import pool as pool_module
+from config import DB_CONFIG
+from database import DatabaseConnection
+from pool import ConnectionPool
+
+
+class FakeConnection:
+    """Conexão simulada com o necessário da interface do psycopg2 para o pool"""
+    
+    closed = 0
+    
+    def close(self):
+        self.closed = 1
+    
+    def rollback(self):
+        pass
+    
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeThreadedPool:
+    """ThreadedConnectionPool simulado: recusa conexões que não emprestou"""
+    
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.closed = False
+        self.idle = []
+        self.used = []
+    
+    def getconn(self):
+        connection = self.idle.pop() if self.idle else FakeConnection()
+        self.used.append(connection)
+        return connection
+    
+    def putconn(self, connection, close=False):
+        if connection not in self.used:
+            raise PoolError("trying to put unkeyed connection")
+        self.used.remove(connection)
+        if close:
+            connection.close()
+        else:
+            self.idle.append(connection)
+    
+    def closeall(self):
+        for connection in self.idle + self.used:
+            connection.close()
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    """Pool que entrega conexões simuladas e registra as devolvidas"""
+    
+    def __init__(self):
+        super().__init__(max_connections=1)
+        self.acquired = []
+        self.released = []
+    
+    def acquire(self):
+        connection = FakeConnection()
+        self.acquired.append(connection)
+        return connection
+    
+    def release(self, connection, discard: bool = False):
+        self.released.append(connection)
+
+
+def test_run_retries_once_when_connection_drops():
+    pool = FakePool()
+    
+    def work(connection):
+        if len(pool.acquired) == 1:
+            connection.closed = 2
+            return None
+        return 'dados'
+    
+    assert pool.run(work) == 'dados'
+    assert len(pool.acquired) == 2
+    assert pool.released == pool.acquired
+
+
+def test_run_does_not_retry_query_errors():
+    pool = FakePool()
+    # Erro na query com a conexão aberta (ex.: SQL inválido): não repete
+    assert pool.run(lambda connection: None) is None
+    assert len(pool.acquired) == 1
+
+
+def test_run_gives_up_after_second_drop():
+    pool = FakePool()
+    
+    def work(connection):
+        connection.closed = 2
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    
+    with pytest.raises(psycopg2.OperationalError):
+        pool.run(work)
+    assert len(pool.acquired) == 2
+    assert pool.released == pool.acquired
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(pool_module, 'ThreadedConnectionPool', FakeThreadedPool)
+    monkeypatch.setattr(pool_module, 'prepare_connection', lambda connection: None)
+    return ConnectionPool(max_connections=2)
+
+
+def test_release_after_close(fake_pool):
+    # Janela fechada com uma query em andamento: a devolução só fecha a conexão
+    connection = fake_pool.acquire()
+    fake_pool.close()
+    fake_pool.release(connection)
+    assert connection.closed
+
+
+def test_release_into_recreated_pool(fake_pool):
+    connection = fake_pool.acquire()
+    fake_pool.close()
+    other = fake_pool.acquire()
+    # A conexão do pool anterior não entra no novo
+    fake_pool.release(connection)
+    assert connection.closed
+    fake_pool.release(other)
+    assert not other.closed
+    assert fake_pool.acquire() is other
+
+
+def test_bookkeeping_follows_connection_lifetime(fake_pool):
+    connection = fake_pool.acquire()
+    fake_pool.release(connection, discard=True)
+    fake_pool.close()
+    del connection
+    gc.collect()
+    assert len(fake_pool._last_used) == 0
+
+
+@pytest.fixture
+def database_pool():
+    if not DB_CONFIG.get('database'):
+        pytest.skip("Banco não configurado (DB_NAME no .env)")
+    pool = ConnectionPool(max_connections=2)
+    try:
+        pool.release(pool.acquire())
+    except psycopg2.Error:
+        pytest.skip("Banco configurado não está acessível")
+    yield pool
+    pool.close()
+
+
+def test_connection_dropped_mid_query(database_pool):
+    attempts = []
+    
+    def work(connection):
+        attempts.append(connection.get_backend_pid())
+        if len(attempts) == 1:
+            # Outra sessão encerra esta conexão enquanto a query roda
+            killer = threading.Timer(0.3, terminate, (attempts[0],))
+            killer.start()
+        return DatabaseConnection(connection).execute_query(
+            "SELECT pg_sleep(1) IS NULL AS dormiu, 42 AS valor", engine='cursor'
+        )
+    
+    start = time.monotonic()
+    df = database_pool.run(work)
+    assert df is not None and df['valor'].tolist() == [42]
+    assert len(attempts) == 2 and attempts[0] != attempts[1]
+    assert time.monotonic() - start < 10
+
+
+def terminate(pid: int):
+    connection = psycopg2.connect(**DB_CONFIG)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        connection.commit()
+    finally:
+        connection.close()
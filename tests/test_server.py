@@ -0,0 +1,55 @@
+"""
+Testes do serviço da planilha do servidor HTTP (server.py)
+A extração é simulada; nenhum banco é consultado
+"""
+import time
+import pytest
+from server import Workbook, WorkbookService
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = WorkbookService(max_age=300, params={}, min_refresh=30)
+    extractions = []
+    
+    def extract():
+        extractions.append(time.monotonic())
+        service.current = Workbook(b'xlsx', 'a' * 64, 1)
+        return service.current
+    
+    monkeypatch.setattr(service, '_extract', extract)
+    service.extractions = extractions
+    return service
+
+
+def age(service, seconds):
+    service.current.checked_at = time.monotonic() - seconds
+
+
+def test_fresh_workbook_is_reused(service):
+    first = service.get()
+    assert service.get() is first
+    assert len(service.extractions) == 1
+    
+    age(service, 301)
+    service.get()
+    assert len(service.extractions) == 2
+
+
+def test_refresh_ignored_while_workbook_is_recent(service):
+    service.get()
+    for _ in range(5):
+        service.get(refresh=True)
+    assert len(service.extractions) == 1
+    
+    age(service, 31)
+    service.get(refresh=True)
+    assert len(service.extractions) == 2
+
+
+def test_min_refresh_never_extends_validity(service):
+    service.min_refresh = 600
+    service.get()
+    age(service, 301)
+    service.get(refresh=True)
+    assert len(service.extractions) == 2
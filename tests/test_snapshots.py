@@ -0,0 +1,47 @@
+"""
+Testes do relatório de alterações (snapshots.py)
+"""
+import pandas as pd
+import pytest
+from snapshots import ADDED, CHANGED, REMOVED, diff_snapshots
+
+
+def snapshot(rows):
+    return pd.DataFrame(rows, columns=['local_estoque', 'sku', 'material', 'custo', 'preco_de', 'qtde', 'preco_por'])
+
+
+def test_repeated_key_pairs_ignore_compared_values():
+    # Mesma chave duas vezes; só a QTDE da primeira muda, passando a da segunda
+    previous = snapshot([
+        ('Loja', 'SKU1', 'Tênis', 10.0, 50.0, 1.0, 30.0),
+        ('Loja', 'SKU1', 'Tênis', 12.0, 60.0, 2.0, 40.0),
+    ])
+    current = snapshot([
+        ('Loja', 'SKU1', 'Tênis', 12.0, 60.0, 2.0, 40.0),
+        ('Loja', 'SKU1', 'Tênis', 10.0, 50.0, 3.0, 30.0),
+    ])
+    report = diff_snapshots(previous, current)
+    assert report['situacao'].tolist() == [CHANGED]
+    assert report[['qtde_anterior', 'qtde_atual']].values.tolist() == [[1.0, 3.0]]
+
+
+def test_added_removed_and_old_snapshot_columns():
+    # Snapshot anterior sem CUSTO e PRECO_DE (gravado por versões antigas)
+    previous = snapshot([
+        ('Loja', 'SKU1', 'Tênis', 10.0, 50.0, 1.0, 30.0),
+        ('Loja', 'SKU2', 'Boné', 5.0, 20.0, 3.0, 15.0),
+    ]).drop(columns=['custo', 'preco_de'])
+    current = snapshot([
+        ('Loja', 'SKU1', 'Tênis', 10.0, 50.0, 1.0, 30.0),
+        ('Loja', 'SKU3', 'Meia', 2.0, 9.0, 7.0, 8.0),
+    ])
+    report = diff_snapshots(previous, current)
+    assert dict(zip(report['sku'], report['situacao'])) == {'SKU2': REMOVED, 'SKU3': ADDED}
+
+
+def test_missing_columns_are_listed():
+    # Query personalizada sem MATERIAL e PRECO_POR
+    current = snapshot([('Loja', 'SKU1', 'Tênis', 10.0, 50.0, 1.0, 30.0)])
+    previous = current.drop(columns=['material', 'preco_por'])
+    with pytest.raises(ValueError, match='MATERIAL, PRECO_POR'):
+        diff_snapshots(previous, current)
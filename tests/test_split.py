@@ -0,0 +1,68 @@
+"""
+Testes da exportação separada por local (split.py)
+As saídas só substituem as anteriores quando tudo foi gravado
+"""
+import os
+import pandas as pd
+import pytest
+from benchmark import synthetic_data
+from export_excel import ExcelExporter
+from schema import apply_schema
+from split import NO_LOCATION, LocationSplitter, partition
+
+
+@pytest.fixture(scope='module')
+def data():
+    return apply_schema(synthetic_data(600, seed=5))
+
+
+def index(output):
+    return pd.read_csv(LocationSplitter.index_path(output), sep=None, engine='python')
+
+
+@pytest.mark.parametrize('mode,extension', [('sheets', '.xlsx'), ('files', '.csv')])
+def test_export_writes_outputs_and_index(data, tmp_path, mode, extension):
+    output = str(tmp_path / f'Oferta{extension}')
+    splitter = LocationSplitter(mode, workers=1, export_format=extension[1:])
+    assert splitter.export(data, output) == len(data)
+    
+    entries = index(output)
+    assert entries['linhas'].sum() == len(data)
+    if mode == 'files':
+        assert sorted(os.listdir(tmp_path / 'Oferta')) == sorted(os.path.basename(name) for name in entries['arquivo'])
+        assert all(name.startswith('Oferta' + os.sep) for name in entries['arquivo'])
+    # Só as saídas finais ficam na pasta
+    assert not [name for name in os.listdir(tmp_path) if '.tmp' in name or name.endswith('.old')]
+
+
+@pytest.mark.parametrize('mode,extension', [('sheets', '.xlsx'), ('files', '.csv')])
+def test_failure_keeps_previous_outputs(data, tmp_path, monkeypatch, mode, extension):
+    output = str(tmp_path / f'Oferta{extension}')
+    splitter = LocationSplitter(mode, workers=1, export_format=extension[1:])
+    assert splitter.export(data, output) == len(data)
+    before = {
+        os.path.join(root, name): os.path.getmtime(os.path.join(root, name))
+        for root, _, names in os.walk(tmp_path) for name in names
+    }
+    
+    # Falha depois de gravar parte das saídas
+    def broken(*args, **kwargs):
+        raise OSError("disco cheio")
+    monkeypatch.setattr(pd.DataFrame, 'to_csv', broken)
+    monkeypatch.setattr(ExcelExporter, 'export_sheets', staticmethod(lambda sheets, path: open(path, 'w').close() or 1))
+    assert splitter.export(data, output) == -1
+    
+    after = {
+        os.path.join(root, name): os.path.getmtime(os.path.join(root, name))
+        for root, _, names in os.walk(tmp_path) for name in names
+    }
+    assert after == before
+
+
+def test_partition_keeps_database_order():
+    # Ordem do banco (collation pt_BR): o Python poria 'Bloco B' antes de 'Área Externa'
+    df = pd.DataFrame({
+        'local_estoque': pd.Categorical(['Área Externa', 'Área Externa', 'Bloco B', None]),
+        'sku': ['1', '2', '3', '4'],
+    })
+    assert [location for location, _ in partition(df)] == ['Área Externa', 'Bloco B', NO_LOCATION]